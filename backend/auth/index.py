@@ -1,29 +1,33 @@
 import json
-import os
-import psycopg2
 from datetime import datetime
 
+from db import commit, get_connection, release_connection
+from provisioning import InvalidProvisionInput, parse_items, provision, provision_allowed
+from responses import RowMapper, cors_preflight, error_response, json_response
+from timing import instrumented, log_exception
+
+USER_FIELDS = {
+    'full_name': 'fullName',
+    'birth_date': 'birthDate',
+    'registered_at': 'registeredAt',
+    'pg_notify': None
+}
+
+
+@instrumented('auth')
 def handler(event: dict, context) -> dict:
     """
     API для регистрации и авторизации пользователей.
-    Поддерживает регистрацию, вход и обновление профиля.
+    Поддерживает регистрацию, вход, обновление профиля и массовое
+    заведение сотрудников из CSV или JSON (action=provision).
     """
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return cors_preflight('GET, POST, PUT, OPTIONS', 'Content-Type, X-User-Id, X-Provision-Token')
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection()
         cur = conn.cursor()
         
         if method == 'POST':
@@ -37,56 +41,40 @@ def handler(event: dict, context) -> dict:
                 password = body.get('password')
                 
                 if not all([phone, full_name, password]):
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Заполните все обязательные поля'}),
-                        'isBase64Encoded': False
-                    }
-                
-                cur.execute("SELECT id FROM users WHERE phone = %s", (phone,))
-                if cur.fetchone():
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Пользователь с таким номером уже существует'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response('Заполните все обязательные поля')
                 
+                # Проверка занятости номера и вставка — один запрос: при гонке
+                # двух регистраций уникальный индекс пропустит только одну
                 cur.execute(
                     """INSERT INTO users (phone, full_name, position, password) 
-                       VALUES (%s, %s, %s, %s) RETURNING id, phone, full_name, position, registered_at""",
+                       VALUES (%s, %s, %s, %s)
+                       ON CONFLICT (phone) DO NOTHING
+                       RETURNING id, phone, full_name, position, registered_at""",
                     (phone, full_name, position, password)
                 )
                 result = cur.fetchone()
-                conn.commit()
+                commit(conn)
+                if not result:
+                    return error_response('Пользователь с таким номером уже существует')
                 
-                user = {
-                    'id': result[0],
-                    'phone': result[1],
-                    'fullName': result[2],
-                    'position': result[3],
-                    'registeredAt': result[4].isoformat()
-                }
+                return json_response({'user': RowMapper(cur.description, USER_FIELDS)(result)})
+            
+            elif action == 'provision':
+                if not provision_allowed(event):
+                    return error_response('Доступ запрещён', 403)
+                try:
+                    items = parse_items(body)
+                except InvalidProvisionInput as e:
+                    return error_response(str(e))
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'user': user}),
-                    'isBase64Encoded': False
-                }
+                return json_response(provision(conn, cur, items), event=event)
             
             elif action == 'login':
                 phone = body.get('phone')
                 password = body.get('password')
                 
                 if not all([phone, password]):
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Заполните все поля'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response('Заполните все поля')
                 
                 cur.execute(
                     """SELECT id, phone, full_name, position, email, birth_date, bio, registered_at 
@@ -96,42 +84,16 @@ def handler(event: dict, context) -> dict:
                 result = cur.fetchone()
                 
                 if not result:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Неверный номер телефона или пароль'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response('Неверный номер телефона или пароль', 401)
                 
-                user = {
-                    'id': result[0],
-                    'phone': result[1],
-                    'fullName': result[2],
-                    'position': result[3],
-                    'email': result[4],
-                    'birthDate': result[5].isoformat() if result[5] else None,
-                    'bio': result[6],
-                    'registeredAt': result[7].isoformat()
-                }
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'user': user}),
-                    'isBase64Encoded': False
-                }
+                return json_response({'user': RowMapper(cur.description, USER_FIELDS)(result)})
         
         elif method == 'PUT':
             body = json.loads(event.get('body', '{}'))
             user_id = body.get('userId')
             
             if not user_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'User ID обязателен'}),
-                    'isBase64Encoded': False
-                }
+                return error_response('User ID обязателен')
             
             updates = []
             params = []
@@ -157,45 +119,24 @@ def handler(event: dict, context) -> dict:
                 params.append(datetime.now())
                 params.append(user_id)
                 
-                query = f"UPDATE users SET {', '.join(updates)} WHERE id = %s RETURNING id, phone, full_name, position, email, birth_date, bio"
+                # NOTIFY сбрасывает кэш профилей авторов в функциях ленты и чата
+                query = f"""UPDATE users SET {', '.join(updates)} WHERE id = %s
+                            RETURNING id, phone, full_name, position, email, birth_date, bio,
+                                      pg_notify('profile_updated', json_build_object('id', id)::text)"""
                 cur.execute(query, params)
                 result = cur.fetchone()
-                conn.commit()
-                
-                user = {
-                    'id': result[0],
-                    'phone': result[1],
-                    'fullName': result[2],
-                    'position': result[3],
-                    'email': result[4],
-                    'birthDate': result[5].isoformat() if result[5] else None,
-                    'bio': result[6]
-                }
+                commit(conn)
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'user': user}),
-                    'isBase64Encoded': False
-                }
+                return json_response({'user': RowMapper(cur.description, USER_FIELDS)(result)})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return error_response('Метод не поддерживается', 405)
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        log_exception()
+        return error_response(str(e), 500)
     
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            release_connection(conn)
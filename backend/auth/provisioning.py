@@ -0,0 +1,125 @@
+"""
+Массовое заведение сотрудников (action=provision). Список из CSV или JSON
+проверяется в Python, валидные строки одним COPY попадают во временную
+таблицу, а оттуда одним INSERT ... SELECT ... ON CONFLICT (phone) DO NOTHING
+в users. Для каждой строки возвращается статус: created (с id), duplicate
+(номер уже есть в базе или выше в этом же списке) или invalid (с причиной).
+"""
+import csv
+import io
+import os
+
+from db import commit
+
+PROVISION_MAX_ROWS = int(os.environ.get('PROVISION_MAX_ROWS', '100000'))
+DEFAULT_POSITION = 'Наставник'
+# Пределы колонок users из V0001
+PHONE_MAX_LENGTH = 20
+TEXT_MAX_LENGTH = 255
+# Заголовки CSV: как в JSON (fullName) или как в таблице (full_name)
+CSV_COLUMNS = {
+    'phone': 'phone',
+    'fullName': 'fullName',
+    'full_name': 'fullName',
+    'position': 'position',
+    'password': 'password'
+}
+
+
+class InvalidProvisionInput(ValueError):
+    pass
+
+
+def provision_allowed(event: dict) -> bool:
+    token = os.environ.get('PROVISION_TOKEN')
+    if not token:
+        return False
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return headers.get('x-provision-token') == token
+
+
+def parse_items(body: dict) -> list:
+    """Строки списка из body['items'] (JSON) или body['csv'] (CSV с заголовком)."""
+    if 'csv' in body:
+        if not isinstance(body['csv'], str):
+            raise InvalidProvisionInput('csv должен быть строкой')
+        reader = csv.DictReader(io.StringIO(body['csv']))
+        items = [
+            {CSV_COLUMNS[key.strip()]: value for key, value in row.items() if key and key.strip() in CSV_COLUMNS}
+            for row in reader
+        ]
+    else:
+        items = body.get('items')
+        if not isinstance(items, list):
+            raise InvalidProvisionInput('Передайте items (список) или csv (строка)')
+
+    if not items or len(items) > PROVISION_MAX_ROWS:
+        raise InvalidProvisionInput(f'Передайте от 1 до {PROVISION_MAX_ROWS} сотрудников')
+    return items
+
+
+def _validate(item) -> tuple:
+    """(phone, full_name, position, password) или текст ошибки."""
+    if not isinstance(item, dict):
+        return 'Строка должна быть объектом'
+    phone = str(item.get('phone') or '').strip()
+    full_name = str(item.get('fullName') or '').strip()
+    position = str(item.get('position') or '').strip() or DEFAULT_POSITION
+    password = str(item.get('password') or '')
+    if not phone or not full_name or not password:
+        return 'Заполните все обязательные поля'
+    if len(phone) > PHONE_MAX_LENGTH:
+        return 'Слишком длинный номер телефона'
+    if max(len(full_name), len(position), len(password)) > TEXT_MAX_LENGTH:
+        return 'Слишком длинное значение'
+    return phone, full_name, position, password
+
+
+def provision(conn, cur, items: list) -> dict:
+    results = [None] * len(items)
+    staged = io.StringIO()
+    writer = csv.writer(staged)
+    seen = set()
+    for index, item in enumerate(items):
+        row = _validate(item)
+        if isinstance(row, str):
+            results[index] = {'index': index, 'status': 'invalid', 'error': row}
+        elif row[0] in seen:
+            results[index] = {'index': index, 'status': 'duplicate'}
+        else:
+            seen.add(row[0])
+            writer.writerow((index, *row))
+
+    if seen:
+        staged.seek(0)
+        cur.execute(
+            """CREATE TEMP TABLE provision_staging (
+                   idx INTEGER NOT NULL, phone TEXT NOT NULL, full_name TEXT NOT NULL,
+                   position TEXT NOT NULL, password TEXT NOT NULL
+               ) ON COMMIT DROP"""
+        )
+        cur.copy_expert('COPY provision_staging FROM STDIN WITH (FORMAT csv)', staged)
+        # Строки, не вставленные из-за конфликта, в RETURNING не попадают
+        cur.execute(
+            """WITH ins AS (
+                   INSERT INTO users (phone, full_name, position, password)
+                   SELECT phone, full_name, position, password FROM provision_staging ORDER BY idx
+                   ON CONFLICT (phone) DO NOTHING
+                   RETURNING id, phone
+               )
+               SELECT s.idx, ins.id
+               FROM provision_staging s
+               LEFT JOIN ins ON ins.phone = s.phone"""
+        )
+        for index, user_id in cur.fetchall():
+            if user_id is None:
+                results[index] = {'index': index, 'status': 'duplicate'}
+            else:
+                results[index] = {'index': index, 'status': 'created', 'id': user_id}
+        # Как у регистрации: при репликах ответ несёт X-Session-LSN
+        commit(conn)
+
+    counts = {'created': 0, 'duplicate': 0, 'invalid': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return {'results': results, **counts}
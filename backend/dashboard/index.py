@@ -0,0 +1,134 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from db import get_connection, release_connection, session_lsn
+from pagination import DEFAULT_PAGE_SIZE
+from profiles import profile_cache
+from responses import RowMapper, cors_preflight, error_response, json_response
+from sections import UNREAD_BROADCAST_SQL, UNREAD_CAP, UNREAD_DIRECT_SQL, UNREAD_NOTIFICATIONS_SQL
+from sections import feed_page, fetch_feed, fetch_groups, fetch_messages, messages_page, with_message_authors, with_post_authors
+from timing import in_request, instrumented, log_exception
+
+# Разделы считаются параллельно, каждый на своём соединении из пула;
+# четыре задачи укладываются в DB_POOL_MAX_SIZE по умолчанию
+DASHBOARD_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', '4'))
+USER_FIELDS = {
+    'full_name': 'fullName',
+    'birth_date': 'birthDate',
+    'registered_at': 'registeredAt',
+    'unread_notifications': None,
+    'unread_messages': None
+}
+
+# Пул живёт между тёплыми вызовами, как и пул соединений
+_executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix='dashboard')
+
+
+def _profile(cur, user_id) -> dict:
+    """Профиль и счётчики непрочитанного одним запросом (с потолком UNREAD_CAP)."""
+    cur.execute(
+        f"""SELECT u.id, u.phone, u.full_name, u.position, u.email, u.birth_date, u.bio, u.registered_at,
+                   {UNREAD_NOTIFICATIONS_SQL} AS unread_notifications,
+                   {UNREAD_DIRECT_SQL} + {UNREAD_BROADCAST_SQL} AS unread_messages
+            FROM users u
+            WHERE u.id = %s""",
+        (user_id, UNREAD_CAP, user_id, user_id, UNREAD_CAP, user_id)
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {
+        'user': RowMapper(cur.description, USER_FIELDS)(row),
+        'unread': {'notifications': row[8], 'messages': row[9]}
+    }
+
+
+def _feed(cur) -> dict:
+    """Первая страница ленты, как GET backend/posts."""
+    posts, has_more = fetch_feed(cur, DEFAULT_PAGE_SIZE)
+    return feed_page(with_post_authors(cur, posts, profile_cache), has_more)
+
+
+def _messages(cur, user_id) -> dict:
+    """Первая страница ленты сообщений, как GET backend/messages?userId."""
+    return messages_page(with_message_authors(cur, fetch_messages(cur, user_id), profile_cache))
+
+
+def _groups(cur, user_id) -> list:
+    """Группы пользователя, как GET backend/groups?userId."""
+    return fetch_groups(cur, user_id)
+
+
+def _on_connection(min_lsn, section, *args):
+    # Только чтение: при настроенных репликах разделы читаются с них
+    conn = get_connection(readonly=True, min_lsn=min_lsn)
+    try:
+        cur = conn.cursor()
+        try:
+            return section(cur, *args)
+        finally:
+            cur.close()
+    finally:
+        release_connection(conn)
+
+
+def _bootstrap(user_id, min_lsn: str = None) -> dict:
+    """
+    Все разделы первого экрана за один вызов. Запросы независимы, поэтому
+    идут параллельно на разных соединениях: время ответа — самый долгий
+    раздел, а не их сумма.
+    """
+    futures = {
+        name: _executor.submit(in_request(_on_connection, min_lsn, section, *args))
+        for name, section, args in (
+            ('profile', _profile, (user_id,)),
+            ('feed', _feed, ()),
+            ('messages', _messages, (user_id,)),
+            ('groups', _groups, (user_id,))
+        )
+    }
+    results = {name: future.result() for name, future in futures.items()}
+    if results['profile'] is None:
+        return None
+    return {
+        **results['profile'],
+        'feed': results['feed'],
+        'messages': results['messages'],
+        'groups': results['groups']
+    }
+
+
+@instrumented('dashboard')
+def handler(event: dict, context) -> dict:
+    """
+    Данные первого экрана одним запросом.
+    Возвращает профиль пользователя, счётчики непрочитанного, первую страницу
+    ленты, последние сообщения и группы пользователя в тех же форматах,
+    что и отдельные функции posts, messages и groups.
+    """
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return cors_preflight('GET, OPTIONS', 'Content-Type, X-User-Id, X-Session-LSN')
+    
+    if method != 'GET':
+        return error_response('Метод не поддерживается', 405)
+    
+    try:
+        params = event.get('queryStringParameters') or {}
+        user_id = params.get('userId')
+        if not user_id:
+            return error_response('User ID обязателен')
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            return error_response('Некорректный User ID')
+        
+        payload = _bootstrap(user_id, session_lsn(event))
+        if payload is None:
+            return error_response('Пользователь не найден', 404)
+        return json_response(payload, event=event)
+    
+    except Exception as e:
+        log_exception()
+        return error_response(str(e), 500)
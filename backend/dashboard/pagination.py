@@ -0,0 +1,42 @@
+"""
+Keyset-пагинация: непрозрачные курсоры из значений ключа сортировки
+(обычно created_at и id последней строки страницы).
+"""
+import base64
+import json
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values) -> str:
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    data = json.dumps(raw, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(token: str, types: tuple) -> tuple:
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        raw = json.loads(data)
+        if not isinstance(raw, list) or len(raw) != len(types):
+            raise InvalidCursor(token)
+        return tuple(
+            datetime.fromisoformat(v) if t is datetime else t(v)
+            for v, t in zip(raw, types)
+        )
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(token) from e
+
+
+def page_size(params: dict, default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    try:
+        size = int(params.get('limit') or default)
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
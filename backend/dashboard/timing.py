@@ -0,0 +1,238 @@
+"""
+Замеры времени запроса по фазам (connect, query, fetch, serialize, wait),
+число строк и размер ответа, заголовок Server-Timing, структурный журнал
+медленных запросов и ошибок и накопительные счётчики экземпляра функции
+(stats()), которые читают бенчмарки и операторы. Фазы query и fetch
+пишет курсор из db.py, serialize — json_response.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '1000'))
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+
+logger = logging.getLogger('timing')
+
+_current = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    def __init__(self, function: str):
+        self.function = function
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+        self.headers = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, ms: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + ms
+
+    def merge(self, other: 'RequestTimer'):
+        # Фазы параллельных задач суммируются и могут превышать общее время
+        with self._lock:
+            for name, ms in other.phases.items():
+                self.add(name, ms)
+            self.queries += other.queries
+            self.rows += other.rows
+            self.bytes += other.bytes
+            self.headers.update(other.headers)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, total: float) -> str:
+        parts = [f'{name};dur={ms:.1f}' for name, ms in self.phases.items()]
+        parts.append(f'total;dur={total:.1f}')
+        return ', '.join(parts)
+
+    def record(self, total: float) -> dict:
+        return {
+            'function': self.function,
+            'ms': round(total, 2),
+            'phases': {name: round(ms, 2) for name, ms in self.phases.items()},
+            'queries': self.queries,
+            'rows': self.rows,
+            'bytes': self.bytes
+        }
+
+
+def current() -> RequestTimer:
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str):
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - started) * 1000)
+
+
+def in_request(fn, *args, **kwargs):
+    """
+    Задача для пула потоков от имени текущего запроса: у неё свой RequestTimer,
+    в который без гонок пишут курсоры, по завершении он добавляется к замеру
+    запроса.
+    """
+    parent = _current.get()
+
+    def run():
+        if parent is None:
+            return fn(*args, **kwargs)
+        child = RequestTimer(parent.function)
+        token = _current.set(child)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+            parent.merge(child)
+    return run
+
+
+@contextmanager
+def background(function: str):
+    """
+    Замер работы фонового потока вне запроса: свой RequestTimer, который
+    не логируется; собранные заголовки (X-Session-LSN после commit) поток
+    передаёт запросам, чью работу он выполнил.
+    """
+    timer = RequestTimer(function)
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+
+
+def set_header(name: str, value: str):
+    """Заголовок, который instrumented добавит к ответу текущего запроса."""
+    timer = _current.get()
+    if timer is not None:
+        timer.headers[name] = value
+
+
+def add_bytes(count: int):
+    timer = _current.get()
+    if timer is not None:
+        timer.bytes += count
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def _item(self, function: str) -> dict:
+        item = self._data.get(function)
+        if item is None:
+            item = self._data[function] = {
+                'requests': 0, 'errors': 0, 'ms': 0.0, 'maxMs': 0.0,
+                'queries': 0, 'rows': 0, 'bytes': 0, 'slowQueries': 0, 'phases': {}
+            }
+        return item
+
+    def add(self, timer: RequestTimer, total: float, status: int):
+        with self._lock:
+            item = self._item(timer.function)
+            item['requests'] += 1
+            if status >= 500:
+                item['errors'] += 1
+            item['ms'] += total
+            item['maxMs'] = max(item['maxMs'], total)
+            item['queries'] += timer.queries
+            item['rows'] += timer.rows
+            item['bytes'] += timer.bytes
+            for name, ms in timer.phases.items():
+                item['phases'][name] = item['phases'].get(name, 0.0) + ms
+
+    def slow_query(self, function: str):
+        with self._lock:
+            self._item(function)['slowQueries'] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self._data))
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+_counters = _Counters()
+
+
+def stats() -> dict:
+    return _counters.snapshot()
+
+
+def reset_stats():
+    _counters.reset()
+
+
+def count_slow_query(function: str):
+    _counters.slow_query(function)
+
+
+def log(level: int, record: dict):
+    logger.log(level, json.dumps(record, ensure_ascii=False, default=str))
+
+
+def log_exception():
+    """Пишет в журнал исключение, которое обработчик превращает в ответ 500."""
+    timer = _current.get()
+    record = {'event': 'error', 'error': traceback.format_exc(limit=8)}
+    if timer is not None:
+        record.update(timer.record(timer.total_ms()))
+    log(logging.ERROR, record)
+
+
+def instrumented(function: str):
+    """Оборачивает handler: замер всего запроса, Server-Timing и счётчики."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            timer = RequestTimer(function)
+            token = _current.set(timer)
+            try:
+                response = handler(event, context)
+            finally:
+                _current.reset(token)
+            total = timer.total_ms()
+            status = response.get('statusCode', 200)
+            _counters.add(timer, total, status)
+            if timer.headers:
+                response['headers'] = {**response.get('headers', {}), **timer.headers}
+            if SERVER_TIMING:
+                response['headers'] = {
+                    **response.get('headers', {}),
+                    'Server-Timing': timer.server_timing(total),
+                    'Timing-Allow-Origin': '*'
+                }
+            # Ожидание long-poll медленным запросом не считается
+            if total - timer.phases.get('wait', 0.0) >= SLOW_REQUEST_MS:
+                record = timer.record(total)
+                record.update({
+                    'event': 'slow_request',
+                    'method': event.get('httpMethod'),
+                    'params': event.get('queryStringParameters') or {},
+                    'status': status
+                })
+                log(logging.WARNING, record)
+            return response
+        return wrapper
+    return decorator
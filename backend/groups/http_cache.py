@@ -0,0 +1,46 @@
+"""
+Условные GET для списков: ETag строится из упорядоченных ключей строк
+страницы (и данных из кэшей, попадающих в тело), при совпадении
+If-None-Match отдаётся 304 без выборки и сериализации самой страницы.
+Сжатие тела зависит от Accept-Encoding, поэтому и 304, и полные ответы
+несут Vary: Accept-Encoding.
+"""
+import hashlib
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def request_header(event: dict, name: str):
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def etag_matches(event: dict, etag: str) -> bool:
+    header = request_header(event, 'If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # Слабое сравнение: W/ не учитывается
+    wanted = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == wanted for tag in header.split(','))
+
+
+def not_modified(etag: str) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
@@ -1,82 +1,173 @@
 import json
-import os
-import psycopg2
+from datetime import datetime
 
+from db import commit, get_connection, release_connection, session_lsn
+from http_cache import etag_matches, make_etag, not_modified
+from pagination import InvalidCursor, decode_cursor, encode_cursor, page_size
+from profiles import profile_cache
+from responses import RowMapper, cors_preflight, error_response, json_response
+from sections import fetch_groups, groups_sql
+from timing import instrumented, log_exception
+
+GROUP_POST_FIELDS = {
+    'group_id': 'groupId',
+    'user_id': 'userId',
+    'full_name': 'userName',
+    'position': 'userPosition',
+    'created_at': 'timestamp'
+}
+
+
+def _is_member(cur, group_id, user_id) -> bool:
+    # Точечный поиск по уникальному индексу group_members(group_id, user_id)
+    cur.execute("SELECT 1 FROM group_members WHERE group_id = %s AND user_id = %s", (group_id, user_id))
+    return cur.fetchone() is not None
+
+
+def _fetch_group_feed(cur, group_id, limit: int, before: str = None):
+    """
+    Страница ленты группы — диапазон индекса group_posts(group_id, created_at, id),
+    поэтому её стоимость не зависит от длины истории группы.
+    """
+    keyset = ''
+    keyset_params = ()
+    if before:
+        created_at, post_id = decode_cursor(before, (datetime, int))
+        keyset = 'AND (created_at, id) < (%s, %s)'
+        keyset_params = (created_at, post_id)
+    
+    cur.execute(
+        f"""SELECT id, group_id, user_id, content, created_at
+            FROM group_posts
+            WHERE group_id = %s {keyset}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s""",
+        (group_id, *keyset_params, limit + 1)
+    )
+    rows = cur.fetchall()
+    posts = RowMapper(cur.description, GROUP_POST_FIELDS).many(rows[:limit])
+    profiles = profile_cache.get_many(cur, [post['userId'] for post in posts])
+    for post in posts:
+        post['userName'], post['userPosition'] = profiles.get(post['userId'], (None, None))
+    
+    next_cursor = encode_cursor(posts[-1]['timestamp'], posts[-1]['id']) if len(rows) > limit else None
+    return {'posts': posts, 'nextCursor': next_cursor, 'hasMore': len(rows) > limit}
+
+
+def _create_group_post(cur, group_id, user_id, content: str):
+    """
+    Публикация в группу одним запросом: INSERT ... SELECT из group_members
+    вставляет строку только для участника, автор берётся в том же запросе.
+    """
+    cur.execute(
+        """WITH ins AS (
+               INSERT INTO group_posts (group_id, user_id, content)
+               SELECT gm.group_id, gm.user_id, %s
+               FROM group_members gm
+               WHERE gm.group_id = %s AND gm.user_id = %s
+               RETURNING id, group_id, user_id, content, created_at
+           )
+           SELECT ins.id, ins.group_id, ins.user_id, u.full_name, u.position, ins.content, ins.created_at
+           FROM ins
+           JOIN users u ON u.id = ins.user_id""",
+        (content, group_id, user_id)
+    )
+    result = cur.fetchone()
+    if result is None:
+        return None
+    return RowMapper(cur.description, GROUP_POST_FIELDS)(result)
+
+
+def _join_group(cur, group_id, user_id):
+    """True — пользователь добавлен, False — уже участник, None — группы нет."""
+    cur.execute(
+        """INSERT INTO group_members (group_id, user_id)
+           SELECT g.id, %s FROM groups g WHERE g.id = %s
+           ON CONFLICT (group_id, user_id) DO NOTHING
+           RETURNING id""",
+        (user_id, group_id)
+    )
+    if cur.fetchone():
+        return True
+    cur.execute("SELECT 1 FROM groups WHERE id = %s", (group_id,))
+    return False if cur.fetchone() else None
+
+
+@instrumented('groups')
 def handler(event: dict, context) -> dict:
     """
     API для работы с группами.
-    Поддерживает создание групп и получение списка групп.
+    Поддерживает создание групп, получение списка групп, вступление
+    (action=join), публикацию в группу (action=post) и ленту группы
+    (groupId) с постраничным курсором.
     """
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return cors_preflight('GET, POST, OPTIONS', 'Content-Type, X-User-Id, If-None-Match, X-Session-LSN')
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection(readonly=method == 'GET', min_lsn=session_lsn(event))
         cur = conn.cursor()
         
         if method == 'GET':
-            user_id = event.get('queryStringParameters', {}).get('userId')
+            params = event.get('queryStringParameters') or {}
+            user_id = params.get('userId')
+            group_id = params.get('groupId')
             
-            if user_id:
-                cur.execute("""
-                    SELECT g.id, g.name, g.description, g.created_by, 
-                           (SELECT COUNT(*) FROM group_members WHERE group_id = g.id) as member_count
-                    FROM groups g
-                    LEFT JOIN group_members gm ON g.id = gm.group_id
-                    WHERE gm.user_id = %s OR g.created_by = %s
-                    GROUP BY g.id
-                    ORDER BY g.created_at DESC
-                """, (user_id, user_id))
-            else:
-                cur.execute("""
-                    SELECT g.id, g.name, g.description, g.created_by,
-                           (SELECT COUNT(*) FROM group_members WHERE group_id = g.id) as member_count
-                    FROM groups g
-                    ORDER BY g.created_at DESC
-                    LIMIT 50
-                """)
+            if group_id:
+                if not user_id:
+                    return error_response('User ID обязателен')
+                if not _is_member(cur, group_id, user_id):
+                    return error_response('Лента доступна только участникам группы', 403)
+                try:
+                    page = _fetch_group_feed(cur, group_id, page_size(params), params.get('before'))
+                except InvalidCursor:
+                    return error_response('Некорректный курсор')
+                return json_response(page, event=event)
             
-            groups = []
-            for row in cur.fetchall():
-                groups.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2] or '',
-                    'createdBy': row[3],
-                    'memberCount': row[4]
-                })
+            # Группы не редактируются, меняются только состав и число участников,
+            # поэтому ETag строится по упорядоченным парам (id, member_count)
+            query, query_params = groups_sql('g.id, g.member_count', user_id)
+            cur.execute(query, query_params)
+            etag = make_etag('groups', user_id, cur.fetchall())
+            if etag_matches(event, etag):
+                return not_modified(etag)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'groups': groups}),
-                'isBase64Encoded': False
-            }
+            return json_response({'groups': fetch_groups(cur, user_id)}, event=event, headers={'ETag': etag})
         
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
+            action = body.get('action')
+            
+            if action in ('join', 'post'):
+                group_id = body.get('groupId')
+                user_id = body.get('userId')
+                if not all([group_id, user_id]):
+                    return error_response('Группа и User ID обязательны')
+                
+                if action == 'join':
+                    joined = _join_group(cur, group_id, user_id)
+                    commit(conn)
+                    if joined is None:
+                        return error_response('Группа не найдена', 404)
+                    return json_response({'success': True, 'joined': joined})
+                
+                content = body.get('content')
+                if not content:
+                    return error_response('Содержимое обязательно')
+                post = _create_group_post(cur, group_id, user_id, content)
+                commit(conn)
+                if post is None:
+                    return error_response('Публиковать могут только участники группы', 403)
+                return json_response({'post': post})
+            
             name = body.get('name')
             description = body.get('description', '')
             user_id = body.get('userId')
             
             if not all([name, user_id]):
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Название и User ID обязательны'}),
-                    'isBase64Encoded': False
-                }
+                return error_response('Название и User ID обязательны')
             
             cur.execute(
                 """INSERT INTO groups (name, description, created_by) 
@@ -91,7 +182,7 @@ def handler(event: dict, context) -> dict:
                 "INSERT INTO group_members (group_id, user_id) VALUES (%s, %s)",
                 (group_id, user_id)
             )
-            conn.commit()
+            commit(conn)
             
             group = {
                 'id': group_id,
@@ -101,30 +192,16 @@ def handler(event: dict, context) -> dict:
                 'memberCount': 1
             }
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'group': group}),
-                'isBase64Encoded': False
-            }
+            return json_response({'group': group})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return error_response('Метод не поддерживается', 405)
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        log_exception()
+        return error_response(str(e), 500)
     
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            release_connection(conn)
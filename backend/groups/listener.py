@@ -0,0 +1,148 @@
+"""
+Один LISTEN-слушатель на экземпляр функции.
+Держит отдельное соединение в autocommit, принимает NOTIFY и будит всех
+ожидающих клиентов long-poll, так что сколько бы клиентов ни ждало,
+к базе подключено одно простаивающее соединение.
+"""
+import collections
+import json
+import os
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+
+POLL_MAX_WAIT = float(os.environ.get('POLL_MAX_WAIT', '20'))
+RECENT_PAYLOADS = 256
+RECONNECT_DELAY = 1.0
+
+
+class Listener:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._cond = threading.Condition()
+        self._versions = collections.defaultdict(int)
+        self._recent = collections.defaultdict(lambda: collections.deque(maxlen=RECENT_PAYLOADS))
+        self._callbacks = collections.defaultdict(list)
+        self._wanted = set()
+        self._listening = set()
+        self._thread = None
+        self._wake_r, self._wake_w = os.pipe()
+
+    def subscribe(self, channel: str, callback=None, timeout: float = 5.0) -> bool:
+        """Подписывается на канал и ждёт, пока LISTEN станет активным."""
+        with self._cond:
+            if callback is not None and callback not in self._callbacks[channel]:
+                self._callbacks[channel].append(callback)
+            if channel not in self._wanted:
+                self._wanted.add(channel)
+                os.write(self._wake_w, b'x')
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='pg-listener', daemon=True)
+                self._thread.start()
+            return self._cond.wait_for(lambda: channel in self._listening, timeout)
+
+    def version(self, channel: str) -> int:
+        with self._cond:
+            return self._versions[channel]
+
+    def wait(self, channel: str, since: int, timeout: float):
+        """
+        Ждёт уведомлений на канале после версии since.
+        Возвращает (новая версия, список payload) либо (версия, None), если
+        часть уведомлений потеряна и нужно перечитать данные из базы.
+        """
+        deadline = time.monotonic() + min(timeout, POLL_MAX_WAIT)
+        with self._cond:
+            while self._versions[channel] == since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return since, []
+                self._cond.wait(remaining)
+            version = self._versions[channel]
+            recent = [item for item in self._recent[channel] if item[0] > since]
+            if len(recent) < version - since:
+                return version, None
+            return version, [payload for _, payload in recent]
+
+    def _publish(self, channel: str, payload):
+        with self._cond:
+            self._versions[channel] += 1
+            self._recent[channel].append((self._versions[channel], payload))
+            callbacks = list(self._callbacks[channel])
+            self._cond.notify_all()
+        for callback in callbacks:
+            callback(payload)
+
+    def _reset(self):
+        # После разрыва соединения часть уведомлений могла пропасть:
+        # сдвигаем версии без payload, чтобы ожидающие перечитали базу.
+        with self._cond:
+            callbacks = []
+            for channel in self._listening:
+                self._versions[channel] += 1
+                self._recent[channel].clear()
+                callbacks.extend(self._callbacks[channel])
+            self._listening.clear()
+            self._cond.notify_all()
+        for callback in callbacks:
+            callback(None)
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                while True:
+                    with self._cond:
+                        pending = self._wanted - self._listening
+                    for channel in pending:
+                        cur.execute(sql.SQL('LISTEN {}').format(sql.Identifier(channel)))
+                    if pending:
+                        with self._cond:
+                            self._listening |= pending
+                            self._cond.notify_all()
+                    ready, _, _ = select.select([conn, self._wake_r], [], [], 30)
+                    if self._wake_r in ready:
+                        os.read(self._wake_r, 64)
+                    if not ready:
+                        cur.execute('SELECT 1')
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            payload = json.loads(notify.payload) if notify.payload else None
+                        except ValueError:
+                            payload = notify.payload
+                        self._publish(notify.channel, payload)
+            except (psycopg2.Error, OSError):
+                self._reset()
+                if conn is not None and not conn.closed:
+                    conn.close()
+                time.sleep(RECONNECT_DELAY)
+
+
+def wait_seconds(params: dict) -> float:
+    try:
+        wait = float(params.get('wait') or POLL_MAX_WAIT)
+    except (TypeError, ValueError):
+        wait = POLL_MAX_WAIT
+    return min(max(wait, 0.0), POLL_MAX_WAIT)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener() -> Listener:
+    global _listener
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = Listener(os.environ['DATABASE_URL'])
+    return _listener
@@ -0,0 +1,459 @@
+"""
+Общий пул соединений с PostgreSQL.
+Живёт на уровне модуля и переживает тёплые вызовы функции: соединение
+открывается один раз и переиспользуется следующими запросами.
+Файл одинаковый во всех функциях backend/ — каждая функция деплоится
+своей папкой, поэтому модуль лежит рядом с каждым index.py.
+Соединения создаются с InstrumentedCursor: время execute и fetch* идёт
+в фазы query и fetch текущего запроса (timing.py), запросы дольше
+SLOW_QUERY_MS попадают в журнал, с SLOW_QUERY_EXPLAIN=1 — вместе с планом.
+
+С DATABASE_REPLICA_URLS (DSN через запятую) get_connection(readonly=True)
+отдаёт соединение с реплики. commit() после записи кладёт в ответ
+X-Session-LSN — позицию WAL на primary; чтение с этим токеном идёт только
+на реплику, которая уже воспроизвела эту позицию, иначе на primary.
+Решения маршрутизации и отставание реплик — в routing_stats().
+"""
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from timing import count_slow_query, current, log, phase, set_header
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+POOL_CHECK_AFTER_IDLE = float(os.environ.get('DB_POOL_CHECK_AFTER_IDLE', '30'))
+POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '') == '1'
+QUERY_LOG_CHARS = 500
+REPLICA_DSNS = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+REPLICA_LSN_TTL = float(os.environ.get('REPLICA_LSN_TTL', '1'))
+REPLICA_RETRY_AFTER = float(os.environ.get('REPLICA_RETRY_AFTER', '30'))
+SESSION_LSN_HEADER = 'X-Session-LSN'
+
+
+def _explain(conn, query, params) -> str:
+    # EXPLAIN без ANALYZE запрос не выполняет, поэтому безопасен и для INSERT;
+    # точка сохранения не даёт ошибке EXPLAIN испортить транзакцию обработчика
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        return None
+    if isinstance(query, str):
+        query = query.encode()
+    cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    savepoint = not conn.autocommit
+    try:
+        if savepoint:
+            cur.execute('SAVEPOINT slow_query_explain')
+        try:
+            cur.execute(b'EXPLAIN ' + query, params)
+            plan = '\n'.join(row[0] for row in cur.fetchall())
+        except psycopg2.Error as e:
+            if savepoint:
+                cur.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            return f'EXPLAIN не удался: {e}'
+        if savepoint:
+            cur.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    finally:
+        cur.close()
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Курсор, который относит время execute к фазе query, а fetch* — к fetch."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            timer = current()
+            if timer is not None:
+                timer.add('query', ms)
+                timer.queries += 1
+            if ms >= SLOW_QUERY_MS:
+                self._log_slow(query, vars, ms, timer)
+
+    def _log_slow(self, query, vars, ms: float, timer):
+        function = timer.function if timer is not None else None
+        count_slow_query(function)
+        text = query.decode() if isinstance(query, bytes) else query
+        record = {
+            'event': 'slow_query',
+            'function': function,
+            'ms': round(ms, 2),
+            'rowcount': self.rowcount,
+            'query': ' '.join(text.split())[:QUERY_LOG_CHARS]
+        }
+        if SLOW_QUERY_EXPLAIN and not self.connection.closed:
+            record['plan'] = _explain(self.connection, query, vars)
+        log(logging.WARNING, record)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        timer = current()
+        if timer is not None:
+            timer.add('fetch', (time.perf_counter() - started) * 1000)
+            if isinstance(result, list):
+                timer.rows += len(result)
+            elif result is not None:
+                timer.rows += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_size: int):
+        self.dsn = dsn
+        self.max_size = max_size
+        self._idle = []
+        self._in_use = {}
+        self._created_at = {}
+        self._cond = threading.Condition()
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=InstrumentedCursor)
+        with self._cond:
+            self._stats['created'] += 1
+            self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if now - self._created_at.get(id(conn), now) > POOL_MAX_LIFETIME:
+            return False
+        status = conn.get_transaction_status()
+        if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if now - idle_since < POOL_CHECK_AFTER_IDLE:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        # Вызывается без блокировки: close() — сетевой вызов
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _reserve(self, deadline: float):
+        """
+        Под блокировкой берёт простаивающее соединение (idle_since, conn) или
+        резервирует слот под новое (None, заглушка); слот в _in_use занят
+        в обоих случаях, поэтому проверка и подключение идут без блокировки.
+        """
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    self._in_use[id(conn)] = conn
+                    return idle_since, conn
+                if len(self._in_use) < self.max_size:
+                    placeholder = object()
+                    self._in_use[id(placeholder)] = placeholder
+                    return None, placeholder
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhausted('Нет свободных соединений с базой данных')
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+
+    def _release_slot(self, item):
+        with self._cond:
+            self._in_use.pop(id(item), None)
+            self._cond.notify()
+
+    def getconn(self, timeout: float = POOL_ACQUIRE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            idle_since, item = self._reserve(deadline)
+            if idle_since is None:
+                break
+            # SELECT 1 вне блокировки: медленное соединение не держит
+            # остальные потоки на получении и возврате
+            if self._is_healthy(item, idle_since):
+                with self._cond:
+                    self._stats['reused'] += 1
+                return item
+            self._release_slot(item)
+            self._discard(item)
+
+        try:
+            conn = self._connect()
+        except Exception:
+            self._release_slot(item)
+            raise
+        with self._cond:
+            self._in_use.pop(id(item), None)
+            self._in_use[id(conn)] = conn
+        return conn
+
+    def putconn(self, conn):
+        broken = conn.closed
+        if not broken:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        with self._cond:
+            self._in_use.pop(id(conn), None)
+            if not broken:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if broken:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'maxSize': self.max_size,
+                'idle': len(self._idle),
+                'inUse': len(self._in_use),
+                **self._stats
+            }
+
+    def close(self):
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+
+def parse_lsn(text: str) -> int:
+    """'16/B374D848' -> число; ValueError для некорректной строки."""
+    high, low = text.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def format_lsn(value: int) -> str:
+    return f'{value >> 32:X}/{value & 0xFFFFFFFF:X}'
+
+
+class Replica:
+    def __init__(self, index: int, dsn: str):
+        self.index = index
+        self.pool = ConnectionPool(dsn, POOL_MAX_SIZE)
+        self.replay_lsn = None
+        self.lag_seconds = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+
+    def refresh(self, conn):
+        # Позиция воспроизведения только растёт, поэтому закэшированное значение
+        # не больше настоящего и годится для проверки токена до REPLICA_LSN_TTL
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """SELECT pg_last_wal_replay_lsn()::text,
+                          EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"""
+            )
+            lsn, lag = cur.fetchone()
+        finally:
+            cur.close()
+        self.replay_lsn = parse_lsn(lsn) if lsn else None
+        self.lag_seconds = float(lag) if lag is not None else None
+        self.checked_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            'index': self.index,
+            'replayLsn': format_lsn(self.replay_lsn) if self.replay_lsn is not None else None,
+            'lagSeconds': self.lag_seconds,
+            'down': self.down_until > time.monotonic(),
+            'pool': self.pool.stats()
+        }
+
+
+class Router:
+    """Выбор реплики по кругу с проверкой позиции воспроизведения."""
+
+    def __init__(self, dsns: list):
+        self.replicas = [Replica(index, dsn) for index, dsn in enumerate(dsns)]
+        self._next = 0
+        self._owners = {}
+        self._lock = threading.Lock()
+        self._stats = {'primaryRead': 0, 'replica': 0, 'replicaBehind': 0, 'replicaDown': 0, 'badToken': 0}
+
+    def count(self, decision: str):
+        with self._lock:
+            self._stats[decision] += 1
+
+    def _order(self) -> list:
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start]
+
+    def getconn(self, min_lsn: int = None):
+        """Соединение с подходящей реплики или None, если читать нужно с primary."""
+        for replica in self._order():
+            now = time.monotonic()
+            if replica.down_until > now:
+                continue
+            try:
+                conn = replica.pool.getconn()
+            except PoolExhausted:
+                continue
+            except psycopg2.Error:
+                replica.down_until = now + REPLICA_RETRY_AFTER
+                self.count('replicaDown')
+                continue
+
+            try:
+                behind = min_lsn is not None and (replica.replay_lsn is None or replica.replay_lsn < min_lsn)
+                if behind or now - replica.checked_at > REPLICA_LSN_TTL:
+                    replica.refresh(conn)
+            except psycopg2.Error:
+                replica.pool.putconn(conn)
+                replica.down_until = now + REPLICA_RETRY_AFTER
+                self.count('replicaDown')
+                continue
+
+            if min_lsn is not None and (replica.replay_lsn is None or replica.replay_lsn < min_lsn):
+                replica.pool.putconn(conn)
+                self.count('replicaBehind')
+                continue
+
+            with self._lock:
+                self._owners[id(conn)] = replica.pool
+            self.count('replica')
+            return conn
+        return None
+
+    def owner(self, conn):
+        with self._lock:
+            return self._owners.pop(id(conn), None)
+
+    def owns(self, conn) -> bool:
+        with self._lock:
+            return id(conn) in self._owners
+
+    def stats(self) -> dict:
+        with self._lock:
+            decisions = dict(self._stats)
+        return {'decisions': decisions, 'replicas': [replica.stats() for replica in self.replicas]}
+
+
+_pool = None
+_router = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ['DATABASE_URL'], POOL_MAX_SIZE)
+    return _pool
+
+
+def get_router() -> Router:
+    global _router
+    if _router is None:
+        with _pool_lock:
+            if _router is None:
+                _router = Router(REPLICA_DSNS)
+    return _router
+
+
+def session_lsn(event: dict) -> str:
+    """Токен X-Session-LSN из заголовков запроса (None, если его нет)."""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == SESSION_LSN_HEADER.lower():
+            return value
+    return None
+
+
+def get_connection(readonly: bool = False, min_lsn: str = None):
+    """
+    Соединение с primary или, для readonly при настроенных репликах, с реплики.
+    min_lsn — токен X-Session-LSN: реплика должна воспроизвести эту позицию.
+    """
+    with phase('connect'):
+        if readonly and REPLICA_DSNS:
+            router = get_router()
+            try:
+                lsn = parse_lsn(min_lsn) if min_lsn else None
+            except ValueError:
+                router.count('badToken')
+            else:
+                conn = router.getconn(lsn)
+                if conn is not None:
+                    return conn
+            router.count('primaryRead')
+        return get_pool().getconn()
+
+
+def is_replica(conn) -> bool:
+    """Соединение выдано репликой и ещё не возвращено."""
+    return bool(REPLICA_DSNS) and get_router().owns(conn)
+
+
+def release_connection(conn):
+    pool = get_router().owner(conn) if REPLICA_DSNS else None
+    (pool or get_pool()).putconn(conn)
+
+
+def commit(conn):
+    """
+    Фиксирует транзакцию на primary; при настроенных репликах добавляет
+    в ответ X-Session-LSN — позицию WAL, которую должна воспроизвести реплика,
+    чтобы клиент увидел эту запись.
+    """
+    conn.commit()
+    if not REPLICA_DSNS:
+        return
+    cur = conn.cursor()
+    try:
+        cur.execute('SELECT pg_current_wal_insert_lsn()::text')
+        set_header(SESSION_LSN_HEADER, cur.fetchone()[0])
+    finally:
+        cur.close()
+    conn.rollback()
+
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {'maxSize': POOL_MAX_SIZE, 'idle': 0, 'inUse': 0}
+    return _pool.stats()
+
+
+def routing_stats() -> dict:
+    if not REPLICA_DSNS:
+        return {'decisions': {}, 'replicas': []}
+    return get_router().stats()
@@ -1,127 +1,509 @@
 import json
-import os
-import psycopg2
+import time
+from concurrent.futures import TimeoutError
+from datetime import datetime
 
+from psycopg2.extras import execute_values
+
+from db import commit, get_connection, release_connection, session_lsn
+from export import export_allowed, export_response
+from http_cache import etag_matches, make_etag, not_modified
+from listener import get_listener, wait_seconds
+from pagination import InvalidCursor, decode_cursor, page_size
+from profiles import profile_cache
+from responses import RowMapper, cors_preflight, error_response, json_response
+from search import search_page, search_sql, search_terms
+from sections import MESSAGE_COLUMNS, MESSAGE_FIELDS, MESSAGES_PAGE_SIZE, UNREAD_BROADCAST_SQL, UNREAD_CAP
+from sections import fetch_messages, messages_page, messages_sql, with_message_authors
+from timing import instrumented, log_exception, phase, set_header
+from write_buffer import GROUP_COMMIT, GROUP_COMMIT_TIMEOUT_MS, WriteBuffer
+
+MESSAGES_CHANNEL = 'messages_feed'
+CONVERSATIONS_LIMIT = 50
+MAX_BATCH_SIZE = 500
+# Ключ страницы для ETag: порядок, id и отправитель (его имя есть в теле)
+KEY_COLUMNS = 'id, from_user_id, created_at'
+
+# Очередь группового commit живёт между тёплыми вызовами, как пул соединений
+_write_buffer = WriteBuffer(MESSAGES_CHANNEL)
+
+
+def _thread_sql(columns: str, user_id: str, peer_id: str, before: str = None):
+    if before:
+        created_at, message_id = decode_cursor(before, (datetime, int))
+        keyset = "AND (created_at, id) < (%s, %s) AND created_at <= %s"
+        keyset_params = (created_at, message_id, created_at)
+    else:
+        keyset = ""
+        keyset_params = ()
+    
+    return f"""
+        SELECT {columns}
+        FROM (
+            (SELECT {columns} FROM messages
+             WHERE to_user_id = %s AND from_user_id = %s {keyset}
+             ORDER BY created_at DESC, id DESC LIMIT %s)
+            UNION ALL
+            (SELECT {columns} FROM messages
+             WHERE to_user_id = %s AND from_user_id = %s AND to_user_id <> from_user_id {keyset}
+             ORDER BY created_at DESC, id DESC LIMIT %s)
+        ) m
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, (
+        user_id, peer_id, *keyset_params, MESSAGES_PAGE_SIZE,
+        peer_id, user_id, *keyset_params, MESSAGES_PAGE_SIZE,
+        MESSAGES_PAGE_SIZE
+    )
+
+
+def _fetch_messages(cur, user_id: str = None, after: str = None, before: str = None) -> list:
+    return _with_authors(cur, fetch_messages(cur, user_id, after, before))
+
+
+def _fetch_thread(cur, user_id: str, peer_id: str, before: str = None) -> list:
+    query, query_params = _thread_sql(MESSAGE_COLUMNS, user_id, peer_id, before)
+    cur.execute(query, query_params)
+    return _with_authors(cur, RowMapper(cur.description, MESSAGE_FIELDS).many(cur.fetchall()))
+
+
+def _search_messages(cur, params: dict) -> dict:
+    """
+    Поиск по сообщениям с теми же правилами видимости, что у ленты:
+    свои личные сообщения и общий канал, без userId — только общий канал.
+    """
+    terms = search_terms(params)
+    if terms is None:
+        return error_response('Слишком короткий или длинный поисковый запрос')
+    
+    user_id = params.get('userId')
+    if user_id:
+        visibility = '(t.to_user_id = %s OR t.from_user_id = %s OR t.to_user_id IS NULL)'
+        visibility_params = (user_id, user_id)
+    else:
+        visibility = 't.to_user_id IS NULL'
+        visibility_params = ()
+    
+    limit = page_size(params)
+    query, query_params = search_sql(
+        'messages', 't.id, t.from_user_id, t.to_user_id, t.content, t.created_at',
+        visibility, visibility_params, terms, limit, params.get('cursor')
+    )
+    cur.execute(query, query_params)
+    messages = RowMapper(cur.description, MESSAGE_FIELDS).many(cur.fetchall())
+    page = search_page('messages', messages, limit)
+    _with_authors(cur, page['messages'])
+    return json_response(page)
+
+
+def _page_etag(cur, query: str, query_params: tuple) -> str:
+    """
+    ETag страницы по выборке ключей без текста сообщений: упорядоченный
+    список id и имена отправителей из кэша профилей, которые попадут в тело.
+    """
+    cur.execute(query, query_params)
+    rows = cur.fetchall()
+    profiles = profile_cache.get_many(cur, [row[1] for row in rows])
+    return make_etag('messages', query_params, [row[0] for row in rows], sorted(profiles.items()))
+
+
+def _with_authors(cur, messages: list) -> list:
+    """Дополняет сообщения именем отправителя из кэша профилей."""
+    return with_message_authors(cur, messages, profile_cache)
+
+
+def _fetch_conversations(cur, user_id: str) -> list:
+    """Личные диалоги из сводной таблицы, общий канал — одной строкой по индексу."""
+    cur.execute("""
+        SELECT c.peer_id, c.last_message_id, c.last_from_user_id,
+               c.last_content, c.last_message_at, c.unread_count
+        FROM conversations c
+        WHERE c.user_id = %s
+        ORDER BY c.last_message_at DESC
+        LIMIT %s
+    """, (user_id, CONVERSATIONS_LIMIT))
+    direct = cur.fetchall()
+    peers = profile_cache.get_many(cur, [row[0] for row in direct])
+    
+    # Последнее сообщение общего канала и непрочитанные в нём (с потолком) —
+    # по частичному индексу idx_messages_broadcast, без общей строки в conversations
+    cur.execute(f"""
+        SELECT m.id, m.from_user_id, m.content, m.created_at,
+               {UNREAD_BROADCAST_SQL}
+        FROM messages m
+        WHERE m.to_user_id IS NULL
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT 1
+    """, (user_id, UNREAD_CAP))
+    broadcast = cur.fetchone()
+    
+    conversations = []
+    if broadcast:
+        conversations.append({
+            'peerId': 0,
+            'peerName': None,
+            'lastMessage': {
+                'id': broadcast[0],
+                'fromUserId': broadcast[1],
+                'content': broadcast[2],
+                'timestamp': broadcast[3]
+            },
+            'unreadCount': broadcast[4]
+        })
+    for row in direct:
+        conversations.append({
+            'peerId': row[0],
+            'peerName': peers.get(row[0], (None, None))[0],
+            'lastMessage': {
+                'id': row[1],
+                'fromUserId': row[2],
+                'content': row[3],
+                'timestamp': row[4]
+            },
+            'unreadCount': row[5]
+        })
+    conversations.sort(key=lambda c: c['lastMessage']['timestamp'], reverse=True)
+    return conversations
+
+
+def _is_visible(payload, user_id: str) -> bool:
+    if not isinstance(payload, dict):
+        return True
+    if payload.get('to') is None:
+        return True
+    return user_id is not None and str(user_id) in (str(payload.get('to')), str(payload.get('from')))
+
+
+def _query_messages(user_id: str, after: str) -> list:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        rows = _fetch_messages(cur, user_id, after)
+        cur.close()
+        return rows
+    finally:
+        release_connection(conn)
+
+
+def _poll_messages(user_id: str, after: str, wait: float) -> dict:
+    """
+    Long-poll: отдаёт сообщения новее курсора, а если их нет — ждёт NOTIFY
+    не дольше wait секунд. Чужие личные сообщения фильтруются по payload
+    без обращения к базе.
+    """
+    listener = get_listener()
+    listener.subscribe(MESSAGES_CHANNEL)
+    version = listener.version(MESSAGES_CHANNEL)
+    deadline = time.monotonic() + wait
+    
+    try:
+        rows = _query_messages(user_id, after)
+        while not rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with phase('wait'):
+                version, payloads = listener.wait(MESSAGES_CHANNEL, version, remaining)
+            if payloads == []:
+                break
+            if payloads is None or any(_is_visible(p, user_id) for p in payloads):
+                rows = _query_messages(user_id, after)
+    except InvalidCursor:
+        return error_response('Некорректный курсор')
+    
+    return json_response(messages_page(rows, after))
+
+
+def _prefers_minimal(event: dict, body: dict) -> bool:
+    """Prefer: return=minimal или returnMinimal в теле — ответ без имени отправителя."""
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return 'return=minimal' in headers.get('prefer', '') or bool(body.get('returnMinimal'))
+
+
+def _group_commit_timeout(context) -> float:
+    """
+    Сколько ждать пачку: GROUP_COMMIT_TIMEOUT_MS, но не больше половины
+    оставшегося времени вызова — вторая половина остаётся на прямую вставку.
+    """
+    timeout = GROUP_COMMIT_TIMEOUT_MS / 1000
+    remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if callable(remaining):
+        timeout = min(timeout, remaining() / 2000)
+    return max(timeout, 0)
+
+
+def _send_buffered(event: dict, body: dict, context) -> dict:
+    """
+    Одиночная отправка через групповой commit: ответ тот же, что у обычной
+    отправки, но сообщение вставляется и фиксируется вместе с другими,
+    пришедшими за те же миллисекунды. Если пачка не записана за отведённое
+    время и сообщение ещё не попало в неё, возвращает None — обработчик
+    вставит сообщение обычным путём; если пачка с ним пишется и не успела
+    и за второй такой же срок — 503.
+    """
+    from_user_id = body.get('fromUserId')
+    content = body.get('content')
+    to_user_id = body.get('toUserId')
+    
+    if not from_user_id or not content or not isinstance(content, str):
+        return error_response('От кого и содержимое обязательны')
+    try:
+        from_user_id = int(from_user_id)
+        to_user_id = int(to_user_id) if to_user_id else None
+    except (TypeError, ValueError):
+        return error_response('Некорректный User ID')
+    
+    future = _write_buffer.submit(from_user_id, to_user_id, content)
+    with phase('group_commit'):
+        try:
+            message, headers = future.result(timeout=_group_commit_timeout(context))
+        except TimeoutError:
+            if future.cancel():
+                return None
+            # Пачка с сообщением уже пишется: повторная вставка его бы задвоила,
+            # поэтому ждём её, но тоже не дольше отведённого времени
+            try:
+                message, headers = future.result(timeout=_group_commit_timeout(context))
+            except TimeoutError:
+                return error_response('Отправка не подтверждена вовремя, сообщение может быть уже записано', 503)
+    for name, value in headers.items():
+        set_header(name, value)
+    
+    if message is None:
+        return error_response('Пользователь не найден', 404)
+    if _prefers_minimal(event, body):
+        return json_response({'message': {'id': message['id'], 'timestamp': message['timestamp']}})
+    return json_response({'message': message})
+
+
+def _send_messages_batch(conn, cur, items: list) -> dict:
+    """
+    Пакетная отправка сообщений: один INSERT ... SELECT на все валидные
+    элементы с именами отправителей из того же запроса и один commit.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        from_user_id = item.get('fromUserId') if isinstance(item, dict) else None
+        content = item.get('content') if isinstance(item, dict) else None
+        to_user_id = item.get('toUserId') if isinstance(item, dict) else None
+        if not from_user_id or not content or not isinstance(content, str):
+            results[index] = {'index': index, 'error': 'От кого и содержимое обязательны'}
+            continue
+        try:
+            valid.append((index, int(from_user_id), int(to_user_id) if to_user_id else None, content))
+        except (TypeError, ValueError):
+            results[index] = {'index': index, 'error': 'Некорректный User ID'}
+    
+    rows = []
+    if valid:
+        # id выдаются в порядке idx, поэтому строки RETURNING сопоставляются
+        # с элементами по порядку; элементы с несуществующим отправителем
+        # или получателем в результат не попадают
+        rows = execute_values(cur, """
+            WITH v (idx, from_user_id, to_user_id, content) AS (VALUES %s),
+            ins AS (
+                INSERT INTO messages (from_user_id, to_user_id, content)
+                SELECT v.from_user_id, v.to_user_id, v.content
+                FROM v
+                JOIN users s ON s.id = v.from_user_id
+                LEFT JOIN users r ON r.id = v.to_user_id
+                WHERE v.to_user_id IS NULL OR r.id IS NOT NULL
+                ORDER BY v.idx
+                RETURNING id, from_user_id, to_user_id, content, created_at
+            )
+            SELECT ins.id, ins.from_user_id, u.full_name, ins.content, ins.created_at, ins.to_user_id
+            FROM ins
+            JOIN users u ON u.id = ins.from_user_id
+            ORDER BY ins.id
+        """, valid, template='(%s, %s, %s::integer, %s)', fetch=True)
+        rows = RowMapper(cur.description, MESSAGE_FIELDS).many(rows)
+        if rows:
+            cur.execute(
+                "SELECT pg_notify(%s, %s)",
+                (MESSAGES_CHANNEL, json.dumps({'count': len(rows), 'lastId': rows[-1]['id']}))
+            )
+        commit(conn)
+    
+    position = 0
+    for index, from_user_id, to_user_id, _ in valid:
+        if (position < len(rows) and rows[position]['fromUserId'] == from_user_id
+                and rows[position]['toUserId'] == to_user_id):
+            message = rows[position]
+            del message['toUserId']
+            results[index] = {'index': index, 'message': message}
+            position += 1
+        else:
+            results[index] = {'index': index, 'error': 'Пользователь не найден'}
+    
+    return {'results': results, 'created': len(rows)}
+
+
+@instrumented('messages')
 def handler(event: dict, context) -> dict:
     """
     API для работы с сообщениями чата.
-    Поддерживает отправку и получение сообщений.
+    Поддерживает отправку и получение сообщений, список диалогов
+    (view=conversations), переписку с собеседником (peerId),
+    отметку прочтения (action=read), пакетную отправку (items),
+    полнотекстовый поиск (action=search), выгрузку кусками (action=export)
+    и long-poll новых сообщений (action=poll).
     """
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return cors_preflight('GET, POST, OPTIONS', 'Content-Type, X-User-Id, Prefer, If-None-Match, X-Export-Token, X-Session-LSN')
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        params = event.get('queryStringParameters') or {}
+        
+        if method == 'GET' and params.get('action') == 'poll':
+            return _poll_messages(params.get('userId'), params.get('after'), wait_seconds(params))
+        
+        # Ожидающий групповой commit запрос не держит своё соединение из пула
+        if method == 'POST' and GROUP_COMMIT:
+            body = json.loads(event.get('body', '{}'))
+            if body.get('action') != 'read' and 'items' not in body:
+                response = _send_buffered(event, body, context)
+                if response is not None:
+                    return response
+        
+        conn = get_connection(readonly=method == 'GET', min_lsn=session_lsn(event))
         cur = conn.cursor()
         
+        if method == 'GET' and params.get('action') == 'search':
+            try:
+                return _search_messages(cur, params)
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
+        
+        if method == 'GET' and params.get('action') == 'export':
+            if not export_allowed(event):
+                return error_response('Доступ запрещён', 403)
+            try:
+                return export_response(conn, 'messages', params, event)
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
+        
         if method == 'GET':
-            user_id = event.get('queryStringParameters', {}).get('userId')
+            user_id = params.get('userId')
+            peer_id = params.get('peerId')
             
-            if user_id:
-                cur.execute("""
-                    SELECT m.id, m.from_user_id, u.full_name, m.content, m.created_at
-                    FROM messages m
-                    JOIN users u ON m.from_user_id = u.id
-                    WHERE m.to_user_id = %s OR m.from_user_id = %s OR m.to_user_id IS NULL
-                    ORDER BY m.created_at DESC
-                    LIMIT 100
-                """, (user_id, user_id))
-            else:
-                cur.execute("""
-                    SELECT m.id, m.from_user_id, u.full_name, m.content, m.created_at
-                    FROM messages m
-                    JOIN users u ON m.from_user_id = u.id
-                    WHERE m.to_user_id IS NULL
-                    ORDER BY m.created_at DESC
-                    LIMIT 100
-                """)
+            if user_id and params.get('view') == 'conversations':
+                return json_response({'conversations': _fetch_conversations(cur, user_id)}, event=event)
             
-            messages = []
-            for row in cur.fetchall():
-                messages.append({
-                    'id': row[0],
-                    'fromUserId': row[1],
-                    'fromUserName': row[2],
-                    'content': row[3],
-                    'timestamp': row[4].isoformat()
-                })
+            try:
+                if user_id and peer_id and peer_id != '0':
+                    query, query_params = _thread_sql(KEY_COLUMNS, user_id, peer_id, params.get('before'))
+                    etag = _page_etag(cur, query, query_params)
+                    if etag_matches(event, etag):
+                        return not_modified(etag)
+                    rows = _fetch_thread(cur, user_id, peer_id, params.get('before'))
+                else:
+                    feed_user = None if peer_id == '0' else user_id
+                    query, query_params = messages_sql(KEY_COLUMNS, feed_user, params.get('after'), params.get('before'))
+                    etag = _page_etag(cur, query, query_params)
+                    if etag_matches(event, etag):
+                        return not_modified(etag)
+                    rows = _fetch_messages(cur, feed_user, params.get('after'), params.get('before'))
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'messages': messages}),
-                'isBase64Encoded': False
-            }
+            return json_response(messages_page(rows, params.get('after')), event=event, headers={'ETag': etag})
         
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
+            
+            if body.get('action') == 'read':
+                user_id = body.get('userId')
+                peer_id = body.get('peerId')
+                
+                if not user_id or peer_id is None or peer_id == '':
+                    return error_response('User ID и собеседник обязательны')
+                try:
+                    user_id = int(user_id)
+                    peer_id = int(peer_id)
+                except (TypeError, ValueError):
+                    return error_response('Некорректный User ID или собеседник')
+                
+                if peer_id == 0:
+                    cur.execute(
+                        """INSERT INTO broadcast_reads (user_id, last_read_at) VALUES (%s, CURRENT_TIMESTAMP)
+                           ON CONFLICT (user_id) DO UPDATE SET last_read_at = EXCLUDED.last_read_at""",
+                        (user_id,)
+                    )
+                else:
+                    cur.execute(
+                        """UPDATE messages SET is_read = true
+                           WHERE to_user_id = %s AND from_user_id = %s AND is_read = false""",
+                        (user_id, peer_id)
+                    )
+                    cur.execute(
+                        "UPDATE conversations SET unread_count = 0 WHERE user_id = %s AND peer_id = %s",
+                        (user_id, peer_id)
+                    )
+                commit(conn)
+                
+                return json_response({'success': True})
+            
+            if 'items' in body:
+                items = body['items']
+                if not isinstance(items, list) or not items or len(items) > MAX_BATCH_SIZE:
+                    return error_response(f'Передайте от 1 до {MAX_BATCH_SIZE} сообщений')
+                
+                return json_response(_send_messages_batch(conn, cur, items), event=event)
+            
             from_user_id = body.get('fromUserId')
             content = body.get('content')
             to_user_id = body.get('toUserId')
             
             if not all([from_user_id, content]):
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'От кого и содержимое обязательны'}),
-                    'isBase64Encoded': False
-                }
+                return error_response('От кого и содержимое обязательны')
             
-            cur.execute(
-                """INSERT INTO messages (from_user_id, to_user_id, content) 
-                   VALUES (%s, %s, %s) 
-                   RETURNING id, created_at""",
-                (from_user_id, to_user_id, content)
-            )
+            # Вставка, имя отправителя и NOTIFY — одним запросом; если отправителя
+            # или получателя нет, INSERT ... SELECT ничего не вставляет
+            minimal = _prefers_minimal(event, body)
+            if minimal:
+                cur.execute(
+                    """INSERT INTO messages (from_user_id, to_user_id, content)
+                       SELECT s.id, %s, %s FROM users s
+                       WHERE s.id = %s
+                         AND (%s::integer IS NULL OR EXISTS (SELECT 1 FROM users r WHERE r.id = %s))
+                       RETURNING id, created_at,
+                                 pg_notify(%s, json_build_object('id', id, 'from', from_user_id, 'to', to_user_id)::text)""",
+                    (to_user_id, content, from_user_id, to_user_id, to_user_id, MESSAGES_CHANNEL)
+                )
+            else:
+                cur.execute(
+                    """WITH ins AS (
+                           INSERT INTO messages (from_user_id, to_user_id, content)
+                           SELECT s.id, %s, %s FROM users s
+                           WHERE s.id = %s
+                             AND (%s::integer IS NULL OR EXISTS (SELECT 1 FROM users r WHERE r.id = %s))
+                           RETURNING id, from_user_id, to_user_id, content, created_at
+                       )
+                       SELECT ins.id, ins.from_user_id, u.full_name, ins.content, ins.created_at,
+                              pg_notify(%s, json_build_object('id', ins.id, 'from', ins.from_user_id, 'to', ins.to_user_id)::text)
+                       FROM ins
+                       JOIN users u ON u.id = ins.from_user_id""",
+                    (to_user_id, content, from_user_id, to_user_id, to_user_id, MESSAGES_CHANNEL)
+                )
             result = cur.fetchone()
-            conn.commit()
-            
-            cur.execute("SELECT full_name FROM users WHERE id = %s", (from_user_id,))
-            user = cur.fetchone()
+            commit(conn)
             
-            message = {
-                'id': result[0],
-                'fromUserId': from_user_id,
-                'fromUserName': user[0],
-                'content': content,
-                'timestamp': result[1].isoformat()
-            }
+            if not result:
+                return error_response('Пользователь не найден', 404)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': message}),
-                'isBase64Encoded': False
-            }
+            return json_response({'message': RowMapper(cur.description, MESSAGE_FIELDS)(result)})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return error_response('Метод не поддерживается', 405)
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        log_exception()
+        return error_response(str(e), 500)
     
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            release_connection(conn)
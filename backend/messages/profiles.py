@@ -0,0 +1,147 @@
+"""
+Кэш отображаемых профилей авторов (имя и должность) по id пользователя.
+Ограничен по числу записей (LRU) и времени жизни, недостающие профили
+дочитываются одним запросом WHERE id = ANY(%s). PUT в backend/auth шлёт
+NOTIFY profile_updated, по которому запись сбрасывается во всех экземплярах.
+Сброшенный профиль в течение PROFILE_PRIMARY_WINDOW дочитывается с primary:
+отстающая реплика могла ещё не воспроизвести изменение, и старое имя
+снова попало бы в кэш.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_connection, is_replica, release_connection
+from listener import get_listener
+
+PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', '5000'))
+PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', '60'))
+PROFILE_CHANNEL = 'profile_updated'
+# Верхняя оценка отставания реплик: столько секунд после сброса профиль читается с primary
+PROFILE_PRIMARY_WINDOW = float(os.environ.get('PROFILE_PRIMARY_WINDOW', '10'))
+PROFILES_SQL = "SELECT id, full_name, position FROM users WHERE id = ANY(%s)"
+
+
+class ProfileCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        # id -> до какого момента читать с primary; _primary_all_until — для всех
+        self._primary_until = {}
+        self._primary_all_until = 0.0
+        self._subscribed = False
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'primaryReads': 0}
+
+    def _subscribe(self):
+        if self._subscribed:
+            return
+        self._subscribed = True
+        get_listener().subscribe(PROFILE_CHANNEL, self._on_notify, timeout=0)
+
+    def _on_notify(self, payload):
+        if isinstance(payload, dict) and payload.get('id') is not None:
+            self.invalidate(int(payload['id']))
+        else:
+            self.invalidate()
+
+    def invalidate(self, user_id: int = None):
+        until = time.monotonic() + PROFILE_PRIMARY_WINDOW
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += 1
+            if user_id is None:
+                self._items.clear()
+                self._primary_until.clear()
+                self._primary_all_until = until
+            else:
+                self._items.pop(user_id, None)
+                self._primary_until[user_id] = until
+
+    def _needs_primary(self, user_id: int, now: float) -> bool:
+        """Вызывается под блокировкой; просроченные отметки удаляются."""
+        if now < self._primary_all_until:
+            return True
+        until = self._primary_until.get(user_id)
+        if until is None:
+            return False
+        if until <= now:
+            del self._primary_until[user_id]
+            return False
+        return True
+
+    def put(self, user_id: int, full_name: str, position: str):
+        with self._lock:
+            self._store(user_id, (full_name, position), time.monotonic())
+
+    def _store(self, user_id: int, profile: tuple, now: float):
+        self._items[user_id] = (profile, now + self.ttl)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get_many(self, cur, user_ids) -> dict:
+        """Возвращает {id: (full_name, position)}; промахи дочитываются одним запросом."""
+        self._subscribe()
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for user_id in set(user_ids):
+                item = self._items.get(user_id)
+                if item is not None and item[1] > now:
+                    self._items.move_to_end(user_id)
+                    found[user_id] = item[0]
+                else:
+                    missing.append(user_id)
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(missing)
+            generation = self._generation
+            primary = [user_id for user_id in missing if self._needs_primary(user_id, now)]
+
+        if missing:
+            # Недавно сброшенные профили с реплики не читаем
+            if primary and is_replica(cur.connection):
+                rows = self._read_primary(primary)
+                rest = list(set(missing) - set(primary))
+                if rest:
+                    cur.execute(PROFILES_SQL, (rest,))
+                    rows += cur.fetchall()
+            else:
+                cur.execute(PROFILES_SQL, (missing,))
+                rows = cur.fetchall()
+            with self._lock:
+                # Если пока шёл запрос пришла инвалидация, в кэш не пишем —
+                # прочитанные данные могли устареть
+                keep = generation == self._generation
+                for user_id, full_name, position in rows:
+                    found[user_id] = (full_name, position)
+                    if keep:
+                        self._store(user_id, (full_name, position), now)
+                if keep:
+                    # Свежий профиль уже в кэше: следующий промах можно читать с реплики
+                    for user_id in primary:
+                        self._primary_until.pop(user_id, None)
+        return found
+
+    def _read_primary(self, user_ids: list) -> list:
+        with self._lock:
+            self._stats['primaryReads'] += 1
+        conn = get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(PROFILES_SQL, (user_ids,))
+            return cur.fetchall()
+        finally:
+            cur.close()
+            release_connection(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._items), 'maxSize': self.max_size, **self._stats}
+
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
@@ -0,0 +1,228 @@
+"""
+Запросы разделов, которые отдают и отдельные функции, и dashboard:
+лента постов, лента сообщений пользователя, группы пользователя и
+счётчики непрочитанного. Обработчики posts, messages, groups,
+notifications и dashboard строят эти ответы только отсюда, поэтому
+первый экран и отдельные запросы не расходятся.
+"""
+from datetime import datetime
+
+from pagination import decode_cursor, encode_cursor
+from responses import RowMapper
+
+POST_FIELDS = {
+    'group_id': 'groupId',
+    'user_id': 'userId',
+    'full_name': 'userName',
+    'position': 'userPosition',
+    'is_moderated': 'isModerated',
+    'created_at': 'timestamp',
+    'pg_notify': None
+}
+FEED_COLUMNS = 'p.id, p.user_id, p.content, p.is_moderated, p.created_at'
+
+MESSAGES_PAGE_SIZE = 100
+MESSAGE_COLUMNS = 'id, from_user_id, content, created_at'
+MESSAGE_FIELDS = {
+    'from_user_id': 'fromUserId',
+    'to_user_id': 'toUserId',
+    'full_name': 'fromUserName',
+    'created_at': 'timestamp',
+    'pg_notify': None
+}
+
+GROUP_COLUMNS = "g.id, g.name, COALESCE(g.description, '') AS description, g.created_by, g.member_count"
+GROUP_FIELDS = {'created_by': 'createdBy', 'member_count': 'memberCount'}
+
+# Счётчики непрочитанного — подзапросы с потолком UNREAD_CAP по частичным
+# индексам; параметры каждого — (user_id, UNREAD_CAP), у UNREAD_DIRECT_SQL — (user_id,)
+UNREAD_CAP = 100
+UNREAD_NOTIFICATIONS_SQL = """(SELECT COUNT(*) FROM (
+    SELECT 1 FROM notifications WHERE user_id = %s AND is_read = false LIMIT %s
+) unread_notifications)"""
+UNREAD_BROADCAST_SQL = """(SELECT COUNT(*) FROM (
+    SELECT 1 FROM messages m
+    WHERE m.to_user_id IS NULL
+      AND m.created_at > COALESCE(
+          (SELECT last_read_at FROM broadcast_reads WHERE user_id = %s), '-infinity')
+    ORDER BY m.created_at DESC
+    LIMIT %s
+) unread_broadcast)"""
+UNREAD_DIRECT_SQL = "(SELECT COALESCE(SUM(unread_count), 0) FROM conversations WHERE user_id = %s)"
+
+
+def feed_sql(columns: str, limit: int, before: str = None, after: str = None):
+    """
+    Запрос окна ленты: с курсором after идём по индексу вверх (потом разворачиваем).
+    Условие на один created_at дублирует row-сравнение ради отсечения секций.
+    """
+    if after:
+        created_at, post_id = decode_cursor(after, (datetime, int))
+        return f"""
+            SELECT {columns}
+            FROM posts p
+            WHERE p.is_moderated = true AND (p.created_at, p.id) > (%s, %s) AND p.created_at >= %s
+            ORDER BY p.created_at ASC, p.id ASC
+            LIMIT %s
+        """, (created_at, post_id, created_at, limit + 1)
+
+    if before:
+        created_at, post_id = decode_cursor(before, (datetime, int))
+        return f"""
+            SELECT {columns}
+            FROM posts p
+            WHERE p.is_moderated = true AND (p.created_at, p.id) < (%s, %s) AND p.created_at <= %s
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT %s
+        """, (created_at, post_id, created_at, limit + 1)
+
+    return f"""
+        SELECT {columns}
+        FROM posts p
+        WHERE p.is_moderated = true
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT %s
+    """, (limit + 1,)
+
+
+def fetch_feed(cur, limit: int, before: str = None, after: str = None) -> tuple:
+    """Посты окна ленты без данных авторов и признак, что есть ещё."""
+    query, query_params = feed_sql(FEED_COLUMNS, limit, before, after)
+    cur.execute(query, query_params)
+    rows = cur.fetchall()
+    page = rows[:limit][::-1] if after else rows[:limit]
+    return RowMapper(cur.description, POST_FIELDS).many(page), len(rows) > limit
+
+
+def feed_page(posts: list, has_more: bool, after: str = None) -> dict:
+    # nextCursor — страница старше, prevCursor — опрос новых постов после самого свежего.
+    # В режиме after hasMore означает, что новых постов больше, чем влезло в страницу.
+    next_cursor = encode_cursor(posts[-1]['timestamp'], posts[-1]['id']) if posts and has_more and not after else None
+    prev_cursor = encode_cursor(posts[0]['timestamp'], posts[0]['id']) if posts else after
+    return {'posts': posts, 'nextCursor': next_cursor, 'prevCursor': prev_cursor, 'hasMore': has_more}
+
+
+def with_post_authors(cur, posts: list, profiles) -> list:
+    """Дополняет посты именем и должностью автора из кэша профилей profiles."""
+    found = profiles.get_many(cur, [post['userId'] for post in posts])
+    for post in posts:
+        post['userName'], post['userPosition'] = found.get(post['userId'], (None, None))
+    return posts
+
+
+def messages_sql(columns: str, user_id: str = None, after: str = None, before: str = None):
+    """
+    Лента пользователя — слияние трёх упорядоченных потоков: входящие,
+    исходящие личные и общий канал. Каждый поток читается своим индексом
+    не дальше страницы, общий ORDER BY сливает не более 3 × MESSAGES_PAGE_SIZE строк.
+    Отдельное условие на created_at рядом со сравнением (created_at, id)
+    нужно для отсечения месячных секций: по row-сравнению оно не работает.
+    """
+    # С курсором after идём от курсора вверх по времени, чтобы не пропустить
+    # сообщения, если новых больше страницы; затем разворачиваем
+    if after:
+        created_at, message_id = decode_cursor(after, (datetime, int))
+        keyset = "AND (created_at, id) > (%s, %s) AND created_at >= %s"
+        keyset_params = (created_at, message_id, created_at)
+        order = "ASC"
+    elif before:
+        created_at, message_id = decode_cursor(before, (datetime, int))
+        keyset = "AND (created_at, id) < (%s, %s) AND created_at <= %s"
+        keyset_params = (created_at, message_id, created_at)
+        order = "DESC"
+    else:
+        keyset = ""
+        keyset_params = ()
+        order = "DESC"
+
+    if user_id:
+        return f"""
+            SELECT {columns}
+            FROM (
+                (SELECT {columns} FROM messages
+                 WHERE to_user_id = %s {keyset}
+                 ORDER BY created_at {order}, id {order} LIMIT %s)
+                UNION ALL
+                (SELECT {columns} FROM messages
+                 WHERE from_user_id = %s AND to_user_id <> %s {keyset}
+                 ORDER BY created_at {order}, id {order} LIMIT %s)
+                UNION ALL
+                (SELECT {columns} FROM messages
+                 WHERE to_user_id IS NULL {keyset}
+                 ORDER BY created_at {order}, id {order} LIMIT %s)
+            ) m
+            ORDER BY created_at {order}, id {order}
+            LIMIT %s
+        """, (
+            user_id, *keyset_params, MESSAGES_PAGE_SIZE,
+            user_id, user_id, *keyset_params, MESSAGES_PAGE_SIZE,
+            *keyset_params, MESSAGES_PAGE_SIZE,
+            MESSAGES_PAGE_SIZE
+        )
+
+    return f"""
+        SELECT {columns}
+        FROM messages
+        WHERE to_user_id IS NULL {keyset}
+        ORDER BY created_at {order}, id {order}
+        LIMIT %s
+    """, (*keyset_params, MESSAGES_PAGE_SIZE)
+
+
+def fetch_messages(cur, user_id: str = None, after: str = None, before: str = None) -> list:
+    """Страница ленты сообщений без имён отправителей, от новых к старым."""
+    query, query_params = messages_sql(MESSAGE_COLUMNS, user_id, after, before)
+    cur.execute(query, query_params)
+    rows = cur.fetchall()
+    return RowMapper(cur.description, MESSAGE_FIELDS).many(rows[::-1] if after else rows)
+
+
+def messages_page(messages: list, after: str = None) -> dict:
+    # prevCursor — с ним клиент опрашивает только сообщения новее уже полученных,
+    # nextCursor — следующая страница истории
+    if messages:
+        prev_cursor = encode_cursor(messages[0]['timestamp'], messages[0]['id'])
+    else:
+        prev_cursor = after
+    if len(messages) == MESSAGES_PAGE_SIZE and not after:
+        next_cursor = encode_cursor(messages[-1]['timestamp'], messages[-1]['id'])
+    else:
+        next_cursor = None
+    return {'messages': messages, 'prevCursor': prev_cursor, 'nextCursor': next_cursor}
+
+
+def with_message_authors(cur, messages: list, profiles) -> list:
+    """Дополняет сообщения именем отправителя из кэша профилей profiles."""
+    found = profiles.get_many(cur, [message['fromUserId'] for message in messages])
+    for message in messages:
+        message['fromUserName'] = found.get(message['fromUserId'], (None, None))[0]
+    return messages
+
+
+def groups_sql(columns: str, user_id: str = None):
+    if user_id:
+        # Группы пользователя — объединение двух индексных выборок
+        # (членство и авторство) вместо JOIN ... OR ... GROUP BY
+        return f"""
+            SELECT {columns}
+            FROM groups g
+            WHERE g.id IN (
+                SELECT group_id FROM group_members WHERE user_id = %s
+                UNION
+                SELECT id FROM groups WHERE created_by = %s
+            )
+            ORDER BY g.created_at DESC, g.id DESC
+        """, (user_id, user_id)
+
+    return f"""
+        SELECT {columns}
+        FROM groups g
+        ORDER BY g.created_at DESC, g.id DESC
+        LIMIT 50
+    """, ()
+
+
+def fetch_groups(cur, user_id: str = None) -> list:
+    query, query_params = groups_sql(GROUP_COLUMNS, user_id)
+    cur.execute(query, query_params)
+    return RowMapper(cur.description, GROUP_FIELDS).many(cur.fetchall())
@@ -0,0 +1,154 @@
+"""
+Групповой commit сообщений (MESSAGES_GROUP_COMMIT=1).
+Одиночные POST не пишут сами, а ставят сообщение в очередь и ждут Future.
+Фоновый поток собирает сообщения, пришедшие за GROUP_COMMIT_DELAY_MS
+(не больше GROUP_COMMIT_MAX_BATCH), вставляет их одним INSERT и делает
+один commit — один сброс WAL на пачку вместо одного на сообщение.
+
+Имеет смысл в долгоживущем процессе с параллельными запросами (server/);
+у экземпляра функции, обрабатывающего один запрос за раз, это только
+добавит задержку, поэтому по умолчанию выключено.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from psycopg2.extras import execute_values
+
+from db import commit, get_connection, release_connection
+from responses import RowMapper
+from timing import background, log_exception
+
+GROUP_COMMIT = os.environ.get('MESSAGES_GROUP_COMMIT') == '1'
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', '200'))
+GROUP_COMMIT_DELAY_MS = float(os.environ.get('GROUP_COMMIT_DELAY_MS', '5'))
+# Сколько запрос ждёт пачку, прежде чем вставить сообщение сам
+GROUP_COMMIT_TIMEOUT_MS = float(os.environ.get('GROUP_COMMIT_TIMEOUT_MS', '1000'))
+FIELDS = {
+    'idx': None,
+    'from_user_id': 'fromUserId',
+    'full_name': 'fromUserName',
+    'created_at': 'timestamp',
+    'pg_notify': None
+}
+
+# id выдаются заранее через nextval в порядке очереди (volatile-функция
+# считается после ORDER BY, а CTE с ней не встраивается и считается один раз),
+# поэтому результат сопоставляется по idx, а сообщения одного отправителя
+# получают возрастающие id. created_at у пачки общий — время начала
+# транзакции, — так что порядок (created_at, id) совпадает с порядком очереди
+INSERT_SQL = """
+    WITH v (idx, from_user_id, to_user_id, content) AS (VALUES %s),
+    ok AS (
+        SELECT v.idx, v.from_user_id, v.to_user_id, v.content, s.full_name,
+               nextval(pg_get_serial_sequence('messages', 'id')) AS id
+        FROM v
+        JOIN users s ON s.id = v.from_user_id
+        LEFT JOIN users r ON r.id = v.to_user_id
+        WHERE v.to_user_id IS NULL OR r.id IS NOT NULL
+        ORDER BY v.idx
+    ),
+    ins AS (
+        INSERT INTO messages (id, from_user_id, to_user_id, content)
+        SELECT id, from_user_id, to_user_id, content FROM ok
+        RETURNING id, created_at
+    )
+    SELECT ok.idx, ins.id, ok.from_user_id, ok.full_name, ok.content, ins.created_at,
+           pg_notify('{channel}', json_build_object('id', ins.id, 'from', ok.from_user_id, 'to', ok.to_user_id)::text)
+    FROM ok
+    JOIN ins ON ins.id = ok.id
+"""
+
+
+class WriteBuffer:
+    def __init__(self, channel: str, max_batch: int = GROUP_COMMIT_MAX_BATCH,
+                 delay_ms: float = GROUP_COMMIT_DELAY_MS):
+        self.sql = INSERT_SQL.replace('{channel}', channel)
+        self.max_batch = max_batch
+        self.delay = delay_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.messages = 0
+
+    def submit(self, from_user_id: int, to_user_id: int, content: str) -> Future:
+        """
+        Ставит сообщение в очередь. Future вернёт (сообщение или None, если
+        отправителя или получателя нет; заголовки для ответа). Пока пачка
+        с сообщением не начала писаться, future.cancel() снимает его с очереди.
+        """
+        future = Future()
+        self._queue.put((from_user_id, to_user_id, content, future))
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                    self._thread.start()
+        return future
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'messages': self.messages,
+            'avgBatch': round(self.messages / self.batches, 2) if self.batches else 0.0
+        }
+
+    def _collect(self) -> list:
+        """Первое сообщение ждём сколько угодно, остальные — до delay после него."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Отменённые ожидающим запросом сообщения не пишем: он вставит их сам
+            batch = [item for item in self._collect() if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+            except Exception as e:
+                log_exception()
+                if len(batch) == 1:
+                    batch[0][3].set_exception(e)
+                    continue
+                # Ошибка одной строки (например, слишком большой id) не должна
+                # ронять всю пачку: повторяем по одному
+                for item in batch:
+                    try:
+                        self._flush([item])
+                    except Exception as item_error:
+                        item[3].set_exception(item_error)
+
+    def _flush(self, batch: list):
+        conn = get_connection()
+        cur = conn.cursor()
+        try:
+            with background('messages') as timer:
+                rows = execute_values(
+                    cur, self.sql,
+                    [(idx, from_user_id, to_user_id, content)
+                     for idx, (from_user_id, to_user_id, content, _) in enumerate(batch)],
+                    template='(%s, %s, %s::integer, %s)', page_size=len(batch), fetch=True
+                )
+                commit(conn)
+            mapper = RowMapper(cur.description, FIELDS)
+            inserted = {row[0]: mapper(row) for row in rows}
+        finally:
+            cur.close()
+            release_connection(conn)
+
+        self.batches += 1
+        self.messages += len(inserted)
+        for idx, (_, _, _, future) in enumerate(batch):
+            future.set_result((inserted.get(idx), dict(timer.headers)))
+
@@ -0,0 +1,137 @@
+import json
+import os
+from datetime import datetime
+
+from db import commit, get_connection, release_connection, session_lsn
+from pagination import InvalidCursor, decode_cursor, encode_cursor, page_size
+from responses import RowMapper, cors_preflight, error_response, json_response
+from sections import UNREAD_CAP, UNREAD_NOTIFICATIONS_SQL
+from timing import instrumented, log_exception
+from worker import drain
+
+DRAIN_MAX_SECONDS = float(os.environ.get('NOTIFICATIONS_DRAIN_MAX_SECONDS', '20'))
+NOTIFICATION_FIELDS = {
+    'from_user_id': 'fromUserId',
+    'is_read': 'isRead',
+    'created_at': 'timestamp'
+}
+
+
+def _unread_count(cur, user_id) -> int:
+    # Счёт по частичному индексу непрочитанных, не дальше UNREAD_CAP строк
+    cur.execute(f"SELECT {UNREAD_NOTIFICATIONS_SQL}", (user_id, UNREAD_CAP))
+    return cur.fetchone()[0]
+
+
+def _fetch_notifications(cur, user_id, limit: int, before: str = None) -> dict:
+    keyset = ''
+    keyset_params = ()
+    if before:
+        created_at, notification_id = decode_cursor(before, (datetime, int))
+        keyset = 'AND (created_at, id) < (%s, %s)'
+        keyset_params = (created_at, notification_id)
+    
+    cur.execute(
+        f"""SELECT id, from_user_id, type, content, is_read, created_at
+            FROM notifications
+            WHERE user_id = %s {keyset}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s""",
+        (user_id, *keyset_params, limit + 1)
+    )
+    rows = cur.fetchall()
+    notifications = RowMapper(cur.description, NOTIFICATION_FIELDS).many(rows[:limit])
+    last = notifications[-1] if len(rows) > limit else None
+    return {
+        'notifications': notifications,
+        'nextCursor': encode_cursor(last['timestamp'], last['id']) if last else None
+    }
+
+
+def _mark_read(cur, user_id, ids=None) -> int:
+    """Отмечает прочитанными выбранные id или все непрочитанные пользователя."""
+    if ids is not None:
+        cur.execute(
+            "UPDATE notifications SET is_read = true WHERE user_id = %s AND is_read = false AND id = ANY(%s)",
+            (user_id, ids)
+        )
+    else:
+        cur.execute("UPDATE notifications SET is_read = true WHERE user_id = %s AND is_read = false", (user_id,))
+    return cur.rowcount
+
+
+def _drain_allowed(event: dict) -> bool:
+    token = os.environ.get('NOTIFICATIONS_DRAIN_TOKEN')
+    if not token:
+        return False
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return headers.get('x-drain-token') == token
+
+
+@instrumented('notifications')
+def handler(event: dict, context) -> dict:
+    """
+    API уведомлений.
+    Поддерживает список уведомлений пользователя с курсором, счётчик
+    непрочитанных (view=count), массовую отметку прочтения (action=read)
+    и разбор очереди событий (action=drain, для таймера).
+    """
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return cors_preflight('GET, POST, OPTIONS', 'Content-Type, X-User-Id, X-Drain-Token, X-Session-LSN')
+    
+    try:
+        conn = get_connection(readonly=method == 'GET', min_lsn=session_lsn(event))
+        cur = conn.cursor()
+        
+        if method == 'GET':
+            params = event.get('queryStringParameters') or {}
+            user_id = params.get('userId')
+            if not user_id:
+                return error_response('User ID обязателен')
+            
+            if params.get('view') == 'count':
+                return json_response({'unreadCount': _unread_count(cur, user_id)})
+            
+            try:
+                page = _fetch_notifications(cur, user_id, page_size(params), params.get('before'))
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
+            page['unreadCount'] = _unread_count(cur, user_id)
+            return json_response(page, event=event)
+        
+        elif method == 'POST':
+            body = json.loads(event.get('body', '{}'))
+            action = body.get('action')
+            
+            if action == 'read':
+                user_id = body.get('userId')
+                ids = body.get('ids')
+                if not user_id:
+                    return error_response('User ID обязателен')
+                if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+                    return error_response('ids должен быть списком чисел')
+                
+                updated = _mark_read(cur, user_id, ids)
+                commit(conn)
+                return json_response({'success': True, 'updated': updated})
+            
+            if action == 'drain':
+                if not _drain_allowed(event):
+                    return error_response('Доступ запрещён', 403)
+                return json_response(drain(conn, max_seconds=DRAIN_MAX_SECONDS))
+            
+            return error_response('Неизвестное действие')
+        
+        return error_response('Метод не поддерживается', 405)
+    
+    except Exception as e:
+        log_exception()
+        return error_response(str(e), 500)
+    
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            release_connection(conn)
@@ -0,0 +1,128 @@
+"""
+Общий слой ответов функций: готовые заголовки, строки курсора в словари
+по cursor.description, сериализация в JSON (orjson, если установлен,
+иначе stdlib) и gzip для тел больше GZIP_MIN_BYTES, в том числе текстовых
+(text_response).
+"""
+import base64
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+from timing import add_bytes, phase
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '4096'))
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag, X-Session-LSN'
+}
+
+
+def cors_preflight(methods: str, headers: str = 'Content-Type, X-User-Id') -> dict:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': headers
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    def dumps(payload) -> bytes:
+        return orjson.dumps(payload, default=_default)
+else:
+    def dumps(payload) -> bytes:
+        return json.dumps(payload, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class RowMapper:
+    """
+    Превращает строки курсора в словари; ключи берутся из cursor.description
+    с переименованием через rename, колонки с ключом None отбрасываются.
+    """
+
+    def __init__(self, description, rename: dict = None):
+        rename = rename or {}
+        keys = [rename.get(column[0], column[0]) for column in description]
+        self.keys = tuple(keys)
+        self.kept = None
+        if None in keys:
+            self.kept = tuple((i, key) for i, key in enumerate(keys) if key is not None)
+
+    def __call__(self, row) -> dict:
+        if self.kept is not None:
+            return {key: row[i] for i, key in self.kept}
+        return dict(zip(self.keys, row))
+
+    def many(self, rows) -> list:
+        if self.kept is not None:
+            kept = self.kept
+            return [{key: row[i] for i, key in kept} for row in rows]
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def _accepts_gzip(event: dict) -> bool:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding':
+            return 'gzip' in value
+    return False
+
+
+def _respond(body: bytes, status: int, headers: dict, event: dict = None) -> dict:
+    if event is not None:
+        # С event тело может быть сжато: кэши должны различать ответы по
+        # Accept-Encoding и тогда, когда этот ответ отдан без сжатия
+        headers = {**headers, 'Vary': 'Accept-Encoding'}
+    if event is not None and len(body) >= GZIP_MIN_BYTES and _accepts_gzip(event):
+        compressed = base64.b64encode(gzip.compress(body, compresslevel=5)).decode()
+        add_bytes(len(compressed))
+        return {
+            'statusCode': status,
+            'headers': {**headers, 'Content-Encoding': 'gzip'},
+            'body': compressed,
+            'isBase64Encoded': True
+        }
+    add_bytes(len(body))
+
+    return {
+        'statusCode': status,
+        'headers': headers,
+        'body': body.decode(),
+        'isBase64Encoded': False
+    }
+
+
+def json_response(payload, status: int = 200, event: dict = None, headers: dict = None) -> dict:
+    response_headers = JSON_HEADERS if headers is None else {**JSON_HEADERS, **headers}
+    with phase('serialize'):
+        return _respond(dumps(payload), status, response_headers, event)
+
+
+def text_response(body: str, content_type: str, status: int = 200, event: dict = None, headers: dict = None) -> dict:
+    """Готовое текстовое тело (CSV, NDJSON) с тем же сжатием, что у JSON."""
+    response_headers = {'Content-Type': content_type, 'Access-Control-Allow-Origin': '*', **(headers or {})}
+    with phase('serialize'):
+        return _respond(body.encode(), status, response_headers, event)
+
+
+def error_response(message: str, status: int = 400) -> dict:
+    return json_response({'error': message}, status)
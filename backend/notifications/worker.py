@@ -0,0 +1,127 @@
+"""
+Разбор очереди notification_events: пачка событий забирается
+FOR UPDATE SKIP LOCKED (несколько обработчиков не мешают друг другу),
+получатели каждого события раскладываются в notifications одним
+многострочным INSERT ... SELECT, обработанные события удаляются —
+всё одним запросом в одной транзакции.
+
+Вызывается из функции (POST action=drain, например по таймеру) или
+постоянным процессом, который просыпается по NOTIFY notification_events:
+
+    DATABASE_URL=postgresql://... python backend/notifications/worker.py --loop
+"""
+import argparse
+import os
+import select
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+DRAIN_BATCH_SIZE = int(os.environ.get('NOTIFICATIONS_BATCH_SIZE', '200'))
+EVENTS_CHANNEL = 'notification_events'
+
+# message и group_join — одному адресату, post и group_created — принятым
+# друзьям автора, group_post — участникам группы; автор себе не уведомляется
+DRAIN_SQL = """
+    WITH batch AS (
+        SELECT id, type, actor_id, target_user_id, group_id, content, created_at
+        FROM notification_events
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ),
+    recipients AS (
+        SELECT r.user_id, b.actor_id, b.type, b.content, b.created_at
+        FROM batch b
+        CROSS JOIN LATERAL (
+            SELECT b.target_user_id AS user_id WHERE b.type IN ('message', 'group_join')
+            UNION
+            SELECT f FROM accepted_friends(b.actor_id) f WHERE b.type IN ('post', 'group_created')
+            UNION
+            SELECT gm.user_id FROM group_members gm WHERE b.type = 'group_post' AND gm.group_id = b.group_id
+        ) r
+        WHERE r.user_id IS NOT NULL AND r.user_id <> b.actor_id
+    ),
+    ins AS (
+        INSERT INTO notifications (user_id, from_user_id, type, content, created_at)
+        SELECT user_id, actor_id, type, content, created_at FROM recipients
+        RETURNING 1
+    ),
+    done AS (
+        DELETE FROM notification_events e USING batch b WHERE e.id = b.id
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM done), (SELECT COUNT(*) FROM ins)
+"""
+
+
+def drain_batch(conn, batch_size: int = DRAIN_BATCH_SIZE) -> tuple:
+    """Обрабатывает одну пачку; возвращает (событий, уведомлений)."""
+    cur = conn.cursor()
+    try:
+        cur.execute(DRAIN_SQL, (batch_size,))
+        events, created = cur.fetchone()
+        conn.commit()
+        return events, created
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def drain(conn, batch_size: int = DRAIN_BATCH_SIZE, max_seconds: float = None) -> dict:
+    """Разбирает очередь пачками, пока она не опустеет или не выйдет время."""
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    totals = {'batches': 0, 'events': 0, 'notifications': 0}
+    while deadline is None or time.monotonic() < deadline:
+        events, created = drain_batch(conn, batch_size)
+        if not events:
+            break
+        totals['batches'] += 1
+        totals['events'] += events
+        totals['notifications'] += created
+    return totals
+
+
+def run_forever(dsn: str, batch_size: int, idle_wait: float):
+    conn = psycopg2.connect(dsn)
+    listen = psycopg2.connect(dsn)
+    listen.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    listen.cursor().execute(f'LISTEN {EVENTS_CHANNEL}')
+    try:
+        while True:
+            totals = drain(conn, batch_size)
+            if totals['events']:
+                print(f"drained {totals['events']} events -> {totals['notifications']} notifications", flush=True)
+            # Ждём NOTIFY из триггеров очереди; idle_wait — страховка
+            # на случай пропущенного уведомления
+            if select.select([listen], [], [], idle_wait) != ([], [], []):
+                listen.poll()
+                listen.notifies.clear()
+    finally:
+        listen.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--batch-size', type=int, default=DRAIN_BATCH_SIZE)
+    parser.add_argument('--loop', action='store_true', help='работать постоянно, просыпаясь по NOTIFY')
+    parser.add_argument('--idle-wait', type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.loop:
+        run_forever(args.dsn, args.batch_size, args.idle_wait)
+    else:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            print(drain(conn, args.batch_size))
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
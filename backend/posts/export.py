@@ -0,0 +1,177 @@
+"""
+Выгрузка posts, group_posts и messages целиком (для комплаенса).
+Строки читаются именованным (серверным) курсором пачками по EXPORT_ITERSIZE
+и сразу пишутся в NDJSON или CSV, поэтому память не растёт с числом строк.
+Ответ функции — кусок не больше EXPORT_CHUNK_ROWS строк и EXPORT_CHUNK_BYTES
+символов, продолжение — по курсору (created_at, id) из X-Next-Cursor.
+Полную выгрузку в файл через COPY делает scripts/bulk_export.py.
+"""
+import csv
+import io
+import os
+from datetime import datetime
+
+from pagination import decode_cursor, encode_cursor
+from responses import dumps, error_response, text_response
+
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '20000'))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(2 * 1024 * 1024)))
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8'
+}
+# Таблица: (колонки, условие по userId, условие по groupId); id — первая колонка
+EXPORT_TABLES = {
+    'posts': (
+        'id, user_id, content, is_moderated, created_at, updated_at',
+        'user_id = %s', None
+    ),
+    'group_posts': (
+        'id, group_id, user_id, content, created_at',
+        'user_id = %s', 'group_id = %s'
+    ),
+    'messages': (
+        'id, from_user_id, to_user_id, group_id, content, is_read, created_at',
+        '(from_user_id = %s OR to_user_id = %s)', 'group_id = %s'
+    ),
+}
+
+
+class InvalidExportFilter(ValueError):
+    pass
+
+
+def export_allowed(event: dict) -> bool:
+    token = os.environ.get('EXPORT_TOKEN')
+    if not token:
+        return False
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return headers.get('x-export-token') == token
+
+
+def _filter_value(params: dict, key: str, cast):
+    value = params.get(key)
+    if not value:
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise InvalidExportFilter(f'Некорректный параметр {key}')
+
+
+def export_columns(table: str) -> list:
+    return [column.strip() for column in EXPORT_TABLES[table][0].split(',')]
+
+
+def export_sql(table: str, params: dict, cursor: str = None):
+    """
+    Запрос выгрузки по возрастанию (created_at, id) с фильтрами from/to
+    (ISO-дата или время, to не включается), userId и groupId. Границы по
+    created_at отсекают месячные секции posts и messages.
+    """
+    columns, user_condition, group_condition = EXPORT_TABLES[table]
+    conditions = []
+    query_params = []
+
+    since = _filter_value(params, 'from', datetime.fromisoformat)
+    until = _filter_value(params, 'to', datetime.fromisoformat)
+    user_id = _filter_value(params, 'userId', int)
+    group_id = _filter_value(params, 'groupId', int)
+    if since:
+        conditions.append('created_at >= %s')
+        query_params.append(since)
+    if until:
+        conditions.append('created_at < %s')
+        query_params.append(until)
+    if user_id is not None:
+        conditions.append(user_condition)
+        query_params.extend([user_id] * user_condition.count('%s'))
+    if group_id is not None:
+        if group_condition is None:
+            raise InvalidExportFilter(f'{table} не фильтруется по groupId')
+        conditions.append(group_condition)
+        query_params.append(group_id)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor, (datetime, int))
+        conditions.append('(created_at, id) > (%s, %s) AND created_at >= %s')
+        query_params.extend([created_at, row_id, created_at])
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"""
+        SELECT {columns}
+        FROM {table}
+        {where}
+        ORDER BY created_at, id
+    """, tuple(query_params)
+
+
+def export_rows(conn, table: str, query: str, query_params: tuple):
+    """Строки именованного курсора: с сервера приходит по EXPORT_ITERSIZE за раз."""
+    cur = conn.cursor(name=f'export_{table}')
+    cur.itersize = EXPORT_ITERSIZE
+    try:
+        cur.execute(query, query_params)
+        yield from cur
+    finally:
+        cur.close()
+
+
+def row_writer(fmt: str, columns: list, out, header: bool = True):
+    """Функция записи одной строки в out; у CSV сначала пишется заголовок."""
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        if header:
+            writer.writerow(columns)
+        return writer.writerow
+
+    def write(row):
+        out.write(dumps(dict(zip(columns, row))).decode())
+        out.write('\n')
+    return write
+
+
+def export_chunk(conn, table: str, fmt: str, params: dict, cursor: str = None,
+                 max_rows: int = EXPORT_CHUNK_ROWS, max_bytes: int = EXPORT_CHUNK_BYTES) -> tuple:
+    """Кусок выгрузки: (тело, курсор продолжения или None, число строк)."""
+    query, query_params = export_sql(table, params, cursor)
+    columns = export_columns(table)
+    created_at = columns.index('created_at')
+    out = io.StringIO()
+    write = row_writer(fmt, columns, out, header=not cursor)
+
+    rows = 0
+    last = None
+    next_cursor = None
+    # Курсор закрывается сразу, а не при сборке мусора генератора
+    source = export_rows(conn, table, query, query_params)
+    try:
+        for row in source:
+            if rows >= max_rows or out.tell() >= max_bytes:
+                next_cursor = encode_cursor(last[created_at], last[0])
+                break
+            write(row)
+            last = row
+            rows += 1
+    finally:
+        source.close()
+    return out.getvalue(), next_cursor, rows
+
+
+def export_response(conn, table: str, params: dict, event: dict) -> dict:
+    """Ответ на action=export: кусок выгрузки с X-Next-Cursor и X-Export-Rows."""
+    fmt = params.get('format') or 'ndjson'
+    if fmt not in EXPORT_FORMATS:
+        return error_response('Неизвестный формат выгрузки')
+    try:
+        body, next_cursor, rows = export_chunk(conn, table, fmt, params, params.get('cursor'))
+    except InvalidExportFilter as e:
+        return error_response(str(e))
+
+    headers = {
+        'X-Export-Rows': str(rows),
+        'Access-Control-Expose-Headers': 'X-Next-Cursor, X-Export-Rows'
+    }
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    return text_response(body, EXPORT_FORMATS[fmt], event=event, headers=headers)
@@ -1,121 +1,371 @@
 import json
-import os
-import psycopg2
+import time
+from datetime import datetime
 
+from psycopg2.extras import execute_values
+
+from db import commit, get_connection, release_connection, session_lsn
+from export import export_allowed, export_response
+from http_cache import etag_matches, make_etag, not_modified
+from listener import get_listener, wait_seconds
+from pagination import InvalidCursor, decode_cursor, encode_cursor, page_size
+from profiles import profile_cache
+from responses import RowMapper, cors_preflight, error_response, json_response
+from search import search_page, search_sql, search_terms
+from sections import POST_FIELDS, feed_page, feed_sql, fetch_feed, with_post_authors
+from timing import instrumented, log_exception, phase
+
+FEED_CHANNEL = 'posts_feed'
+MAX_BATCH_SIZE = 500
+
+
+def _fetch_feed(cur, limit: int, before: str = None, after: str = None):
+    posts, has_more = fetch_feed(cur, limit, before, after)
+    return _with_authors(cur, posts), has_more
+
+
+def _feed_etag(cur, limit: int, before: str = None, after: str = None) -> str:
+    """
+    ETag окна ленты: упорядоченный список id (пост, выпавший из окна, меняет
+    его, даже если число строк и максимумы те же) и профили авторов из кэша,
+    которые попадут в тело, — после PUT в backend/auth ETag меняется.
+    """
+    query, query_params = feed_sql('p.created_at, p.id, p.user_id', limit, before, after)
+    cur.execute(query, query_params)
+    rows = cur.fetchall()
+    profiles = profile_cache.get_many(cur, [row[2] for row in rows])
+    return make_etag('posts', limit, before, after, [row[1] for row in rows], sorted(profiles.items()))
+
+
+def _with_authors(cur, posts: list) -> list:
+    """Дополняет посты именем и должностью автора из кэша профилей."""
+    return with_post_authors(cur, posts, profile_cache)
+
+
+def _search_posts(cur, params: dict, limit: int) -> dict:
+    """Поиск по опубликованным постам (те же правила видимости, что у ленты)."""
+    terms = search_terms(params)
+    if terms is None:
+        return error_response('Слишком короткий или длинный поисковый запрос')
+    
+    query, query_params = search_sql(
+        'posts', 't.id, t.user_id, t.content, t.created_at', 't.is_moderated = true', (),
+        terms, limit, params.get('cursor')
+    )
+    cur.execute(query, query_params)
+    posts = RowMapper(cur.description, POST_FIELDS).many(cur.fetchall())
+    page = search_page('posts', posts, limit)
+    _with_authors(cur, page['posts'])
+    return json_response(page)
+
+
+def _home_sql(user_id, limit: int, before: str = None):
+    """
+    Домашняя лента: слияние разложенных при записи timeline_entries с последними
+    постами друзей-«знаменитостей» и больших групп пользователя. Каждый поток
+    читается своим индексом не дальше страницы, поэтому чтение — O(размер страницы).
+    Порог «знаменитости» — timeline_fanout_limit() (V0012), тот же, что у триггеров раскладки.
+    """
+    if before:
+        created_at, source, post_id = decode_cursor(before, (datetime, str, int))
+        keyset = "AND ({columns}) < (%s, %s, %s)"
+        keyset_params = (created_at, source, post_id)
+        # posts секционирована по created_at, row-сравнение секции не отсекает
+        posts_keyset = keyset + " AND created_at <= %s"
+        posts_params = (*keyset_params, created_at)
+    else:
+        keyset = posts_keyset = ""
+        keyset_params = posts_params = ()
+    
+    timeline_window = keyset.format(columns='created_at, source, post_id')
+    posts_window = posts_keyset.format(columns="created_at, 'post', id")
+    group_window = keyset.format(columns="created_at, 'group', id")
+    
+    # UNION убирает повторы: пост мог попасть и в timeline_entries, и в поток
+    # при чтении (свой пост в большой группе, автор недавно перешёл порог)
+    return f"""
+        WITH keys AS (
+            (SELECT source, post_id AS id, created_at
+             FROM timeline_entries
+             WHERE user_id = %s {timeline_window}
+             ORDER BY created_at DESC, source DESC, post_id DESC
+             LIMIT %s)
+            UNION
+            (SELECT 'post', p.id, p.created_at
+             FROM accepted_friends(%s) f
+             JOIN users u ON u.id = f AND u.friend_count > timeline_fanout_limit()
+             CROSS JOIN LATERAL (
+                 SELECT id, created_at FROM posts
+                 WHERE user_id = f AND is_moderated = true {posts_window}
+                 ORDER BY created_at DESC, id DESC
+                 LIMIT %s
+             ) p)
+            UNION
+            (SELECT 'group', gp.id, gp.created_at
+             FROM group_members gm
+             JOIN groups g ON g.id = gm.group_id AND g.member_count > timeline_fanout_limit()
+             CROSS JOIN LATERAL (
+                 SELECT id, created_at FROM group_posts
+                 WHERE group_id = g.id {group_window}
+                 ORDER BY created_at DESC, id DESC
+                 LIMIT %s
+             ) gp
+             WHERE gm.user_id = %s)
+        ),
+        page AS (
+            SELECT source, id, created_at FROM keys
+            ORDER BY created_at DESC, source DESC, id DESC
+            LIMIT %s
+        )
+        SELECT k.source, k.id, gp.group_id, COALESCE(p.user_id, gp.user_id) AS user_id,
+               COALESCE(p.content, gp.content) AS content, k.created_at
+        FROM page k
+        LEFT JOIN posts p ON k.source = 'post' AND p.id = k.id AND p.created_at = k.created_at AND p.is_moderated = true
+        LEFT JOIN group_posts gp ON k.source = 'group' AND gp.id = k.id
+        ORDER BY k.created_at DESC, k.source DESC, k.id DESC
+    """, (
+        user_id, *keyset_params, limit + 1,
+        user_id, *posts_params, limit + 1,
+        *keyset_params, limit + 1, user_id,
+        limit + 1
+    )
+
+
+def _fetch_home(cur, user_id, limit: int, before: str = None) -> dict:
+    query, query_params = _home_sql(user_id, limit, before)
+    cur.execute(query, query_params)
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    
+    # Пост мог быть снят с модерации или удалён после раскладки — такие строки
+    # приходят без автора и пропускаются
+    posts = [post for post in RowMapper(cur.description, POST_FIELDS).many(rows[:limit]) if post['userId']]
+    _with_authors(cur, posts)
+    
+    last = rows[limit - 1] if has_more else None
+    next_cursor = encode_cursor(last[5], last[0], last[1]) if last else None
+    return {'posts': posts, 'nextCursor': next_cursor, 'hasMore': has_more}
+
+
+def _query_feed(limit: int, after: str):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        rows = _fetch_feed(cur, limit, after=after)
+        cur.close()
+        return rows
+    finally:
+        release_connection(conn)
+
+
+def _poll_feed(after: str, limit: int, wait: float) -> dict:
+    """
+    Long-poll: отдаёт посты новее курсора, а если их нет — ждёт NOTIFY
+    не дольше wait секунд. Соединение из пула на время ожидания не держится.
+    """
+    listener = get_listener()
+    listener.subscribe(FEED_CHANNEL)
+    version = listener.version(FEED_CHANNEL)
+    deadline = time.monotonic() + wait
+    
+    try:
+        rows, has_more = _query_feed(limit, after)
+        while not rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with phase('wait'):
+                version, payloads = listener.wait(FEED_CHANNEL, version, remaining)
+            if payloads == []:
+                break
+            rows, has_more = _query_feed(limit, after)
+    except InvalidCursor:
+        return error_response('Некорректный курсор')
+    
+    return json_response(feed_page(rows, has_more, after))
+
+
+def _prefers_minimal(event: dict, body: dict) -> bool:
+    """Prefer: return=minimal или returnMinimal в теле — ответ без данных автора."""
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return 'return=minimal' in headers.get('prefer', '') or bool(body.get('returnMinimal'))
+
+
+def _create_posts_batch(conn, cur, items: list) -> dict:
+    """
+    Пакетное создание постов: один INSERT ... SELECT на все валидные элементы
+    с авторами из того же запроса и один commit.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        user_id = item.get('userId') if isinstance(item, dict) else None
+        content = item.get('content') if isinstance(item, dict) else None
+        if not user_id or not content or not isinstance(content, str):
+            results[index] = {'index': index, 'error': 'User ID и содержимое обязательны'}
+            continue
+        try:
+            valid.append((index, int(user_id), content))
+        except (TypeError, ValueError):
+            results[index] = {'index': index, 'error': 'Некорректный User ID'}
+    
+    rows = []
+    if valid:
+        # id выдаются в порядке idx, поэтому строки RETURNING сопоставляются
+        # с элементами по порядку; элементы без автора в результат не попадают
+        rows = execute_values(cur, """
+            WITH v (idx, user_id, content) AS (VALUES %s),
+            ins AS (
+                INSERT INTO posts (user_id, content, is_moderated)
+                SELECT v.user_id, v.content, true
+                FROM v
+                JOIN users u ON u.id = v.user_id
+                ORDER BY v.idx
+                RETURNING id, user_id, content, is_moderated, created_at
+            )
+            SELECT ins.id, ins.user_id, u.full_name, u.position, ins.content, ins.is_moderated, ins.created_at
+            FROM ins
+            JOIN users u ON u.id = ins.user_id
+            ORDER BY ins.id
+        """, valid, fetch=True)
+        rows = RowMapper(cur.description, POST_FIELDS).many(rows)
+        if rows:
+            cur.execute(
+                "SELECT pg_notify(%s, %s)",
+                (FEED_CHANNEL, json.dumps({'count': len(rows), 'lastId': rows[-1]['id']}))
+            )
+        commit(conn)
+    
+    position = 0
+    for index, user_id, _ in valid:
+        if position < len(rows) and rows[position]['userId'] == user_id:
+            results[index] = {'index': index, 'post': rows[position]}
+            position += 1
+        else:
+            results[index] = {'index': index, 'error': 'Пользователь не найден'}
+    
+    return {'results': results, 'created': len(rows)}
+
+
+@instrumented('posts')
 def handler(event: dict, context) -> dict:
     """
     API для работы с постами.
-    Поддерживает создание, получение и модерацию постов.
+    Поддерживает создание, получение и модерацию постов,
+    постраничную ленту по курсорам, long-poll новых постов (action=poll),
+    домашнюю ленту друзей и групп (view=home), полнотекстовый поиск
+    (action=search), выгрузку постов кусками (action=export, с groupId —
+    посты группы) и пакетное создание (items).
     """
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return cors_preflight('GET, POST, OPTIONS', 'Content-Type, X-User-Id, Prefer, If-None-Match, X-Export-Token, X-Session-LSN')
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        params = event.get('queryStringParameters') or {}
+        limit = page_size(params)
+        
+        if method == 'GET' and params.get('action') == 'poll':
+            return _poll_feed(params.get('after'), limit, wait_seconds(params))
+        
+        conn = get_connection(readonly=method == 'GET', min_lsn=session_lsn(event))
         cur = conn.cursor()
         
+        if method == 'GET' and params.get('action') == 'search':
+            try:
+                return _search_posts(cur, params, limit)
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
+        
+        if method == 'GET' and params.get('action') == 'export':
+            if not export_allowed(event):
+                return error_response('Доступ запрещён', 403)
+            try:
+                return export_response(conn, 'group_posts' if params.get('groupId') else 'posts', params, event)
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
+        
+        if method == 'GET' and params.get('view') == 'home':
+            if not params.get('userId'):
+                return error_response('User ID обязателен')
+            try:
+                page = _fetch_home(cur, params['userId'], limit, params.get('before'))
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
+            return json_response(page, event=event)
+        
         if method == 'GET':
-            cur.execute("""
-                SELECT p.id, p.user_id, u.full_name, u.position, p.content, p.is_moderated, p.created_at
-                FROM posts p
-                JOIN users u ON p.user_id = u.id
-                WHERE p.is_moderated = true
-                ORDER BY p.created_at DESC
-                LIMIT 50
-            """)
+            try:
+                etag = _feed_etag(cur, limit, params.get('before'), params.get('after'))
+                if etag_matches(event, etag):
+                    return not_modified(etag)
+                rows, has_more = _fetch_feed(cur, limit, params.get('before'), params.get('after'))
+            except InvalidCursor:
+                return error_response('Некорректный курсор')
             
-            posts = []
-            for row in cur.fetchall():
-                posts.append({
-                    'id': row[0],
-                    'userId': row[1],
-                    'userName': row[2],
-                    'userPosition': row[3],
-                    'content': row[4],
-                    'isModerated': row[5],
-                    'timestamp': row[6].isoformat()
-                })
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'posts': posts}),
-                'isBase64Encoded': False
-            }
+            return json_response(feed_page(rows, has_more, params.get('after')), event=event, headers={'ETag': etag})
         
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
+            
+            if 'items' in body:
+                items = body['items']
+                if not isinstance(items, list) or not items or len(items) > MAX_BATCH_SIZE:
+                    return error_response(f'Передайте от 1 до {MAX_BATCH_SIZE} постов')
+                
+                return json_response(_create_posts_batch(conn, cur, items), event=event)
+            
             user_id = body.get('userId')
             content = body.get('content')
             
             if not all([user_id, content]):
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'User ID и содержимое обязательны'}),
-                    'isBase64Encoded': False
-                }
+                return error_response('User ID и содержимое обязательны')
             
-            cur.execute(
-                """INSERT INTO posts (user_id, content, is_moderated) 
-                   VALUES (%s, %s, true) 
-                   RETURNING id, created_at""",
-                (user_id, content)
-            )
+            # Вставка, данные автора и NOTIFY — одним запросом; при несуществующем
+            # авторе INSERT ... SELECT ничего не вставляет
+            minimal = _prefers_minimal(event, body)
+            if minimal:
+                cur.execute(
+                    """INSERT INTO posts (user_id, content, is_moderated)
+                       SELECT u.id, %s, true FROM users u WHERE u.id = %s
+                       RETURNING id, created_at,
+                                 pg_notify(%s, json_build_object('id', id, 'userId', user_id)::text)""",
+                    (content, user_id, FEED_CHANNEL)
+                )
+            else:
+                cur.execute(
+                    """WITH ins AS (
+                           INSERT INTO posts (user_id, content, is_moderated)
+                           SELECT u.id, %s, true FROM users u WHERE u.id = %s
+                           RETURNING id, user_id, content, is_moderated, created_at
+                       )
+                       SELECT ins.id, ins.user_id, u.full_name, u.position, ins.content, ins.is_moderated,
+                              ins.created_at, pg_notify(%s, json_build_object('id', ins.id, 'userId', ins.user_id)::text)
+                       FROM ins
+                       JOIN users u ON u.id = ins.user_id""",
+                    (content, user_id, FEED_CHANNEL)
+                )
             result = cur.fetchone()
-            conn.commit()
+            commit(conn)
             
-            cur.execute(
-                "SELECT full_name, position FROM users WHERE id = %s",
-                (user_id,)
-            )
-            user = cur.fetchone()
+            if not result:
+                return error_response('Пользователь не найден', 404)
             
-            post = {
-                'id': result[0],
-                'userId': user_id,
-                'userName': user[0],
-                'userPosition': user[1],
-                'content': content,
-                'isModerated': True,
-                'timestamp': result[1].isoformat()
-            }
+            post = RowMapper(cur.description, POST_FIELDS)(result)
+            if not minimal:
+                profile_cache.put(post['userId'], post['userName'], post['userPosition'])
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'post': post}),
-                'isBase64Encoded': False
-            }
+            return json_response({'post': post})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return error_response('Метод не поддерживается', 405)
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        log_exception()
+        return error_response(str(e), 500)
     
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            release_connection(conn)
@@ -0,0 +1,81 @@
+"""
+Полнотекстовый поиск по сгенерированной колонке search_vector (конфигурация
+russian, GIN-индекс из db_migrations). Запрос разбирается websearch_to_tsquery,
+результаты ранжируются ts_rank_cd и листаются курсором (rank, id), фрагменты
+с подсветкой (ts_headline) считаются только для строк возвращаемой страницы.
+"""
+import html
+
+from pagination import decode_cursor, encode_cursor
+
+SEARCH_CONFIG = 'russian'
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 200
+
+# ts_headline обрамляет совпадения служебными символами, которые не встречаются
+# в тексте; после экранирования HTML они заменяются на <mark>
+_START = '\x01'
+_STOP = '\x02'
+HEADLINE_OPTIONS = (
+    f'StartSel="{_START}", StopSel="{_STOP}", '
+    'MaxWords=30, MinWords=10, MaxFragments=2, FragmentDelimiter=" … "'
+)
+
+
+def search_terms(params: dict):
+    """Строка запроса из ?q=, None — если она пустая, слишком короткая или длинная."""
+    terms = (params.get('q') or '').strip()
+    if len(terms) < MIN_QUERY_LENGTH or len(terms) > MAX_QUERY_LENGTH:
+        return None
+    return terms
+
+
+def search_sql(table: str, columns: str, visibility: str, visibility_params: tuple,
+               terms: str, limit: int, cursor: str = None):
+    """
+    Страница поиска по таблице table (алиас t) с условием видимости visibility.
+    Ранг и id последней строки — курсор следующей страницы; rank имеет тип real,
+    и его текстовое представление точно восстанавливает значение для сравнения.
+    """
+    keyset = ''
+    keyset_params = ()
+    if cursor:
+        rank, row_id = decode_cursor(cursor, (float, int))
+        keyset = 'AND (ts_rank_cd(t.search_vector, q.query), t.id) < (%s::real, %s)'
+        keyset_params = (rank, row_id)
+
+    # probe выбирает страницу с запасом в одну строку — по ней определяется more;
+    # ts_headline считается только для строк самой страницы
+    return f"""
+        WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS query),
+        probe AS (
+            SELECT {columns}, ts_rank_cd(t.search_vector, q.query) AS rank
+            FROM {table} t, q
+            WHERE t.search_vector @@ q.query AND {visibility} {keyset}
+            ORDER BY rank DESC, t.id DESC
+            LIMIT %s
+        )
+        SELECT page.*, ts_headline('{SEARCH_CONFIG}', page.content, q.query, %s) AS snippet,
+               (SELECT COUNT(*) FROM probe) > %s AS more
+        FROM (
+            SELECT * FROM probe
+            ORDER BY rank DESC, id DESC
+            LIMIT %s
+        ) page, q
+        ORDER BY page.rank DESC, page.id DESC
+    """, (terms, *visibility_params, *keyset_params, limit + 1, HEADLINE_OPTIONS, limit, limit)
+
+
+def render_snippet(snippet: str) -> str:
+    return html.escape(snippet).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def search_page(key: str, items: list, limit: int) -> dict:
+    """Ответ поиска: колонка more у строк страницы — есть ли следующая страница."""
+    page = items[:limit]
+    more = False
+    for item in page:
+        more = item.pop('more')
+        item['snippet'] = render_snippet(item['snippet'])
+    next_cursor = encode_cursor(page[-1]['rank'], page[-1]['id']) if more else None
+    return {key: page, 'nextCursor': next_cursor}
@@ -0,0 +1,149 @@
+"""
+Холодный старт: отдельные функции против единого dispatcher (server/).
+Каждый замер — новый процесс Python, в таблице медиана по --runs запускам:
+время импорта (функции или dispatcher + ленивый импорт маршрута), первый
+ответ и медиана тёплых ответов в том же процессе. Колонка wall — от запуска
+интерпретатора до первого ответа, как его видит платформа.
+
+Без --dsn запросы — OPTIONS (без базы); с --dsn — чтения из loadtest.
+
+    python benchmarks/bench_cold_start.py --runs 5
+    python benchmarks/bench_cold_start.py --runs 5 --dsn postgresql://...
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+# Дешёвые чтения: ни одно не пишет в базу (вход с несуществующим номером)
+READS = {
+    'auth': ('POST', None, json.dumps({'action': 'login', 'phone': '0', 'password': '-'})),
+    'dashboard': ('GET', {'userId': '1'}, None),
+    'groups': ('GET', None, None),
+    'messages': ('GET', {'userId': '1'}, None),
+    'notifications': ('GET', {'userId': '1'}, None),
+    'posts': ('GET', None, None),
+}
+
+
+class Context:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.function_name = 'bench_cold_start'
+
+
+def _event(route: str, with_db: bool, path: str = '/') -> dict:
+    method, params, body = READS.get(route, ('GET', None, None)) if with_db else ('OPTIONS', None, None)
+    return {
+        'httpMethod': method,
+        'path': path,
+        'headers': {'Content-Type': 'application/json'},
+        'queryStringParameters': params,
+        'body': body
+    }
+
+
+def _timed(fn, *args) -> tuple:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def child(mode: str, route: str, with_db: bool, warm: int) -> dict:
+    """Один холодный старт в этом процессе; результат — JSON в stdout."""
+    if mode == 'function':
+        sys.path.insert(0, str(BACKEND / route))
+        module, imported = _timed(importlib.import_module, 'index')
+        call = module.handler
+        event = _event(route, with_db)
+    else:
+        sys.path.insert(0, str(ROOT))
+        module, imported = _timed(importlib.import_module, 'server.dispatcher')
+        dispatcher = module.dispatcher
+        _, lazy = _timed(dispatcher.handler_for, route)
+        imported += lazy
+        call = dispatcher.dispatch
+        event = _event(route, with_db, f'/{route}')
+
+    response, first = _timed(call, event, Context('cold'))
+    timings = [_timed(call, event, Context(f'warm-{i}'))[1] for i in range(warm)]
+    result = {
+        'import': imported,
+        'first': first,
+        'warm': statistics.median(timings) if timings else 0.0,
+        'status': response['statusCode']
+    }
+    if mode == 'unified-all':
+        # Остальные маршруты в том же процессе: общие модули уже загружены
+        others = [r for r in dispatcher.routes if r != route]
+        _, result['rest'] = _timed(lambda: [dispatcher.handler_for(r) for r in others])
+        result['modules'] = len(dispatcher.modules())
+    return result
+
+
+def sample(mode: str, route: str, dsn: str, warm: int) -> dict:
+    env = dict(os.environ)
+    if dsn:
+        env['DATABASE_URL'] = dsn
+    command = [sys.executable, __file__, '--child', mode, route, '--warm', str(warm)]
+    if dsn:
+        command.append('--with-db')
+    started = time.perf_counter()
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    wall = (time.perf_counter() - started) * 1000
+    result = json.loads(output.strip().splitlines()[-1])
+    # Без выхода интерпретатора: вычитаем тёплые вызовы и догрузку маршрутов
+    result['wall'] = wall - result['warm'] * warm - result.get('rest', 0.0)
+    return result
+
+
+def measure(mode: str, route: str, args) -> dict:
+    runs = [sample(mode, route, args.dsn, args.warm) for _ in range(args.runs)]
+    statuses = {run['status'] for run in runs}
+    summary = {key: statistics.median(run[key] for run in runs) for key in ('import', 'first', 'warm', 'wall')}
+    summary['status'] = ','.join(str(s) for s in sorted(statuses))
+    if 'rest' in runs[0]:
+        summary['rest'] = statistics.median(run['rest'] for run in runs)
+        summary['modules'] = runs[0]['modules']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warm', type=int, default=20, help='тёплых запросов после первого')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--routes', nargs='*', default=sorted(p.parent.name for p in BACKEND.glob('*/index.py')))
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'ROUTE'), help=argparse.SUPPRESS)
+    parser.add_argument('--with-db', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(*args.child, args.with_db, args.warm)))
+        return
+
+    print(f'requests: {"reads" if args.dsn else "OPTIONS"}, {args.runs} runs, {args.warm} warm, median ms')
+    print(f'{"route":<15}{"mode":<10}{"import":>9}{"first":>9}{"warm":>9}{"wall":>9}  status')
+    totals = {'function': 0.0, 'unified': 0.0}
+    for route in args.routes:
+        for mode in ('function', 'unified'):
+            r = measure(mode, route, args)
+            totals[mode] += r['import']
+            print(f'{route:<15}{mode:<10}{r["import"]:>9.1f}{r["first"]:>9.2f}{r["warm"]:>9.2f}'
+                  f'{r["wall"]:>9.1f}  {r["status"]}')
+
+    # Один процесс на все маршруты против отдельного импорта каждой функции
+    r = measure('unified-all', args.routes[0], args)
+    print(f'all {len(args.routes)} routes in one process: {r["import"] + r["rest"]:.1f} ms '
+          f'({r["modules"]} shared modules) vs {totals["function"]:.1f} ms for separate function imports')
+
+
+if __name__ == '__main__':
+    main()
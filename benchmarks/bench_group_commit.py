@@ -0,0 +1,195 @@
+"""
+Пропускная способность отправки сообщений: обычный путь (INSERT и commit
+на каждое сообщение) против группового commit (MESSAGES_GROUP_COMMIT=1).
+Оба варианта — backend/messages/index.py, загруженный дважды с разными
+настройками; --concurrency потоков, каждый — свой отправитель, шлют личные
+сообщения одному получателю в течение --seconds секунд. После прогона
+проверяется, что у каждого отправителя порядок сообщений в ленте
+(created_at, id) совпадает с порядком отправки.
+
+Запуск против одноразовой базы с применёнными db_migrations:
+
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_group_commit.py -c 32 --seconds 10
+
+Созданные сообщения, диалоги и события уведомлений удаляются в конце прогона.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import psycopg2
+
+MESSAGES = Path(__file__).resolve().parent.parent / 'backend' / 'messages'
+
+
+class Context:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.function_name = 'bench_group_commit'
+
+
+def load_handler(name: str, env: dict):
+    """
+    Отдельная копия функции messages со своими модулями (пул, очередь):
+    настройки читаются при импорте, поэтому env выставляется на время загрузки.
+    """
+    local = {p.stem for p in MESSAGES.glob('*.py')} - {'index'}
+    saved_modules = {module: sys.modules.pop(module) for module in local if module in sys.modules}
+    saved_env = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    sys.path.insert(0, str(MESSAGES))
+    try:
+        spec = importlib.util.spec_from_file_location(f'bench_{name}', MESSAGES / 'index.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(MESSAGES))
+        for module_name in local:
+            sys.modules.pop(module_name, None)
+        sys.modules.update(saved_modules)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return module
+
+
+def setup_users(conn, count: int) -> tuple:
+    cur = conn.cursor()
+    ids = []
+    for i in range(count + 1):
+        cur.execute(
+            """INSERT INTO users (phone, full_name, position, password)
+               VALUES (%s, %s, 'Наставник', 'bench')
+               ON CONFLICT (phone) DO UPDATE SET full_name = EXCLUDED.full_name
+               RETURNING id""",
+            (f'+7bench-gc-{i}', f'Bench Sender {i}')
+        )
+        ids.append(cur.fetchone()[0])
+    conn.commit()
+    cur.close()
+    return ids[0], ids[1:]
+
+
+def cleanup(conn, recipient: int, senders: list):
+    users = [recipient, *senders]
+    cur = conn.cursor()
+    cur.execute('DELETE FROM messages WHERE from_user_id = ANY(%s)', (senders,))
+    cur.execute('DELETE FROM conversations WHERE user_id = ANY(%s) OR peer_id = ANY(%s)', (users, users))
+    cur.execute('DELETE FROM notification_events WHERE actor_id = ANY(%s)', (senders,))
+    conn.commit()
+    cur.close()
+
+
+def run(name: str, module, recipient: int, senders: list, seconds: float) -> dict:
+    stop = time.monotonic() + seconds
+    timings = []
+    errors = []
+    lock = threading.Lock()
+
+    def sender(user_id: int):
+        local = []
+        sequence = 0
+        while time.monotonic() < stop:
+            event = {
+                'httpMethod': 'POST',
+                'headers': {'Prefer': 'return=minimal'},
+                'body': json.dumps({'fromUserId': user_id, 'toUserId': recipient, 'content': f'{name} {sequence}'})
+            }
+            started = time.perf_counter()
+            response = module.handler(event, Context(f'{name}-{user_id}-{sequence}'))
+            local.append((time.perf_counter() - started) * 1000)
+            if response['statusCode'] != 200:
+                with lock:
+                    errors.append(response['body'])
+            sequence += 1
+        with lock:
+            timings.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=sender, args=(user_id,)) for user_id in senders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    result = {
+        'name': name,
+        'sent': len(timings),
+        'errors': len(errors),
+        'rate': len(timings) / elapsed,
+        'p50': timings[len(timings) // 2],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+    }
+    buffer = getattr(module, '_write_buffer', None)
+    if buffer is not None and module.GROUP_COMMIT:
+        result['avgBatch'] = buffer.stats()['avgBatch']
+    return result
+
+
+def check_order(conn, name: str, senders: list) -> int:
+    """Число отправителей, у которых порядок в ленте не совпал с порядком отправки."""
+    cur = conn.cursor()
+    cur.execute(
+        """SELECT from_user_id, array_agg(split_part(content, ' ', 2)::int ORDER BY created_at, id)
+           FROM messages
+           WHERE from_user_id = ANY(%s) AND content LIKE %s
+           GROUP BY from_user_id""",
+        (senders, f'{name} %')
+    )
+    broken = sum(1 for _, sequence in cur.fetchall() if sequence != sorted(sequence))
+    cur.close()
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--max-batch', type=int, default=200)
+    parser.add_argument('--delay-ms', type=float, default=5)
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL'))
+    args = parser.parse_args()
+
+    env = {
+        'DATABASE_URL': args.dsn,
+        # Обычному пути — по соединению на поток, чтобы мерить commit, а не пул
+        'DB_POOL_MAX_SIZE': str(args.concurrency + 1),
+        'GROUP_COMMIT_MAX_BATCH': str(args.max_batch),
+        'GROUP_COMMIT_DELAY_MS': str(args.delay_ms),
+        'SLOW_REQUEST_MS': '1000000',
+    }
+    direct = load_handler('direct', {**env, 'MESSAGES_GROUP_COMMIT': '0'})
+    grouped = load_handler('grouped', {**env, 'MESSAGES_GROUP_COMMIT': '1'})
+
+    conn = psycopg2.connect(args.dsn)
+    recipient, senders = setup_users(conn, args.concurrency)
+    try:
+        results = [
+            run('direct', direct, recipient, senders, args.seconds),
+            run('grouped', grouped, recipient, senders, args.seconds),
+        ]
+        for r in results:
+            r['misordered'] = check_order(conn, r['name'], senders)
+    finally:
+        cleanup(conn, recipient, senders)
+        conn.close()
+
+    print(f'{args.concurrency} senders, {args.seconds:g} s, batch <= {args.max_batch}, delay {args.delay_ms:g} ms')
+    print(f'{"path":<10}{"msg/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"batch":>8}{"errors":>8}{"order":>8}')
+    for r in results:
+        print(f'{r["name"]:<10}{r["rate"]:>10.0f}{r["p50"]:>10.2f}{r["p99"]:>10.2f}'
+              f'{r.get("avgBatch", 1):>8.1f}{r["errors"]:>8}{"ok" if not r["misordered"] else r["misordered"]:>8}')
+    print(f'grouped: {results[1]["rate"] / results[0]["rate"]:.2f}x vs direct')
+
+
+if __name__ == '__main__':
+    main()
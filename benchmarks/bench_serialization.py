@@ -0,0 +1,95 @@
+"""
+Сравнение сериализации страницы сообщений: старый путь (кортежи по индексам,
+isoformat и json.dumps) против RowMapper и responses.dumps (orjson, если
+установлен). База не нужна — строки генерируются в памяти.
+
+    python benchmarks/bench_serialization.py -n 2000 --rows 100
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'messages'))
+
+from responses import RowMapper, json_response, orjson  # noqa: E402
+
+MESSAGE_FIELDS = {
+    'from_user_id': 'fromUserId',
+    'to_user_id': 'toUserId',
+    'full_name': 'fromUserName',
+    'created_at': 'timestamp',
+    'pg_notify': None
+}
+DESCRIPTION = [('id',), ('from_user_id',), ('full_name',), ('content',), ('created_at',)]
+
+
+def make_rows(count: int) -> list:
+    started = datetime(2024, 1, 1, 12, 0, 0)
+    return [
+        (i, i % 37 + 1, f'Пользователь {i % 37 + 1}', f'Сообщение номер {i}: ' + 'текст ' * 12,
+         started + timedelta(seconds=i))
+        for i in range(count, 0, -1)
+    ]
+
+
+def legacy(rows: list) -> str:
+    messages = []
+    for row in rows:
+        messages.append({
+            'id': row[0],
+            'fromUserId': row[1],
+            'fromUserName': row[2],
+            'content': row[3],
+            'timestamp': row[4].isoformat()
+        })
+    return json.dumps({'messages': messages})
+
+
+def mapped(rows: list) -> str:
+    messages = RowMapper(DESCRIPTION, MESSAGE_FIELDS).many(rows)
+    return json_response({'messages': messages})['body']
+
+
+def run(name: str, fn, rows: list, count: int) -> dict:
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        fn(rows)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    timings.sort()
+    return {
+        'name': name,
+        'mean': statistics.fmean(timings),
+        'p50': timings[len(timings) // 2],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--count', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=100)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    # Оба пути должны отдавать одинаковые данные
+    assert json.loads(legacy(rows)) == json.loads(mapped(rows))
+
+    results = [
+        run('legacy', legacy, rows, args.count),
+        run('mapped', mapped, rows, args.count),
+    ]
+
+    print(f'backend: {"orjson" if orjson is not None else "json"}, body {len(mapped(rows).encode())} bytes')
+    print(f'{"path":<10}{"mean us":>10}{"p50":>10}{"p99":>10}')
+    for r in results:
+        print(f'{r["name"]:<10}{r["mean"]:>10.1f}{r["p50"]:>10.1f}{r["p99"]:>10.1f}')
+    print(f'mapped: {results[0]["mean"] / results[1]["mean"]:.2f}x vs legacy')
+
+
+if __name__ == '__main__':
+    main()
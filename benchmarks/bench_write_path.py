@@ -0,0 +1,201 @@
+"""
+Задержка пути записи: POST в обработчики backend/posts и backend/messages
+с полным ответом (данные автора из того же запроса) и с Prefer: return=minimal.
+С --baseline REV те же запросы идут и в обработчики из ревизии REV
+(например, до перехода на запись одним запросом) — для сравнения.
+
+Обработчики вызываются как в benchmarks/loadtest.py: handler(event, context)
+в процессе, со своими копиями общих модулей. Запуск против одноразовой базы
+с применёнными db_migrations:
+
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_write_path.py -n 2000 --baseline HEAD~20
+
+Пользователи прогона и всё, что создали их записи (посты, сообщения, диалоги,
+ленты, события и уведомления), удаляются в конце одной транзакцией; если
+удаление не прошло, транзакция откатывается и ничего не удаляется частично.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+
+
+class Context:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.function_name = 'bench_write_path'
+
+
+def load_handler(path: Path, name: str):
+    """
+    Импортирует path/index.py под именем name. Общие модули (db, responses, ...)
+    у каждой загрузки свои: на время импорта их имена убираются из sys.modules.
+    """
+    local = {p.stem for p in path.glob('*.py')} - {'index'}
+    saved = {module: sys.modules.pop(module) for module in local if module in sys.modules}
+    sys.path.insert(0, str(path))
+    try:
+        spec = importlib.util.spec_from_file_location(f'bench_{name}', path / 'index.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(path))
+        for module_name in local:
+            sys.modules.pop(module_name, None)
+        sys.modules.update(saved)
+    return module.handler
+
+
+def checkout(revision: str, function: str, target: Path) -> Path:
+    """Файлы backend/<function> из ревизии revision в target/<function>."""
+    path = target / function
+    path.mkdir(parents=True)
+    names = subprocess.run(
+        ['git', 'ls-tree', '--name-only', f'{revision}:backend/{function}'],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout.split()
+    for name in names:
+        if name.endswith('.py'):
+            content = subprocess.run(
+                ['git', 'show', f'{revision}:backend/{function}/{name}'],
+                cwd=ROOT, check=True, capture_output=True
+            ).stdout
+            (path / name).write_bytes(content)
+    return path
+
+
+def setup_users(conn) -> tuple:
+    cur = conn.cursor()
+    ids = []
+    for phone, name in (('+7bench-write', 'Bench Writer'), ('+7bench-write-to', 'Bench Reader')):
+        cur.execute(
+            """INSERT INTO users (phone, full_name, position, password)
+               VALUES (%s, %s, 'Наставник', 'bench')
+               ON CONFLICT (phone) DO UPDATE SET full_name = EXCLUDED.full_name
+               RETURNING id""",
+            (phone, name)
+        )
+        ids.append(cur.fetchone()[0])
+    conn.commit()
+    cur.close()
+    return tuple(ids)
+
+
+def cleanup(conn, users: list):
+    """Всё, что создал прогон, — одной транзакцией: или удалено целиком, или откат."""
+    cur = conn.cursor()
+    try:
+        cur.execute('DELETE FROM timeline_entries WHERE author_id = ANY(%s)', (users,))
+        cur.execute('DELETE FROM notifications WHERE user_id = ANY(%s) OR from_user_id = ANY(%s)', (users, users))
+        cur.execute('DELETE FROM notification_events WHERE actor_id = ANY(%s)', (users,))
+        cur.execute('DELETE FROM conversations WHERE user_id = ANY(%s) OR peer_id = ANY(%s)', (users, users))
+        cur.execute('DELETE FROM messages WHERE from_user_id = ANY(%s) OR to_user_id = ANY(%s)', (users, users))
+        cur.execute('DELETE FROM posts WHERE user_id = ANY(%s)', (users,))
+        cur.execute('DELETE FROM users WHERE id = ANY(%s)', (users,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def post_event(user_id: int, recipient: int, content: str, minimal: bool) -> dict:
+    return {
+        'httpMethod': 'POST',
+        'queryStringParameters': {},
+        'headers': {'Content-Type': 'application/json', **({'Prefer': 'return=minimal'} if minimal else {})},
+        'body': json.dumps({'userId': user_id, 'content': content})
+    }
+
+
+def message_event(user_id: int, recipient: int, content: str, minimal: bool) -> dict:
+    return {
+        'httpMethod': 'POST',
+        'queryStringParameters': {},
+        'headers': {'Content-Type': 'application/json', **({'Prefer': 'return=minimal'} if minimal else {})},
+        'body': json.dumps({'fromUserId': user_id, 'toUserId': recipient, 'content': content})
+    }
+
+
+def run(name: str, handler, make_event, minimal: bool, user_id: int, recipient: int, count: int) -> dict:
+    timings = []
+    errors = 0
+    for i in range(count):
+        event = make_event(user_id, recipient, f'bench {name} {i}', minimal)
+        started = time.perf_counter()
+        response = handler(event, Context(f'{name}-{i}'))
+        timings.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            errors += 1
+    timings.sort()
+    return {
+        'name': name,
+        'mean': statistics.fmean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95) - 1],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--count', type=int, default=1000)
+    parser.add_argument('--baseline', help='git-ревизия, обработчики которой замеряются для сравнения')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL') or os.environ.get('DATABASE_URL'))
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ.setdefault('SLOW_REQUEST_MS', '1000000')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        handlers = {function: load_handler(BACKEND / function, function) for function in ('posts', 'messages')}
+        baseline = {}
+        if args.baseline:
+            baseline = {
+                function: load_handler(checkout(args.baseline, function, Path(tmp)), f'{function}_baseline')
+                for function in ('posts', 'messages')
+            }
+
+        conn = psycopg2.connect(args.dsn)
+        user_id, recipient = setup_users(conn)
+        results = []
+        try:
+            for function, make_event in (('posts', post_event), ('messages', message_event)):
+                if function in baseline:
+                    results.append(run(f'{function}.baseline', baseline[function], make_event, False,
+                                       user_id, recipient, args.count))
+                results.append(run(f'{function}.full', handlers[function], make_event, False,
+                                   user_id, recipient, args.count))
+                results.append(run(f'{function}.minimal', handlers[function], make_event, True,
+                                   user_id, recipient, args.count))
+        finally:
+            cleanup(conn, [user_id, recipient])
+            conn.close()
+
+    print(f'{"path":<20}{"mean ms":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"errors":>8}')
+    for r in results:
+        print(f'{r["name"]:<20}{r["mean"]:>10.3f}{r["p50"]:>10.3f}{r["p95"]:>10.3f}{r["p99"]:>10.3f}{r["errors"]:>8}')
+    for function in ('posts', 'messages'):
+        base = next((r for r in results if r['name'] == f'{function}.baseline'), None)
+        if base is None:
+            continue
+        for r in results:
+            if r['name'].startswith(f'{function}.') and r is not base:
+                print(f'{r["name"]}: {base["mean"] / r["mean"]:.2f}x vs baseline')
+
+
+if __name__ == '__main__':
+    main()
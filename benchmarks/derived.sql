@@ -0,0 +1,71 @@
+-- Пересчёт денормализованных данных после заполнения базы loadtest.py.
+-- Заполнение идёт с отключёнными триггерами, поэтому здесь повторяются
+-- только заполняющие запросы миграций — функции и триггеры остаются
+-- в том виде, в каком их оставила последняя миграция.
+
+-- Сводка личных диалогов и непрочитанные (V0003); общий канал в сводку
+-- не входит (V0011)
+INSERT INTO conversations (user_id, peer_id, last_message_id, last_from_user_id, last_content, last_message_at)
+SELECT DISTINCT ON (owner_id, peer_id) owner_id, peer_id, id, from_user_id, content, created_at
+FROM (
+    SELECT from_user_id AS owner_id, to_user_id AS peer_id, id, from_user_id, content, created_at
+    FROM messages WHERE to_user_id IS NOT NULL
+    UNION ALL
+    SELECT to_user_id, from_user_id, id, from_user_id, content, created_at
+    FROM messages WHERE to_user_id IS NOT NULL AND to_user_id <> from_user_id
+) s
+ORDER BY owner_id, peer_id, created_at DESC, id DESC
+ON CONFLICT (user_id, peer_id) DO NOTHING;
+
+UPDATE conversations c
+SET unread_count = u.cnt
+FROM (
+    SELECT to_user_id, from_user_id, COUNT(*) AS cnt
+    FROM messages
+    WHERE is_read = false AND to_user_id IS NOT NULL AND to_user_id <> from_user_id
+    GROUP BY to_user_id, from_user_id
+) u
+WHERE c.user_id = u.to_user_id AND c.peer_id = u.from_user_id;
+
+-- Число участников групп (V0004)
+UPDATE groups g
+SET member_count = (SELECT COUNT(*) FROM group_members gm WHERE gm.group_id = g.id);
+
+-- Число друзей и домашние ленты по постам последних 30 дней (V0007),
+-- с порогом из timeline_fanout_limit() (V0012)
+UPDATE users u
+SET friend_count = (
+    SELECT COUNT(*) FROM friendships f
+    WHERE f.status = 'accepted' AND (f.user_id = u.id OR f.friend_id = u.id)
+);
+
+INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+SELECT r.user_id, p.created_at, 'post', p.id, p.user_id
+FROM posts p
+JOIN users a ON a.id = p.user_id
+CROSS JOIN LATERAL (
+    SELECT p.user_id AS user_id
+    UNION
+    SELECT f FROM accepted_friends(p.user_id) f WHERE a.friend_count <= timeline_fanout_limit()
+) r
+WHERE p.is_moderated = true AND p.created_at > now() - INTERVAL '30 days'
+ON CONFLICT DO NOTHING;
+
+INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+SELECT r.user_id, gp.created_at, 'group', gp.id, gp.user_id
+FROM group_posts gp
+JOIN groups g ON g.id = gp.group_id
+CROSS JOIN LATERAL (
+    SELECT gp.user_id AS user_id
+    UNION
+    SELECT gm.user_id FROM group_members gm WHERE gm.group_id = gp.group_id AND g.member_count <= timeline_fanout_limit()
+) r
+WHERE gp.created_at > now() - INTERVAL '30 days'
+ON CONFLICT DO NOTHING;
+
+SELECT timeline_trim(ARRAY(SELECT DISTINCT user_id FROM timeline_entries), timeline_keep());
+
+-- Размеры лент для обрезки по числу записей (V0012)
+INSERT INTO timeline_sizes (user_id, entries)
+SELECT user_id, COUNT(*) FROM timeline_entries GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET entries = EXCLUDED.entries;
@@ -0,0 +1,589 @@
+"""
+Нагрузочный прогон настоящих обработчиков backend/* против одноразовой базы.
+
+Поднимает локальный PostgreSQL (initdb + pg_ctl во временном каталоге),
+применяет db_migrations, заполняет базу через generate_series и вызывает
+handler(event, context) каждой функции в процессе с заданной параллельностью.
+По каждому сценарию печатает пропускную способность и p50/p95/p99,
+результат можно сохранить как базовый и сравнивать с ним следующие прогоны.
+
+    python benchmarks/loadtest.py --scale 0.01 --save local
+    python benchmarks/loadtest.py --scale 0.01 --compare local
+
+--scale 1 соответствует 100k пользователей, 1M постов, 10M сообщений и группе
+на 10k участников. С --datadir заполненная база сохраняется между запусками,
+с --dsn используется уже запущенный сервер (в нём будут созданы таблицы).
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+MIGRATIONS = ROOT / 'db_migrations'
+BASELINES = Path(__file__).resolve().parent / 'baselines'
+
+# При заполнении базы триггеры отключены, поэтому денормализованные данные
+# (сводка диалогов, число участников групп и друзей, домашние ленты)
+# пересчитываются после вставки заполняющими запросами из derived.sql —
+# без повторного применения миграций, пересоздающих функции и триггеры
+DERIVED_SQL = Path(__file__).resolve().parent / 'derived.sql'
+SEED_TABLES = ('messages', 'groups', 'group_members', 'posts', 'group_posts', 'friendships')
+
+FULL_SCALE = {
+    'users': 100_000,
+    'posts': 1_000_000,
+    'messages': 10_000_000,
+    'groups': 1_000,
+    'big_group_members': 10_000,
+    'group_posts': 500_000,
+}
+GROUP_MEMBERS = 20
+FRIENDS = 10
+PASSWORD = 'bench'
+SERVICE_TOKEN = 'loadtest'
+PROVISION_ROWS = 1000
+SEARCH_TERMS = ('текст', 'сообщение слово', 'пост', '"слово слово"')
+
+
+def _pg_bin(name: str) -> str:
+    found = shutil.which(name)
+    if found:
+        return found
+    try:
+        bindir = subprocess.run(['pg_config', '--bindir'], capture_output=True, text=True, check=True).stdout.strip()
+        if (Path(bindir) / name).exists():
+            return str(Path(bindir) / name)
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    for candidate in sorted(Path('/usr/lib/postgresql').glob(f'*/bin/{name}'), reverse=True):
+        return str(candidate)
+    raise SystemExit(f'{name} не найден: установите PostgreSQL или передайте --dsn')
+
+
+class LocalPostgres:
+    """Временный сервер PostgreSQL на unix-сокете, без fsync."""
+
+    def __init__(self, datadir: str = None, port: int = 55432):
+        self.keep = datadir is not None
+        self.datadir = Path(datadir or tempfile.mkdtemp(prefix='loadtest-pg-'))
+        self.port = port
+        self.socket_dir = tempfile.mkdtemp(prefix='loadtest-sock-')
+        self.fresh = not (self.datadir / 'PG_VERSION').exists()
+
+    @property
+    def dsn(self) -> str:
+        return f'postgresql://bench@/bench?host={self.socket_dir}&port={self.port}'
+
+    def start(self):
+        if self.fresh:
+            subprocess.run(
+                [_pg_bin('initdb'), '-D', str(self.datadir), '-U', 'bench', '--auth=trust', '-E', 'UTF8', '--locale=C'],
+                check=True, stdout=subprocess.DEVNULL
+            )
+        options = (
+            f"-p {self.port} -k {self.socket_dir} -c listen_addresses='' -c max_connections=300 "
+            "-c fsync=off -c synchronous_commit=off -c full_page_writes=off -c shared_buffers=256MB"
+        )
+        subprocess.run(
+            [_pg_bin('pg_ctl'), '-D', str(self.datadir), '-o', options, '-l', str(self.datadir / 'server.log'), '-w', 'start'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        if self.fresh:
+            conn = psycopg2.connect(f'postgresql://bench@/postgres?host={self.socket_dir}&port={self.port}')
+            conn.autocommit = True
+            conn.cursor().execute('CREATE DATABASE bench')
+            conn.close()
+
+    def stop(self):
+        subprocess.run(
+            [_pg_bin('pg_ctl'), '-D', str(self.datadir), '-m', 'fast', 'stop'],
+            check=False, stdout=subprocess.DEVNULL
+        )
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+        if not self.keep:
+            shutil.rmtree(self.datadir, ignore_errors=True)
+
+
+def _migrations(prefixes=None) -> list:
+    files = sorted(MIGRATIONS.glob('V*__*.sql'), key=lambda p: int(p.name[1:].split('__')[0]))
+    if prefixes is not None:
+        files = [p for p in files if p.name.split('__')[0] in prefixes]
+    return files
+
+
+def apply_migrations(conn, prefixes=None):
+    cur = conn.cursor()
+    for path in _migrations(prefixes):
+        cur.execute(path.read_text(encoding='utf-8'))
+    conn.commit()
+    cur.close()
+
+
+def seed(conn, scale: float):
+    sizes = {name: max(1, int(count * scale)) for name, count in FULL_SCALE.items()}
+    sizes['users'] = max(sizes['users'], GROUP_MEMBERS * 2)
+    sizes['big_group_members'] = min(sizes['big_group_members'], sizes['users'])
+    users = sizes['users']
+    cur = conn.cursor()
+
+    print(f'seed: {sizes}', flush=True)
+    for table in SEED_TABLES:
+        cur.execute(f'ALTER TABLE {table} DISABLE TRIGGER USER')
+
+    cur.execute(
+        """INSERT INTO users (phone, full_name, position, password, registered_at)
+           SELECT '+7900' || lpad(i::text, 7, '0'), 'Пользователь ' || i,
+                  (ARRAY['Наставник', 'Стажёр', 'Руководитель'])[1 + i %% 3], %s,
+                  now() - make_interval(mins => i)
+           FROM generate_series(1, %s) i""",
+        (PASSWORD, users)
+    )
+    # Месячные секции под всю засеянную историю: на пустой базе V0009
+    # создаёт их только начиная с текущего месяца
+    cur.execute(
+        """SELECT ensure_monthly_partitions('posts', 3, (now() - make_interval(secs => %s * 3))::date),
+                  ensure_monthly_partitions('messages', 3, (now() - make_interval(secs => %s))::date)""",
+        (sizes['posts'], sizes['messages'])
+    )
+    cur.execute(
+        """INSERT INTO posts (user_id, content, is_moderated, created_at)
+           SELECT 1 + (i * 7919) %% %s, 'Пост ' || i || ': ' || repeat('текст ', 1 + i %% 40),
+                  i %% 50 <> 0, now() - make_interval(secs => i * 3)
+           FROM generate_series(1, %s) i""",
+        (users, sizes['posts'])
+    )
+    # Каждое двадцатое сообщение — в общий канал, остальные — между
+    # пользователями, у которых пересекается несколько собеседников
+    cur.execute(
+        """INSERT INTO messages (from_user_id, to_user_id, content, is_read, created_at)
+           SELECT 1 + (i * 104729) %% %s,
+                  CASE WHEN i %% 20 = 0 THEN NULL ELSE 1 + ((i * 104729) %% %s + 1 + i %% 7) %% %s END,
+                  'Сообщение ' || i || ' ' || repeat('слово ', 1 + i %% 15),
+                  i %% 4 <> 0, now() - make_interval(secs => i)
+           FROM generate_series(1, %s) i""",
+        (users, users, users, sizes['messages'])
+    )
+    cur.execute(
+        """INSERT INTO groups (name, description, created_by, created_at)
+           SELECT 'Группа ' || g, 'Описание группы ' || g, 1 + (g * 31) %% %s,
+                  now() - make_interval(hours => g)
+           FROM generate_series(1, %s) g""",
+        (users, sizes['groups'])
+    )
+    # Первая группа — большая, у остальных по GROUP_MEMBERS участников
+    cur.execute(
+        """INSERT INTO group_members (group_id, user_id)
+           SELECT 1, u FROM generate_series(1, %s) u""",
+        (sizes['big_group_members'],)
+    )
+    cur.execute(
+        """INSERT INTO group_members (group_id, user_id)
+           SELECT g, 1 + (g + k * (%s / %s)) %% %s
+           FROM generate_series(2, %s) g, generate_series(0, %s - 1) k""",
+        (users, GROUP_MEMBERS, users, sizes['groups'], GROUP_MEMBERS)
+    )
+
+    # Вся история групповых постов — в большой группе, от её участников
+    cur.execute(
+        """INSERT INTO group_posts (group_id, user_id, content, created_at)
+           SELECT 1, 1 + (i * 7919) %% %s, 'Пост в группе ' || i, now() - make_interval(secs => i * 5)
+           FROM generate_series(1, %s) i""",
+        (sizes['big_group_members'], sizes['group_posts'])
+    )
+
+    # У каждого пользователя около 2 × FRIENDS друзей, первый пользователь —
+    # «знаменитость», дружит со всеми и попадает в ленты через merge on read
+    cur.execute(
+        """INSERT INTO friendships (user_id, friend_id, status)
+           SELECT u, 1 + (u + k * 7919) %% %s, 'accepted'
+           FROM generate_series(2, %s) u, generate_series(1, %s) k
+           WHERE 1 + (u + k * 7919) %% %s <> u
+           ON CONFLICT DO NOTHING""",
+        (users, users, FRIENDS, users)
+    )
+    cur.execute(
+        """INSERT INTO friendships (user_id, friend_id, status)
+           SELECT 1, u, 'accepted' FROM generate_series(2, %s) u
+           ON CONFLICT DO NOTHING""",
+        (users,)
+    )
+
+    for table in SEED_TABLES:
+        cur.execute(f'ALTER TABLE {table} ENABLE TRIGGER USER')
+    conn.commit()
+    cur.execute(DERIVED_SQL.read_text(encoding='utf-8'))
+    conn.commit()
+
+    conn.autocommit = True
+    cur.execute('VACUUM ANALYZE')
+    conn.autocommit = False
+    cur.close()
+
+
+# Модули timing.py и db.py каждой функции: их счётчики печатаются после прогона
+INSTRUMENTS = {}
+DATABASES = {}
+
+
+def load_handler(function: str):
+    """
+    Импортирует backend/<function>/index.py под отдельным именем. Общие модули
+    (db, responses, ...) у каждой функции свои, как при раздельном деплое:
+    на время импорта их имена убираются из sys.modules.
+    """
+    path = BACKEND / function
+    local = {p.stem for p in path.glob('*.py')} - {'index'}
+    saved = {name: sys.modules.pop(name) for name in local if name in sys.modules}
+    sys.path.insert(0, str(path))
+    try:
+        spec = importlib.util.spec_from_file_location(f'loadtest_{function}', path / 'index.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if 'timing' in sys.modules:
+            INSTRUMENTS[function] = sys.modules['timing']
+        if 'db' in sys.modules:
+            DATABASES[function] = sys.modules['db']
+    finally:
+        sys.path.remove(str(path))
+        for name in local:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+    return module.handler
+
+
+class Context:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.function_name = 'loadtest'
+
+
+def _get(params: dict = None, headers: dict = None) -> dict:
+    return {'httpMethod': 'GET', 'queryStringParameters': params or {}, 'headers': headers or {}, 'body': ''}
+
+
+def _send(method: str, body: dict, headers: dict = None) -> dict:
+    return {
+        'httpMethod': method,
+        'queryStringParameters': {},
+        'headers': {'Content-Type': 'application/json', **(headers or {})},
+        'body': json.dumps(body, ensure_ascii=False)
+    }
+
+
+class Workload:
+    """Генераторы событий для сценариев; данные берутся из заполненной базы."""
+
+    def __init__(self, conn, handlers: dict):
+        cur = conn.cursor()
+        cur.execute('SELECT min(id), max(id) FROM users')
+        self.min_user, self.max_user = cur.fetchone()
+        cur.execute('SELECT from_user_id, to_user_id FROM messages WHERE to_user_id IS NOT NULL ORDER BY id DESC LIMIT 1000')
+        self.pairs = cur.fetchall() or [(self.min_user, self.max_user)]
+        cur.execute('SELECT user_id FROM group_members WHERE group_id = 1 LIMIT 1000')
+        self.big_group = [row[0] for row in cur.fetchall()] or [self.min_user]
+        cur.close()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+        page = json.loads(handlers['posts'](_get(), Context('warmup'))['body'])
+        self.feed_cursor = page.get('nextCursor')
+        self.feed_etag = handlers['posts'](_get(), Context('warmup'))['headers'].get('ETag')
+
+    def user(self, rng) -> int:
+        return rng.randint(self.min_user, self.max_user)
+
+    def group_member(self, rng) -> int:
+        return rng.choice(self.big_group)
+
+    def pair(self, rng) -> tuple:
+        return rng.choice(self.pairs)
+
+    def unique(self) -> int:
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def phone(self, user_id: int) -> str:
+        return '+7900' + str(user_id).zfill(7)
+
+
+def _provision_csv(prefix: str, rows: int) -> str:
+    # Каждая десятая строка повторяет предыдущий номер и вернётся как duplicate
+    lines = ['phone,fullName,position,password']
+    for i in range(rows):
+        lines.append(f'{prefix}{i - (i % 10 == 9):04d},Сотрудник {i},Стажёр,{PASSWORD}')
+    return '\n'.join(lines)
+
+
+SCENARIOS = {
+    'posts.feed': ('posts', lambda w, rng: _get()),
+    'posts.feed.page': ('posts', lambda w, rng: _get({'before': w.feed_cursor, 'limit': '50'})),
+    'posts.feed.304': ('posts', lambda w, rng: _get(headers={'If-None-Match': w.feed_etag})),
+    'posts.home': ('posts', lambda w, rng: _get({'view': 'home', 'userId': str(w.user(rng))})),
+    'posts.search': ('posts', lambda w, rng: _get({'action': 'search', 'q': rng.choice(SEARCH_TERMS)})),
+    'posts.create': ('posts', lambda w, rng: _send('POST', {'userId': w.user(rng), 'content': 'Нагрузочный пост'})),
+    'posts.batch': ('posts', lambda w, rng: _send('POST', {
+        'items': [{'userId': w.user(rng), 'content': f'Пакетный пост {i}'} for i in range(50)]
+    })),
+    'messages.feed': ('messages', lambda w, rng: _get({'userId': str(w.user(rng))})),
+    'messages.conversations': ('messages', lambda w, rng: _get({'userId': str(w.user(rng)), 'view': 'conversations'})),
+    'messages.thread': ('messages', lambda w, rng: _get(dict(zip(('userId', 'peerId'), map(str, w.pair(rng)))))),
+    'messages.search': ('messages', lambda w, rng: _get({
+        'action': 'search', 'userId': str(w.user(rng)), 'q': rng.choice(SEARCH_TERMS)
+    })),
+    'messages.send': ('messages', lambda w, rng: _send('POST', dict(
+        zip(('fromUserId', 'toUserId'), w.pair(rng)), content='Нагрузочное сообщение'
+    ))),
+    'messages.read': ('messages', lambda w, rng: _send('POST', dict(
+        zip(('peerId', 'userId'), w.pair(rng)), action='read'
+    ))),
+    'groups.list': ('groups', lambda w, rng: _get()),
+    'groups.user': ('groups', lambda w, rng: _get({'userId': str(w.user(rng))})),
+    'groups.feed': ('groups', lambda w, rng: _get({'groupId': '1', 'userId': str(w.group_member(rng))})),
+    'groups.post': ('groups', lambda w, rng: _send('POST', {
+        'action': 'post', 'groupId': 1, 'userId': w.group_member(rng), 'content': 'Нагрузочный пост в группе'
+    })),
+    'groups.create': ('groups', lambda w, rng: _send('POST', {'name': f'Группа нагрузки {w.unique()}', 'userId': w.user(rng)})),
+    'notifications.list': ('notifications', lambda w, rng: _get({'userId': str(w.user(rng))})),
+    'notifications.count': ('notifications', lambda w, rng: _get({'userId': str(w.user(rng)), 'view': 'count'})),
+    'notifications.read': ('notifications', lambda w, rng: _send('POST', {'action': 'read', 'userId': w.user(rng)})),
+    'notifications.drain': ('notifications', lambda w, rng: _send(
+        'POST', {'action': 'drain'}, {'X-Drain-Token': SERVICE_TOKEN}
+    )),
+    'dashboard.bootstrap': ('dashboard', lambda w, rng: _get({'userId': str(w.user(rng))})),
+    'auth.login': ('auth', lambda w, rng: _send('POST', {
+        'action': 'login', 'phone': w.phone(w.user(rng)), 'password': PASSWORD
+    })),
+    'auth.register': ('auth', lambda w, rng: _send('POST', {
+        'action': 'register', 'phone': f'+7800{os.getpid() % 1000:03d}{w.unique():06d}',
+        'fullName': 'Новый пользователь', 'password': PASSWORD
+    })),
+    'auth.provision': ('auth', lambda w, rng: _send('POST', {
+        'action': 'provision',
+        'csv': _provision_csv(f'+7700{os.getpid() % 1000:03d}{w.unique():06d}', PROVISION_ROWS)
+    }, {'X-Provision-Token': SERVICE_TOKEN})),
+    'auth.update': ('auth', lambda w, rng: _send('PUT', {'userId': w.user(rng), 'bio': f'Обновлено {w.unique()}'})),
+}
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+def run_scenario(name: str, handler, factory, workload: Workload, requests: int, concurrency: int, seed_value: int) -> dict:
+    rng = random.Random(seed_value)
+    events = [factory(workload, rng) for _ in range(requests)]
+    warmup = max(1, concurrency)
+    for i in range(warmup):
+        handler(events[i % len(events)], Context(f'{name}-warmup-{i}'))
+
+    def call(i: int):
+        started = time.perf_counter()
+        response = handler(events[i], Context(f'{name}-{i}'))
+        return (time.perf_counter() - started) * 1000, response.get('statusCode', 500)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    timings = sorted(ms for ms, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': requests / elapsed,
+        'mean': sum(timings) / len(timings),
+        'p50': _percentile(timings, 0.50),
+        'p95': _percentile(timings, 0.95),
+        'p99': _percentile(timings, 0.99),
+    }
+
+
+def check_dashboard(handlers: dict, workload: Workload, users: int = 5) -> list:
+    """
+    Разделы dashboard против ответов отдельных функций для нескольких
+    пользователей (до нагрузки, пока данные не меняются); возвращает расхождения.
+    """
+    def body(function: str, params: dict) -> dict:
+        return json.loads(handlers[function](_get(params), Context('check'))['body'])
+
+    mismatches = []
+    rng = random.Random(0)
+    for _ in range(users):
+        user_id = str(workload.user(rng))
+        dashboard = body('dashboard', {'userId': user_id})
+        expected = {
+            'feed': body('posts', {}),
+            'messages': body('messages', {'userId': user_id}),
+            'groups': body('groups', {'userId': user_id})['groups'],
+            'unread.notifications': body('notifications', {'userId': user_id, 'view': 'count'})['unreadCount'],
+        }
+        actual = {
+            'feed': dashboard.get('feed'),
+            'messages': dashboard.get('messages'),
+            'groups': dashboard.get('groups'),
+            'unread.notifications': dashboard.get('unread', {}).get('notifications'),
+        }
+        mismatches += [f'user {user_id}: {name}' for name in expected if expected[name] != actual[name]]
+    return mismatches
+
+
+def compare(results: dict, baseline: dict, tolerance: float, floor_ms: float) -> list:
+    """Сценарии, у которых p95 или пропускная способность хуже базовых больше чем на tolerance."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if current['p95'] > base['p95'] * (1 + tolerance) and current['p95'] - base['p95'] > floor_ms:
+            regressions.append(f'{name}: p95 {base["p95"]:.2f} -> {current["p95"]:.2f} ms')
+        if current['rps'] < base['rps'] / (1 + tolerance):
+            regressions.append(f'{name}: rps {base["rps"]:.1f} -> {current["rps"]:.1f}')
+        if current['errors'] > base['errors']:
+            regressions.append(f'{name}: errors {base["errors"]} -> {current["errors"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=float, default=0.01, help='доля от полного объёма данных')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-n', '--requests', type=int, default=500, help='запросов на сценарий')
+    parser.add_argument('-s', '--scenario', action='append', help='префикс сценария, можно несколько раз')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--datadir', help='каталог базы, сохраняется между запусками')
+    parser.add_argument('--port', type=int, default=55432)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', metavar='NAME', help='сохранить результат в baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='сравнить с baselines/NAME.json')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--floor-ms', type=float, default=1.0, help='минимальный прирост p95, который считается регрессией')
+    args = parser.parse_args()
+
+    server = None
+    if args.dsn:
+        dsn = args.dsn
+        conn = psycopg2.connect(dsn)
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('users') IS NOT NULL")
+        fresh = not cur.fetchone()[0]
+        cur.close()
+    else:
+        server = LocalPostgres(args.datadir, args.port)
+        server.start()
+        dsn = server.dsn
+        conn = psycopg2.connect(dsn)
+        fresh = server.fresh
+
+    try:
+        if fresh:
+            apply_migrations(conn)
+            seed(conn, args.scale)
+
+        os.environ['DATABASE_URL'] = dsn
+        os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+        os.environ['NOTIFICATIONS_DRAIN_TOKEN'] = SERVICE_TOKEN
+        os.environ['PROVISION_TOKEN'] = SERVICE_TOKEN
+        handlers = {name: load_handler(name) for name in ('posts', 'messages', 'groups', 'auth', 'notifications', 'dashboard')}
+        workload = Workload(conn, handlers)
+
+        selected = [
+            name for name in SCENARIOS
+            if not args.scenario or any(name.startswith(prefix) for prefix in args.scenario)
+        ]
+        if any(name.startswith('dashboard') for name in selected):
+            mismatches = check_dashboard(handlers, workload)
+            for mismatch in mismatches:
+                print(f'dashboard differs from the separate function: {mismatch}', file=sys.stderr)
+            if mismatches:
+                sys.exit(1)
+
+        results = {}
+        for instrument in INSTRUMENTS.values():
+            instrument.reset_stats()
+        print(f'{"scenario":<26}{"rps":>10}{"mean":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"err":>6}')
+        for index, name in enumerate(selected):
+            function, factory = SCENARIOS[name]
+            r = run_scenario(name, handlers[function], factory, workload, args.requests, args.concurrency, args.seed + index)
+            results[name] = r
+            print(
+                f'{name:<26}{r["rps"]:>10.1f}{r["mean"]:>9.2f}{r["p50"]:>9.2f}{r["p95"]:>9.2f}{r["p99"]:>9.2f}{r["errors"]:>6}',
+                flush=True
+            )
+
+        # Среднее время по фазам из счётчиков timing.py (прогрев учитывается)
+        phases = {}
+        print(f'\n{"function":<12}{"queries/req":>12}{"rows/req":>10}{"bytes/req":>11}  phases ms/req')
+        for function, instrument in INSTRUMENTS.items():
+            item = instrument.stats().get(function)
+            if not item:
+                continue
+            requests = item['requests']
+            phases[function] = {name: ms / requests for name, ms in item['phases'].items()}
+            breakdown = ' '.join(f'{name}={ms:.2f}' for name, ms in phases[function].items())
+            print(
+                f'{function:<12}{item["queries"] / requests:>12.2f}{item["rows"] / requests:>10.1f}'
+                f'{item["bytes"] / requests:>11.0f}  {breakdown}'
+            )
+
+        # С DATABASE_REPLICA_URLS — куда ушли чтения и отставание реплик
+        for function, database in DATABASES.items():
+            routing = database.routing_stats()
+            if routing['decisions']:
+                lags = ' '.join(f'replica{r["index"]}={r["lagSeconds"]}s' for r in routing['replicas'])
+                print(f'{function:<12}routing {routing["decisions"]} lag {lags}')
+
+        cur = conn.cursor()
+        cur.execute('SHOW server_version')
+        meta = {
+            'createdAt': datetime.now().isoformat(timespec='seconds'),
+            'scale': args.scale,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'python': platform.python_version(),
+            'postgres': cur.fetchone()[0],
+        }
+        cur.close()
+    finally:
+        conn.close()
+        if server is not None:
+            server.stop()
+
+    if args.save:
+        BASELINES.mkdir(exist_ok=True)
+        path = BASELINES / f'{args.save}.json'
+        path.write_text(json.dumps({'meta': meta, 'results': results, 'phases': phases}, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f'baseline saved: {path}')
+
+    if args.compare:
+        baseline = json.loads((BASELINES / f'{args.compare}.json').read_text(encoding='utf-8'))
+        if baseline['meta'].get('scale') != args.scale or baseline['meta'].get('concurrency') != args.concurrency:
+            print(f'warning: baseline recorded with {baseline["meta"]}', file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print('no regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+-- Индекс для keyset-пагинации ленты постов: (created_at, id) по убыванию, только модерированные
+CREATE INDEX IF NOT EXISTS idx_posts_feed ON posts(created_at DESC, id DESC) WHERE is_moderated = true;
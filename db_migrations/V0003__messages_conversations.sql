@@ -0,0 +1,100 @@
+-- Индексы под ленту сообщений пользователя: три упорядоченных потока
+-- (входящие, исходящие, общий канал), которые сливаются в одном запросе
+CREATE INDEX IF NOT EXISTS idx_messages_to_user_created ON messages(to_user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_from_user_created ON messages(from_user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_broadcast ON messages(created_at DESC, id DESC) WHERE to_user_id IS NULL;
+
+-- Переписка двух пользователей
+CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(to_user_id, from_user_id, created_at DESC, id DESC);
+
+-- Старые индексы покрываются новыми составными
+DROP INDEX IF EXISTS idx_messages_from_user;
+DROP INDEX IF EXISTS idx_messages_to_user;
+
+-- Сводка по диалогам: последнее сообщение и число непрочитанных.
+-- peer_id = 0 и user_id = 0 — общий канал (одна строка на всех)
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id INTEGER NOT NULL,
+    peer_id INTEGER NOT NULL,
+    last_message_id INTEGER NOT NULL,
+    last_from_user_id INTEGER NOT NULL,
+    last_content TEXT NOT NULL,
+    last_message_at TIMESTAMP NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, peer_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversations_inbox ON conversations(user_id, last_message_at DESC);
+
+-- Отметка прочтения общего канала для каждого пользователя
+CREATE TABLE IF NOT EXISTS broadcast_reads (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    last_read_at TIMESTAMP NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION messages_update_conversations() RETURNS trigger AS $$
+BEGIN
+    IF NEW.to_user_id IS NULL THEN
+        INSERT INTO conversations (user_id, peer_id, last_message_id, last_from_user_id, last_content, last_message_at)
+        VALUES (0, 0, NEW.id, NEW.from_user_id, NEW.content, NEW.created_at)
+        ON CONFLICT (user_id, peer_id) DO UPDATE SET
+            last_message_id = EXCLUDED.last_message_id,
+            last_from_user_id = EXCLUDED.last_from_user_id,
+            last_content = EXCLUDED.last_content,
+            last_message_at = EXCLUDED.last_message_at;
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO conversations (user_id, peer_id, last_message_id, last_from_user_id, last_content, last_message_at)
+    VALUES (NEW.from_user_id, NEW.to_user_id, NEW.id, NEW.from_user_id, NEW.content, NEW.created_at)
+    ON CONFLICT (user_id, peer_id) DO UPDATE SET
+        last_message_id = EXCLUDED.last_message_id,
+        last_from_user_id = EXCLUDED.last_from_user_id,
+        last_content = EXCLUDED.last_content,
+        last_message_at = EXCLUDED.last_message_at;
+
+    IF NEW.to_user_id <> NEW.from_user_id THEN
+        INSERT INTO conversations (user_id, peer_id, last_message_id, last_from_user_id, last_content, last_message_at, unread_count)
+        VALUES (NEW.to_user_id, NEW.from_user_id, NEW.id, NEW.from_user_id, NEW.content, NEW.created_at, 1)
+        ON CONFLICT (user_id, peer_id) DO UPDATE SET
+            last_message_id = EXCLUDED.last_message_id,
+            last_from_user_id = EXCLUDED.last_from_user_id,
+            last_content = EXCLUDED.last_content,
+            last_message_at = EXCLUDED.last_message_at,
+            unread_count = conversations.unread_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS messages_conversations ON messages;
+CREATE TRIGGER messages_conversations
+    AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_update_conversations();
+
+-- Заполнение сводки по уже существующим сообщениям
+INSERT INTO conversations (user_id, peer_id, last_message_id, last_from_user_id, last_content, last_message_at)
+SELECT DISTINCT ON (owner_id, peer_id) owner_id, peer_id, id, from_user_id, content, created_at
+FROM (
+    SELECT from_user_id AS owner_id, to_user_id AS peer_id, id, from_user_id, content, created_at
+    FROM messages WHERE to_user_id IS NOT NULL
+    UNION ALL
+    SELECT to_user_id, from_user_id, id, from_user_id, content, created_at
+    FROM messages WHERE to_user_id IS NOT NULL AND to_user_id <> from_user_id
+    UNION ALL
+    SELECT 0, 0, id, from_user_id, content, created_at
+    FROM messages WHERE to_user_id IS NULL
+) s
+WHERE created_at IS NOT NULL
+ORDER BY owner_id, peer_id, created_at DESC, id DESC
+ON CONFLICT (user_id, peer_id) DO NOTHING;
+
+UPDATE conversations c
+SET unread_count = u.cnt
+FROM (
+    SELECT to_user_id, from_user_id, COUNT(*) AS cnt
+    FROM messages
+    WHERE is_read = false AND to_user_id IS NOT NULL AND to_user_id <> from_user_id
+    GROUP BY to_user_id, from_user_id
+) u
+WHERE c.user_id = u.to_user_id AND c.peer_id = u.from_user_id;
@@ -0,0 +1,26 @@
+-- Денормализованное число участников группы, поддерживается триггером
+ALTER TABLE groups ADD COLUMN IF NOT EXISTS member_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE groups g
+SET member_count = (SELECT COUNT(*) FROM group_members gm WHERE gm.group_id = g.id);
+
+CREATE OR REPLACE FUNCTION group_members_update_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE groups SET member_count = member_count + 1 WHERE id = NEW.group_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE groups SET member_count = member_count - 1 WHERE id = OLD.group_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS group_members_count ON group_members;
+CREATE TRIGGER group_members_count
+    AFTER INSERT OR DELETE ON group_members
+    FOR EACH ROW EXECUTE FUNCTION group_members_update_count();
+
+-- Индексы для списка групп пользователя и общего списка
+CREATE INDEX IF NOT EXISTS idx_group_members_user ON group_members(user_id);
+CREATE INDEX IF NOT EXISTS idx_groups_created_by ON groups(created_by);
+CREATE INDEX IF NOT EXISTS idx_groups_created_at ON groups(created_at DESC, id DESC);
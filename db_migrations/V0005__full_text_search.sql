@@ -0,0 +1,14 @@
+-- Полнотекстовый поиск по постам и сообщениям: сгенерированная колонка
+-- tsvector с конфигурацией russian и GIN-индекс по ней.
+-- ADD COLUMN ... STORED переписывает таблицу, миграцию лучше выполнять
+-- в окно низкой нагрузки
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('russian', coalesce(content, ''))) STORED;
+
+-- В поиск попадают только опубликованные посты, как и в ленту
+CREATE INDEX IF NOT EXISTS idx_posts_search ON posts USING GIN (search_vector) WHERE is_moderated = true;
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('russian', coalesce(content, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_messages_search ON messages USING GIN (search_vector);
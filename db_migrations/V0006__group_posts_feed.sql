@@ -0,0 +1,6 @@
+-- Лента группы: страница читается диапазоном индекса по (group_id, created_at, id),
+-- поэтому её стоимость не зависит от длины истории группы
+CREATE INDEX IF NOT EXISTS idx_group_posts_feed ON group_posts(group_id, created_at DESC, id DESC);
+
+-- Проверка членства (group_id, user_id) обслуживается индексом ограничения
+-- UNIQUE(group_id, user_id) из V0001, отдельный индекс не нужен
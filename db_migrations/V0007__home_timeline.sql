@@ -0,0 +1,178 @@
+-- Домашняя лента: посты принятых друзей и посты в группах пользователя.
+-- Гибридная схема: пост обычного автора при вставке раскладывается триггером
+-- в timeline_entries всех получателей (fan-out on write), посты авторов
+-- с большим числом друзей и посты больших групп не раскладываются, а
+-- подмешиваются при чтении (merge on read). Порог, размер ленты и частота
+-- обрезки задаются аргументами триггеров.
+
+-- Число принятых друзей, поддерживается триггером
+ALTER TABLE users ADD COLUMN IF NOT EXISTS friend_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_friendships_friend_accepted ON friendships(friend_id) WHERE status = 'accepted';
+CREATE INDEX IF NOT EXISTS idx_friendships_user_accepted ON friendships(user_id) WHERE status = 'accepted';
+
+-- Посты автора для подмешивания при чтении
+CREATE INDEX IF NOT EXISTS idx_posts_author_feed ON posts(user_id, created_at DESC, id DESC) WHERE is_moderated = true;
+
+-- source: 'post' — posts, 'group' — group_posts
+CREATE TABLE IF NOT EXISTS timeline_entries (
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    source VARCHAR(10) NOT NULL,
+    post_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, source, post_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_timeline_entries_feed ON timeline_entries(user_id, created_at DESC, source DESC, post_id DESC);
+
+-- Дружба симметрична: строка (user_id, friend_id) связывает обоих
+CREATE OR REPLACE FUNCTION accepted_friends(author INTEGER) RETURNS SETOF INTEGER AS $$
+    SELECT friend_id FROM friendships WHERE user_id = author AND status = 'accepted'
+    UNION
+    SELECT user_id FROM friendships WHERE friend_id = author AND status = 'accepted';
+$$ LANGUAGE sql STABLE;
+
+-- Оставляет в ленте каждого из recipients не больше keep самых свежих записей
+CREATE OR REPLACE FUNCTION timeline_trim(recipients INTEGER[], keep INTEGER) RETURNS void AS $$
+    DELETE FROM timeline_entries t
+    USING (
+        SELECT r.user_id, c.created_at, c.source, c.post_id
+        FROM unnest(recipients) AS r(user_id)
+        CROSS JOIN LATERAL (
+            SELECT e.created_at, e.source, e.post_id
+            FROM timeline_entries e
+            WHERE e.user_id = r.user_id
+            ORDER BY e.created_at DESC, e.source DESC, e.post_id DESC
+            OFFSET keep LIMIT 1
+        ) c
+    ) cutoff
+    WHERE t.user_id = cutoff.user_id
+      AND (t.created_at, t.source, t.post_id) <= (cutoff.created_at, cutoff.source, cutoff.post_id);
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION friendships_update_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'accepted' THEN
+        UPDATE users SET friend_count = friend_count - 1 WHERE id IN (OLD.user_id, OLD.friend_id);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'accepted' THEN
+        UPDATE users SET friend_count = friend_count + 1 WHERE id IN (NEW.user_id, NEW.friend_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS friendships_count ON friendships;
+CREATE TRIGGER friendships_count
+    AFTER INSERT OR UPDATE OF status OR DELETE ON friendships
+    FOR EACH ROW EXECUTE FUNCTION friendships_update_count();
+
+-- Аргументы: порог друзей для fan-out, размер ленты, обрезка каждого N-го поста
+CREATE OR REPLACE FUNCTION posts_timeline_fanout() RETURNS trigger AS $$
+DECLARE
+    fanout_limit INTEGER := TG_ARGV[0]::integer;
+    keep INTEGER := TG_ARGV[1]::integer;
+    trim_every INTEGER := TG_ARGV[2]::integer;
+    recipients INTEGER[];
+BEGIN
+    IF NOT COALESCE(NEW.is_moderated, false) THEN
+        RETURN NULL;
+    END IF;
+
+    -- Автор всегда видит свой пост; друзьям пост раскладывается,
+    -- только если друзей не больше порога
+    WITH ins AS (
+        INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+        SELECT r.user_id, COALESCE(NEW.created_at, now()), 'post', NEW.id, NEW.user_id
+        FROM (
+            SELECT NEW.user_id AS user_id
+            UNION
+            SELECT f FROM accepted_friends(NEW.user_id) f
+            WHERE (SELECT friend_count FROM users WHERE id = NEW.user_id) <= fanout_limit
+        ) r
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    )
+    SELECT array_agg(user_id) INTO recipients FROM ins;
+
+    IF NEW.id % trim_every = 0 THEN
+        PERFORM timeline_trim(recipients, keep);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION group_posts_timeline_fanout() RETURNS trigger AS $$
+DECLARE
+    fanout_limit INTEGER := TG_ARGV[0]::integer;
+    keep INTEGER := TG_ARGV[1]::integer;
+    trim_every INTEGER := TG_ARGV[2]::integer;
+    recipients INTEGER[];
+BEGIN
+    WITH ins AS (
+        INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+        SELECT r.user_id, COALESCE(NEW.created_at, now()), 'group', NEW.id, NEW.user_id
+        FROM (
+            SELECT NEW.user_id AS user_id
+            UNION
+            SELECT gm.user_id FROM group_members gm
+            WHERE gm.group_id = NEW.group_id
+              AND (SELECT member_count FROM groups WHERE id = NEW.group_id) <= fanout_limit
+        ) r
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    )
+    SELECT array_agg(user_id) INTO recipients FROM ins;
+
+    IF NEW.id % trim_every = 0 THEN
+        PERFORM timeline_trim(recipients, keep);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Порог 1000 получателей, лента на 800 записей, обрезка на каждом 20-м посте.
+-- Порог должен совпадать с TIMELINE_FANOUT_LIMIT в backend/posts
+DROP TRIGGER IF EXISTS posts_timeline ON posts;
+CREATE TRIGGER posts_timeline
+    AFTER INSERT ON posts
+    FOR EACH ROW EXECUTE FUNCTION posts_timeline_fanout(1000, 800, 20);
+
+DROP TRIGGER IF EXISTS group_posts_timeline ON group_posts;
+CREATE TRIGGER group_posts_timeline
+    AFTER INSERT ON group_posts
+    FOR EACH ROW EXECUTE FUNCTION group_posts_timeline_fanout(1000, 800, 20);
+
+-- Заполнение счётчиков и лент по постам последних 30 дней
+UPDATE users u
+SET friend_count = (
+    SELECT COUNT(*) FROM friendships f
+    WHERE f.status = 'accepted' AND (f.user_id = u.id OR f.friend_id = u.id)
+);
+
+INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+SELECT r.user_id, p.created_at, 'post', p.id, p.user_id
+FROM posts p
+JOIN users a ON a.id = p.user_id
+CROSS JOIN LATERAL (
+    SELECT p.user_id AS user_id
+    UNION
+    SELECT f FROM accepted_friends(p.user_id) f WHERE a.friend_count <= 1000
+) r
+WHERE p.is_moderated = true AND p.created_at > now() - INTERVAL '30 days'
+ON CONFLICT DO NOTHING;
+
+INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+SELECT r.user_id, gp.created_at, 'group', gp.id, gp.user_id
+FROM group_posts gp
+JOIN groups g ON g.id = gp.group_id
+CROSS JOIN LATERAL (
+    SELECT gp.user_id AS user_id
+    UNION
+    SELECT gm.user_id FROM group_members gm WHERE gm.group_id = gp.group_id AND g.member_count <= 1000
+) r
+WHERE gp.created_at > now() - INTERVAL '30 days'
+ON CONFLICT DO NOTHING;
+
+SELECT timeline_trim(ARRAY(SELECT DISTINCT user_id FROM timeline_entries), 800);
@@ -0,0 +1,113 @@
+-- Очередь событий для уведомлений. Запись в messages, posts, groups,
+-- group_members и group_posts кладёт в очередь одну строку на событие
+-- в той же транзакции (триггеры уровня оператора), а раскладка по получателям
+-- в notifications выполняется отдельным обработчиком очереди
+-- (backend/notifications/worker.py), вне пути ответа на запрос.
+CREATE TABLE IF NOT EXISTS notification_events (
+    id BIGSERIAL PRIMARY KEY,
+    type VARCHAR(50) NOT NULL,
+    actor_id INTEGER NOT NULL,
+    target_user_id INTEGER,
+    group_id INTEGER,
+    post_id INTEGER,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Список уведомлений пользователя и счётчик непрочитанных
+CREATE INDEX IF NOT EXISTS idx_notifications_feed ON notifications(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications(user_id) WHERE is_read = false;
+
+-- Старые индексы покрываются новыми
+DROP INDEX IF EXISTS idx_notifications_user;
+DROP INDEX IF EXISTS idx_notifications_unread;
+
+CREATE OR REPLACE FUNCTION messages_enqueue_notifications() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO notification_events (type, actor_id, target_user_id, content, created_at)
+    SELECT 'message', n.from_user_id, n.to_user_id, left(n.content, 200), COALESCE(n.created_at, now())
+    FROM new_rows n
+    WHERE n.to_user_id IS NOT NULL AND n.to_user_id <> n.from_user_id;
+    IF FOUND THEN
+        PERFORM pg_notify('notification_events', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION posts_enqueue_notifications() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO notification_events (type, actor_id, post_id, content, created_at)
+    SELECT 'post', n.user_id, n.id, left(n.content, 200), COALESCE(n.created_at, now())
+    FROM new_rows n
+    WHERE n.is_moderated = true;
+    IF FOUND THEN
+        PERFORM pg_notify('notification_events', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION groups_enqueue_notifications() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO notification_events (type, actor_id, group_id, content, created_at)
+    SELECT 'group_created', n.created_by, n.id, n.name, COALESCE(n.created_at, now())
+    FROM new_rows n;
+    IF FOUND THEN
+        PERFORM pg_notify('notification_events', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Вступление создателя при создании группы событием не считается
+CREATE OR REPLACE FUNCTION group_members_enqueue_notifications() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO notification_events (type, actor_id, target_user_id, group_id, content, created_at)
+    SELECT 'group_join', n.user_id, g.created_by, n.group_id, g.name, COALESCE(n.joined_at, now())
+    FROM new_rows n
+    JOIN groups g ON g.id = n.group_id
+    WHERE g.created_by <> n.user_id;
+    IF FOUND THEN
+        PERFORM pg_notify('notification_events', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION group_posts_enqueue_notifications() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO notification_events (type, actor_id, group_id, post_id, content, created_at)
+    SELECT 'group_post', n.user_id, n.group_id, n.id, left(n.content, 200), COALESCE(n.created_at, now())
+    FROM new_rows n;
+    IF FOUND THEN
+        PERFORM pg_notify('notification_events', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS messages_notifications ON messages;
+CREATE TRIGGER messages_notifications
+    AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION messages_enqueue_notifications();
+
+DROP TRIGGER IF EXISTS posts_notifications ON posts;
+CREATE TRIGGER posts_notifications
+    AFTER INSERT ON posts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION posts_enqueue_notifications();
+
+DROP TRIGGER IF EXISTS groups_notifications ON groups;
+CREATE TRIGGER groups_notifications
+    AFTER INSERT ON groups REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION groups_enqueue_notifications();
+
+DROP TRIGGER IF EXISTS group_members_notifications ON group_members;
+CREATE TRIGGER group_members_notifications
+    AFTER INSERT ON group_members REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION group_members_enqueue_notifications();
+
+DROP TRIGGER IF EXISTS group_posts_notifications ON group_posts;
+CREATE TRIGGER group_posts_notifications
+    AFTER INSERT ON group_posts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION group_posts_enqueue_notifications();
@@ -0,0 +1,131 @@
+-- Помесячное секционирование messages и posts по created_at.
+-- Ключ секционирования обязан входить в первичный ключ, поэтому он становится
+-- (id, created_at), а created_at — NOT NULL. Данные переносятся в новую
+-- секционированную таблицу в транзакции миграции, индексы и триггеры
+-- пересоздаются на родительской таблице и наследуются секциями.
+-- Будущие секции создаёт ensure_monthly_partitions (scripts/partitions.py ensure
+-- по расписанию), старые отсоединяет и выгружает scripts/partitions.py archive.
+
+-- Создаёт недостающие месячные секции <parent>_pYYYY_MM с месяца start_month
+-- по текущий месяц + months_ahead; возвращает число созданных секций
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(
+    parent TEXT,
+    months_ahead INTEGER,
+    start_month DATE DEFAULT now()::date
+) RETURNS INTEGER AS $$
+DECLARE
+    month DATE := date_trunc('month', start_month)::date;
+    last_month DATE := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+    partition TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month <= last_month LOOP
+        partition := format('%s_p%s', parent, to_char(month, 'YYYY_MM'));
+        IF to_regclass(partition) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition, parent, month, (month + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month := (month + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'messages'::regclass) = 'r' THEN
+        ALTER TABLE messages RENAME TO messages_unpartitioned;
+        ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey;
+
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            from_user_id INTEGER NOT NULL REFERENCES users(id),
+            to_user_id INTEGER REFERENCES users(id),
+            group_id INTEGER,
+            content TEXT NOT NULL,
+            is_read BOOLEAN DEFAULT false,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            search_vector tsvector GENERATED ALWAYS AS (to_tsvector('russian', coalesce(content, ''))) STORED,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+        ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+        PERFORM ensure_monthly_partitions(
+            'messages', 3, COALESCE((SELECT min(created_at) FROM messages_unpartitioned)::date, now()::date)
+        );
+
+        INSERT INTO messages (id, from_user_id, to_user_id, group_id, content, is_read, created_at)
+        SELECT id, from_user_id, to_user_id, group_id, content, is_read, COALESCE(created_at, now())
+        FROM messages_unpartitioned;
+
+        DROP TABLE messages_unpartitioned;
+    END IF;
+
+    IF (SELECT relkind FROM pg_class WHERE oid = 'posts'::regclass) = 'r' THEN
+        ALTER TABLE posts RENAME TO posts_unpartitioned;
+        ALTER TABLE posts_unpartitioned RENAME CONSTRAINT posts_pkey TO posts_unpartitioned_pkey;
+
+        CREATE TABLE posts (
+            id INTEGER NOT NULL DEFAULT nextval('posts_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            content TEXT NOT NULL,
+            is_moderated BOOLEAN DEFAULT true,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            search_vector tsvector GENERATED ALWAYS AS (to_tsvector('russian', coalesce(content, ''))) STORED,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+        ALTER SEQUENCE posts_id_seq OWNED BY posts.id;
+
+        PERFORM ensure_monthly_partitions(
+            'posts', 3, COALESCE((SELECT min(created_at) FROM posts_unpartitioned)::date, now()::date)
+        );
+
+        INSERT INTO posts (id, user_id, content, is_moderated, created_at, updated_at)
+        SELECT id, user_id, content, is_moderated, COALESCE(created_at, now()), updated_at
+        FROM posts_unpartitioned;
+
+        DROP TABLE posts_unpartitioned;
+    END IF;
+END;
+$$;
+
+-- Индексы из V0002, V0003, V0005 и V0007 на секционированных таблицах.
+-- idx_posts_created_at из V0001 не восстанавливается: его покрывает idx_posts_feed
+CREATE INDEX IF NOT EXISTS idx_messages_to_user_created ON messages(to_user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_from_user_created ON messages(from_user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_broadcast ON messages(created_at DESC, id DESC) WHERE to_user_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(to_user_id, from_user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_search ON messages USING GIN (search_vector);
+
+CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id);
+CREATE INDEX IF NOT EXISTS idx_posts_feed ON posts(created_at DESC, id DESC) WHERE is_moderated = true;
+CREATE INDEX IF NOT EXISTS idx_posts_author_feed ON posts(user_id, created_at DESC, id DESC) WHERE is_moderated = true;
+CREATE INDEX IF NOT EXISTS idx_posts_search ON posts USING GIN (search_vector) WHERE is_moderated = true;
+
+-- Триггеры из V0003, V0007 и V0008
+DROP TRIGGER IF EXISTS messages_conversations ON messages;
+CREATE TRIGGER messages_conversations
+    AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_update_conversations();
+
+DROP TRIGGER IF EXISTS messages_notifications ON messages;
+CREATE TRIGGER messages_notifications
+    AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION messages_enqueue_notifications();
+
+DROP TRIGGER IF EXISTS posts_timeline ON posts;
+CREATE TRIGGER posts_timeline
+    AFTER INSERT ON posts
+    FOR EACH ROW EXECUTE FUNCTION posts_timeline_fanout(1000, 800, 20);
+
+DROP TRIGGER IF EXISTS posts_notifications ON posts;
+CREATE TRIGGER posts_notifications
+    AFTER INSERT ON posts REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION posts_enqueue_notifications();
+
+ANALYZE messages;
+ANALYZE posts;
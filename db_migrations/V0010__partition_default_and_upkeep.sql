@@ -0,0 +1,95 @@
+-- Секции по умолчанию и самоподдерживающееся создание будущих секций.
+-- Без DEFAULT-секции вставка в messages или posts после последней созданной
+-- секции падает с "no partition of relation found for row". Теперь такие
+-- строки попадают в <parent>_default, а ensure_monthly_partitions при
+-- создании месячной секции переносит в неё строки этого месяца из DEFAULT.
+-- maintain_partitions вызывает scripts/partitions.py ensure, который
+-- запускается по расписанию (например, раз в сутки).
+
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(
+    parent TEXT,
+    months_ahead INTEGER,
+    start_month DATE DEFAULT now()::date
+) RETURNS INTEGER AS $$
+DECLARE
+    month DATE := date_trunc('month', start_month)::date;
+    last_month DATE := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+    next_month DATE;
+    partition TEXT;
+    default_partition TEXT := parent || '_default';
+    columns TEXT;
+    moved BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    -- Обычные (не генерируемые) колонки: ими строки переносятся из DEFAULT
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+    FROM pg_attribute
+    WHERE attrelid = parent::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+    WHILE month <= last_month LOOP
+        partition := format('%s_p%s', parent, to_char(month, 'YYYY_MM'));
+        next_month := (month + INTERVAL '1 month')::date;
+        IF to_regclass(partition) IS NULL THEN
+            -- Новая секция не создаётся, пока в DEFAULT есть строки её диапазона:
+            -- они откладываются во временную таблицу и вставляются прямо в новую
+            -- секцию с выключенными пользовательскими триггерами — строки не новые,
+            -- и сводка диалогов, очередь уведомлений и ленты их уже учли
+            moved := false;
+            IF to_regclass(default_partition) IS NOT NULL THEN
+                EXECUTE format(
+                    'SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= %L AND created_at < %L)',
+                    default_partition, month, next_month
+                ) INTO moved;
+            END IF;
+            IF moved THEN
+                EXECUTE format(
+                    'CREATE TEMP TABLE partition_moved ON COMMIT DROP AS
+                     SELECT %s FROM %I WHERE created_at >= %L AND created_at < %L',
+                    columns, default_partition, month, next_month
+                );
+                EXECUTE format(
+                    'DELETE FROM %I WHERE created_at >= %L AND created_at < %L',
+                    default_partition, month, next_month
+                );
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition, parent, month, next_month
+            );
+            IF moved THEN
+                EXECUTE format('ALTER TABLE %I DISABLE TRIGGER USER', partition);
+                EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM partition_moved', partition, columns, columns);
+                EXECUTE format('ALTER TABLE %I ENABLE TRIGGER USER', partition);
+                DROP TABLE partition_moved;
+            END IF;
+            created := created + 1;
+        END IF;
+        month := next_month;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Будущие секции обеих таблиц и перенос строк, попавших в DEFAULT.
+-- Если уже идёт другой вызов, этот ничего не делает и возвращает 0
+CREATE OR REPLACE FUNCTION maintain_partitions(months_ahead INTEGER DEFAULT 3) RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    oldest DATE;
+    created INTEGER := 0;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('maintain_partitions')) THEN
+        RETURN 0;
+    END IF;
+    FOREACH parent IN ARRAY ARRAY['messages', 'posts'] LOOP
+        EXECUTE format('SELECT min(created_at)::date FROM %I', parent || '_default') INTO oldest;
+        created := created + ensure_monthly_partitions(parent, months_ahead, LEAST(oldest, now()::date));
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT;
+CREATE TABLE IF NOT EXISTS posts_default PARTITION OF posts DEFAULT;
+
+SELECT maintain_partitions();
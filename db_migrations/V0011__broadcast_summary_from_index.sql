@@ -0,0 +1,35 @@
+-- Сводка общего канала больше не хранится в conversations.
+-- Строка (0, 0) обновлялась каждой рассылкой и была горячей: все отправки
+-- в общий канал сериализовались на её блокировке. Последнее сообщение канала
+-- читается одной строкой по частичному индексу idx_messages_broadcast,
+-- непрочитанные — по broadcast_reads, как и раньше.
+
+CREATE OR REPLACE FUNCTION messages_update_conversations() RETURNS trigger AS $$
+BEGIN
+    IF NEW.to_user_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO conversations (user_id, peer_id, last_message_id, last_from_user_id, last_content, last_message_at)
+    VALUES (NEW.from_user_id, NEW.to_user_id, NEW.id, NEW.from_user_id, NEW.content, NEW.created_at)
+    ON CONFLICT (user_id, peer_id) DO UPDATE SET
+        last_message_id = EXCLUDED.last_message_id,
+        last_from_user_id = EXCLUDED.last_from_user_id,
+        last_content = EXCLUDED.last_content,
+        last_message_at = EXCLUDED.last_message_at;
+
+    IF NEW.to_user_id <> NEW.from_user_id THEN
+        INSERT INTO conversations (user_id, peer_id, last_message_id, last_from_user_id, last_content, last_message_at, unread_count)
+        VALUES (NEW.to_user_id, NEW.from_user_id, NEW.id, NEW.from_user_id, NEW.content, NEW.created_at, 1)
+        ON CONFLICT (user_id, peer_id) DO UPDATE SET
+            last_message_id = EXCLUDED.last_message_id,
+            last_from_user_id = EXCLUDED.last_from_user_id,
+            last_content = EXCLUDED.last_content,
+            last_message_at = EXCLUDED.last_message_at,
+            unread_count = conversations.unread_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DELETE FROM conversations WHERE user_id = 0 AND peer_id = 0;
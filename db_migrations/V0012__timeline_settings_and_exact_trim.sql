@@ -0,0 +1,133 @@
+-- Настройки домашней ленты в одном месте и обрезка лент по числу записей.
+-- Порог fan-out раньше был задан дважды: аргументом триггеров (V0007, V0009)
+-- и константой TIMELINE_FANOUT_LIMIT в backend/posts. Теперь его и размер
+-- ленты возвращают функции ниже: их вызывают триггеры и запрос домашней
+-- ленты. Функции IMMUTABLE и подставляются в запрос как константы; чтобы
+-- изменить значение, новая миграция пересоздаёт функцию.
+--
+-- Обрезка выполнялась на каждом 20-м посте (NEW.id % 20), так что лента
+-- получателя могла неограниченно превышать размер, если ему приходили
+-- посты с «неудачными» id. Теперь число записей каждой ленты хранится
+-- в timeline_sizes, и ленту, превысившую timeline_keep() + timeline_trim_slack(),
+-- сразу обрезают до timeline_keep(): в ленте не бывает больше
+-- timeline_keep() + timeline_trim_slack() записей.
+
+CREATE OR REPLACE FUNCTION timeline_fanout_limit() RETURNS INTEGER AS $$
+    SELECT 1000;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION timeline_keep() RETURNS INTEGER AS $$
+    SELECT 800;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Запас сверх timeline_keep(): обрезка одной ленты раз в столько новых записей
+CREATE OR REPLACE FUNCTION timeline_trim_slack() RETURNS INTEGER AS $$
+    SELECT 20;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS timeline_sizes (
+    user_id INTEGER PRIMARY KEY,
+    entries INTEGER NOT NULL
+);
+
+INSERT INTO timeline_sizes (user_id, entries)
+SELECT user_id, COUNT(*) FROM timeline_entries GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET entries = EXCLUDED.entries;
+
+-- Учитывает по одной новой записи в лентах recipients и обрезает до
+-- timeline_keep() ленты, вышедшие за запас. Счётчики обновляются
+-- в порядке user_id, чтобы параллельные раскладки не взаимоблокировались
+CREATE OR REPLACE FUNCTION timeline_account(recipients INTEGER[]) RETURNS void AS $$
+DECLARE
+    overflow INTEGER[];
+BEGIN
+    WITH counted AS (
+        INSERT INTO timeline_sizes (user_id, entries)
+        SELECT r, 1 FROM unnest(recipients) r ORDER BY r
+        ON CONFLICT (user_id) DO UPDATE SET entries = timeline_sizes.entries + 1
+        RETURNING user_id, entries
+    )
+    SELECT array_agg(user_id) INTO overflow
+    FROM counted
+    WHERE entries > timeline_keep() + timeline_trim_slack();
+
+    IF overflow IS NOT NULL THEN
+        PERFORM timeline_trim(overflow, timeline_keep());
+        UPDATE timeline_sizes s
+        SET entries = (SELECT COUNT(*) FROM timeline_entries e WHERE e.user_id = s.user_id)
+        WHERE s.user_id = ANY(overflow);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION posts_timeline_fanout() RETURNS trigger AS $$
+DECLARE
+    recipients INTEGER[];
+BEGIN
+    IF NOT COALESCE(NEW.is_moderated, false) THEN
+        RETURN NULL;
+    END IF;
+
+    -- Автор всегда видит свой пост; друзьям пост раскладывается,
+    -- только если друзей не больше порога
+    WITH ins AS (
+        INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+        SELECT r.user_id, COALESCE(NEW.created_at, now()), 'post', NEW.id, NEW.user_id
+        FROM (
+            SELECT NEW.user_id AS user_id
+            UNION
+            SELECT f FROM accepted_friends(NEW.user_id) f
+            WHERE (SELECT friend_count FROM users WHERE id = NEW.user_id) <= timeline_fanout_limit()
+        ) r
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    )
+    SELECT array_agg(user_id) INTO recipients FROM ins;
+
+    PERFORM timeline_account(recipients);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION group_posts_timeline_fanout() RETURNS trigger AS $$
+DECLARE
+    recipients INTEGER[];
+BEGIN
+    WITH ins AS (
+        INSERT INTO timeline_entries (user_id, created_at, source, post_id, author_id)
+        SELECT r.user_id, COALESCE(NEW.created_at, now()), 'group', NEW.id, NEW.user_id
+        FROM (
+            SELECT NEW.user_id AS user_id
+            UNION
+            SELECT gm.user_id FROM group_members gm
+            WHERE gm.group_id = NEW.group_id
+              AND (SELECT member_count FROM groups WHERE id = NEW.group_id) <= timeline_fanout_limit()
+        ) r
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    )
+    SELECT array_agg(user_id) INTO recipients FROM ins;
+
+    PERFORM timeline_account(recipients);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS posts_timeline ON posts;
+CREATE TRIGGER posts_timeline
+    AFTER INSERT ON posts
+    FOR EACH ROW EXECUTE FUNCTION posts_timeline_fanout();
+
+DROP TRIGGER IF EXISTS group_posts_timeline ON group_posts;
+CREATE TRIGGER group_posts_timeline
+    AFTER INSERT ON group_posts
+    FOR EACH ROW EXECUTE FUNCTION group_posts_timeline_fanout();
+
+-- Ленты, уже вышедшие за размер, обрезаются сразу
+SELECT timeline_trim(array_agg(user_id), timeline_keep())
+FROM timeline_sizes
+WHERE entries > timeline_keep();
+
+UPDATE timeline_sizes s
+SET entries = (SELECT COUNT(*) FROM timeline_entries e WHERE e.user_id = s.user_id)
+WHERE s.entries > timeline_keep();
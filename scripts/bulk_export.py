@@ -0,0 +1,92 @@
+"""
+Полная выгрузка posts, group_posts или messages в файл с постоянным
+расходом памяти.
+
+    python scripts/bulk_export.py messages --from 2024-01-01 --to 2024-07-01 --out messages.csv.gz
+    python scripts/bulk_export.py posts --user 42 --format ndjson --out posts.ndjson.gz
+
+CSV пишется COPY (...) TO STDOUT прямо в файл, NDJSON — построчно из
+именованного курсора (backend/posts/export.py). Запрос и фильтры те же,
+что у action=export функций posts и messages. Файлы с .gz сжимаются,
+без --out выгрузка идёт в stdout.
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend' / 'posts'))
+
+from export import EXPORT_TABLES, export_columns, export_rows, export_sql, row_writer  # noqa: E402
+
+
+def _open(path: str, binary: bool):
+    if path is None:
+        return sys.stdout.buffer if binary else sys.stdout
+    mode = 'wb' if binary else 'wt'
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding=None if binary else 'utf-8', newline=None if binary else '')
+    return open(path, mode, encoding=None if binary else 'utf-8', newline=None if binary else '')
+
+
+def export_csv(conn, table: str, filters: dict, out):
+    """COPY на стороне сервера: строки не проходят через объекты Python."""
+    query, query_params = export_sql(table, filters)
+    cur = conn.cursor()
+    try:
+        sql = cur.mogrify(query, query_params).decode()
+        cur.copy_expert(f'COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)', out)
+        return cur.rowcount
+    finally:
+        cur.close()
+
+
+def export_ndjson(conn, table: str, filters: dict, out) -> int:
+    query, query_params = export_sql(table, filters)
+    write = row_writer('ndjson', export_columns(table), out)
+    rows = 0
+    for row in export_rows(conn, table, query, query_params):
+        write(row)
+        rows += 1
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+    parser.add_argument('--from', dest='since', help='ISO-дата или время, включительно')
+    parser.add_argument('--to', dest='until', help='ISO-дата или время, не включается')
+    parser.add_argument('--user', type=int)
+    parser.add_argument('--group', type=int)
+    parser.add_argument('--out')
+    args = parser.parse_args()
+
+    filters = {'from': args.since, 'to': args.until, 'userId': args.user, 'groupId': args.group}
+    filters = {key: str(value) for key, value in filters.items() if value is not None}
+
+    conn = psycopg2.connect(args.dsn)
+    # Один снимок на всю выгрузку
+    conn.set_session(readonly=True, isolation_level='REPEATABLE READ')
+    started = time.perf_counter()
+    out = _open(args.out, binary=args.format == 'csv')
+    try:
+        if args.format == 'csv':
+            rows = export_csv(conn, args.table, filters, out)
+        else:
+            rows = export_ndjson(conn, args.table, filters, out)
+    finally:
+        if args.out is not None:
+            out.close()
+        conn.close()
+    print(f'{args.table}: {rows} строк за {time.perf_counter() - started:.1f} с', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+Обслуживание месячных секций messages и posts (V0009).
+
+    python scripts/partitions.py ensure --months-ahead 3
+    python scripts/partitions.py archive --older-than 12 --out /var/backups/archive
+    python scripts/partitions.py check
+
+ensure создаёт недостающие будущие секции и переносит строки из DEFAULT-секций
+в их месяцы (maintain_partitions, V0010); запускается по расписанию, например
+раз в сутки: --months-ahead оставляет запас на случай пропущенных запусков.
+archive сначала делает то же, затем отсоединяет секции старше N полных месяцев, выгружает
+каждую в <секция>.csv.gz, сверяет число строк с таблицей, пишет рядом
+<секция>.json с границами и контрольной суммой и удаляет секцию.
+check выполняет EXPLAIN ANALYZE запросов лент из backend/posts и
+backend/messages и показывает, сколько непустых секций (включая DEFAULT)
+прочитал каждый.
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+TABLES = ('messages', 'posts')
+LOCK_TIMEOUT = '5s'
+
+
+def _month_start(months_back: int) -> date:
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partitions(cur, parent: str) -> list:
+    """Секции родительской таблицы: [(имя, первый день месяца)], по возрастанию."""
+    cur.execute(
+        """SELECT c.relname FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = %s::regclass""",
+        (parent,)
+    )
+    result = []
+    for (name,) in cur.fetchall():
+        suffix = name[len(parent) + 2:]
+        try:
+            month = datetime.strptime(suffix, '%Y_%m').date()
+        except ValueError:
+            continue  # секция не из ensure_monthly_partitions, не трогаем
+        result.append((name, month))
+    return sorted(result, key=lambda item: item[1])
+
+
+def default_partition(cur, parent: str) -> str:
+    """Имя DEFAULT-секции или None."""
+    cur.execute(
+        """SELECT c.relname FROM pg_partitioned_table p
+           JOIN pg_class c ON c.oid = p.partdefid
+           WHERE p.partrelid = %s::regclass""",
+        (parent,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def ensure(conn, months_ahead: int) -> int:
+    """Будущие секции и перенос строк из DEFAULT (maintain_partitions из V0010)."""
+    cur = conn.cursor()
+    cur.execute('SELECT maintain_partitions(%s)', (months_ahead,))
+    created = cur.fetchone()[0]
+    conn.commit()
+    for table in TABLES:
+        name = default_partition(cur, table)
+        if name:
+            cur.execute(f'SELECT COUNT(*) FROM "{name}"')
+            print(f'{name}: строк вне месячных секций {cur.fetchone()[0]}')
+    conn.rollback()
+    cur.close()
+    print(f'создано секций {created}')
+    return created
+
+
+def _export(cur, partition: str, path: Path) -> str:
+    """Выгружает секцию в gzip CSV через COPY; возвращает sha256 файла."""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with gzip.open(tmp, 'wb') as out:
+        cur.copy_expert(f'COPY "{partition}" TO STDOUT WITH (FORMAT csv, HEADER true)', out)
+    digest = hashlib.sha256()
+    with open(tmp, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    tmp.replace(path)
+    return digest.hexdigest()
+
+
+def _count_exported(path: Path) -> int:
+    # csv.reader, а не подсчёт строк: в content бывают переводы строк
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        return sum(1 for _ in csv.reader(f)) - 1
+
+
+def archive(conn, older_than: int, out_dir: Path, keep_detached: bool = False, dry_run: bool = False):
+    """
+    Архивирует секции, целиком лежащие раньше начала месяца older_than назад.
+    Секция сначала отсоединяется (родитель блокируется на время DETACH, дальше
+    запросы к ленте её не видят), затем выгружается и сверяется; если сверка
+    не сошлась, отсоединённая секция остаётся в базе.
+    """
+    cutoff = _month_start(older_than)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if not dry_run:
+        # Старые строки из DEFAULT сначала попадают в свои месячные секции
+        ensure(conn, 0)
+    cur = conn.cursor()
+    for table in TABLES:
+        for name, month in partitions(cur, table):
+            if _next_month(month) > cutoff:
+                continue
+            if dry_run:
+                print(f'{name}: будет архивирована')
+                continue
+
+            cur.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+            cur.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            conn.commit()
+
+            cur.execute(f'SELECT COUNT(*) FROM "{name}"')
+            rows = cur.fetchone()[0]
+            path = out_dir / f'{name}.csv.gz'
+            sha256 = _export(cur, name, path)
+            exported = _count_exported(path)
+            conn.commit()
+            if exported != rows:
+                print(f'{name}: выгружено {exported} строк из {rows}, секция оставлена отсоединённой', file=sys.stderr)
+                continue
+
+            manifest = {
+                'table': table,
+                'partition': name,
+                'from': month.isoformat(),
+                'to': _next_month(month).isoformat(),
+                'rows': rows,
+                'file': path.name,
+                'sha256': sha256,
+                'archivedAt': datetime.now(timezone.utc).isoformat()
+            }
+            (out_dir / f'{name}.json').write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+
+            if not keep_detached:
+                cur.execute(f'DROP TABLE "{name}"')
+                conn.commit()
+            print(f'{name}: {rows} строк -> {path}')
+    cur.close()
+
+
+def _load_index(function: str):
+    """Импортирует backend/<function>/index.py со своими общими модулями."""
+    path = BACKEND / function
+    local = {p.stem for p in path.glob('*.py')} - {'index'}
+    saved = {name: sys.modules.pop(name) for name in local if name in sys.modules}
+    sys.path.insert(0, str(path))
+    try:
+        spec = importlib.util.spec_from_file_location(f'partitions_{function}', path / 'index.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        encode_cursor = sys.modules['pagination'].encode_cursor
+    finally:
+        sys.path.remove(str(path))
+        for name in local:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+    return module, encode_cursor
+
+
+def _check_queries(cur) -> list:
+    """Запросы в том виде, в каком их строят обработчики, на реальных курсорах."""
+    posts, encode_cursor = _load_index('posts')
+    messages, _ = _load_index('messages')
+
+    cur.execute('SELECT created_at, id FROM posts WHERE is_moderated = true ORDER BY created_at DESC, id DESC OFFSET 49 LIMIT 1')
+    post_row = cur.fetchone()
+    cur.execute(
+        """SELECT to_user_id, from_user_id, created_at, id FROM messages
+           WHERE to_user_id IS NOT NULL ORDER BY created_at DESC, id DESC LIMIT 1"""
+    )
+    message_row = cur.fetchone()
+
+    queries = [('posts: лента', posts.feed_sql('p.created_at, p.id', 50))]
+    if post_row:
+        queries.append(('posts: лента, вторая страница', posts.feed_sql('p.created_at, p.id', 50, before=encode_cursor(*post_row))))
+    queries.append(('messages: общий канал', messages.messages_sql(messages.KEY_COLUMNS)))
+    if message_row:
+        user_id, peer_id, created_at, message_id = message_row
+        cursor = encode_cursor(created_at, message_id)
+        queries += [
+            ('posts: домашняя лента', posts._home_sql(user_id, 20)),
+            ('messages: лента пользователя', messages.messages_sql(messages.KEY_COLUMNS, str(user_id))),
+            ('messages: лента, опрос новых', messages.messages_sql(messages.KEY_COLUMNS, str(user_id), after=cursor)),
+            ('messages: диалог', messages._thread_sql(messages.KEY_COLUMNS, str(user_id), str(peer_id))),
+            ('messages: диалог, старше курсора', messages._thread_sql(messages.KEY_COLUMNS, str(user_id), str(peer_id), before=cursor)),
+        ]
+    return queries
+
+
+def _scanned(plan: dict, names: set) -> tuple:
+    """Секции в плане: (упомянутые, выполненные хотя бы раз)."""
+    planned, executed = set(), set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        relation = node.get('Relation Name')
+        if relation in names:
+            planned.add(relation)
+            if node.get('Actual Loops', 0) > 0:
+                executed.add(relation)
+        stack.extend(node.get('Plans', []))
+    return planned, executed
+
+
+def _has_node(plan: dict, node_type: str) -> bool:
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if node.get('Node Type') == node_type:
+            return True
+        stack.extend(node.get('Plans', []))
+    return False
+
+
+def check(conn, max_partitions: int) -> bool:
+    """
+    Секции читаются по убыванию месяца (упорядоченный Append), и LIMIT
+    останавливает чтение, как только страница набрана: до старых секций
+    исполнение не доходит. Пустые будущие секции в счёт не идут.
+    """
+    cur = conn.cursor()
+    names, nonempty = set(), set()
+    for table in TABLES:
+        # DEFAULT-секция без отсечения превращает упорядоченный Append в
+        # Merge Append, который читает по строке из каждой секции
+        default = default_partition(cur, table)
+        for name in [name for name, _ in partitions(cur, table)] + ([default] if default else []):
+            names.add(name)
+            cur.execute(f'SELECT EXISTS (SELECT 1 FROM "{name}")')
+            if cur.fetchone()[0]:
+                nonempty.add(name)
+
+    ok = True
+    for title, (query, params) in _check_queries(cur):
+        cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + query, params)
+        plan = cur.fetchone()[0][0]['Plan']
+        planned, executed = _scanned(plan, names)
+        read = executed & nonempty
+        status = 'ok' if len(read) <= max_partitions else 'FAIL'
+        ok = ok and status == 'ok'
+        merge = ' [Merge Append]' if _has_node(plan, 'Merge Append') else ''
+        print(f'{status:4} {title}{merge}: в плане {len(planned)}, выполнено {len(executed)}, '
+              f'непустых прочитано {len(read)} из {len(nonempty)} ({", ".join(sorted(read)) or "-"})')
+    conn.rollback()
+    cur.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ensure_parser = commands.add_parser('ensure', help='создать будущие секции')
+    ensure_parser.add_argument('--months-ahead', type=int, default=3)
+
+    archive_parser = commands.add_parser('archive', help='отсоединить, выгрузить и удалить старые секции')
+    archive_parser.add_argument('--older-than', type=int, required=True, help='полных месяцев хранения')
+    archive_parser.add_argument('--out', type=Path, required=True, help='каталог для .csv.gz и манифестов')
+    archive_parser.add_argument('--keep-detached', action='store_true', help='не удалять отсоединённые секции')
+    archive_parser.add_argument('--dry-run', action='store_true')
+
+    check_parser = commands.add_parser('check', help='проверить отсечение секций запросами лент')
+    check_parser.add_argument('--max-partitions', type=int, default=2, help='допустимо непустых секций на запрос')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        if args.command == 'ensure':
+            ensure(conn, args.months_ahead)
+        elif args.command == 'archive':
+            archive(conn, args.older_than, args.out, args.keep_detached, args.dry_run)
+        elif not check(conn, args.max_partitions):
+            sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
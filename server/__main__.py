@@ -0,0 +1,54 @@
+"""
+Локальный многопоточный сервер всех функций на wsgiref (без зависимостей):
+
+    DATABASE_URL=postgresql://... python -m server --port 8000 --preload
+
+Функции доступны по /auth, /posts, /messages, /groups, /notifications,
+/dashboard. Для нагрузки — gunicorn с server.wsgi:application.
+"""
+import argparse
+import os
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from .dispatcher import dispatcher
+from .wsgi import application
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    # Запросы и так пишет timing.instrumented
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default=os.environ.get('SERVER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SERVER_PORT', '8000')))
+    parser.add_argument('--preload', action='store_true', help='импортировать все функции до первого запроса')
+    args = parser.parse_args()
+
+    if args.preload:
+        started = time.perf_counter()
+        dispatcher.preload()
+        print(f'{len(dispatcher.routes)} функций загружено за {(time.perf_counter() - started) * 1000:.0f} мс, '
+              f'общих модулей: {len(dispatcher.modules())}')
+
+    server = make_server(args.host, args.port, application,
+                         server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    print(f"http://{args.host}:{args.port}/ — {', '.join(dispatcher.routes)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
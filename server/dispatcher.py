@@ -0,0 +1,98 @@
+"""
+Единая точка входа для всех функций backend/: маршрут — первый сегмент пути
+(/posts, /messages, ...), handler функции импортируется при первом запросе
+к маршруту. Каждая функция по-прежнему деплоится своей папкой; здесь они
+собираются в один процесс.
+
+Общие модули (db.py, responses.py, ...) у функций — одинаковые копии.
+Копия с тем же именем и тем же содержимым загружается один раз, поэтому
+все маршруты процесса делят один пул соединений, один LISTEN-слушатель
+и один кэш профилей. Отличающиеся файлы загружаются отдельно.
+"""
+import hashlib
+import importlib.util
+import sys
+import threading
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / 'backend'
+
+
+def _digest(path: Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+class Dispatcher:
+    def __init__(self, backend: Path = BACKEND):
+        self.backend = backend
+        self.routes = sorted(p.parent.name for p in backend.glob('*/index.py'))
+        self._handlers = {}
+        # (имя модуля, sha1 файла) -> загруженный модуль
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    def _load(self, route: str):
+        """
+        Импортирует backend/<route>/index.py. На время импорта в sys.modules
+        подставляются уже загруженные копии общих модулей с тем же содержимым,
+        недостающие импортируются из папки функции и запоминаются.
+        """
+        path = self.backend / route
+        local = {p.stem: _digest(p) for p in path.glob('*.py') if p.stem != 'index'}
+        saved = {name: sys.modules.pop(name) for name in local if name in sys.modules}
+        for name, digest in local.items():
+            module = self._shared.get((name, digest))
+            if module is not None:
+                sys.modules[name] = module
+        sys.path.insert(0, str(path))
+        try:
+            spec = importlib.util.spec_from_file_location(f'backend_{route}', path / 'index.py')
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            for name, digest in local.items():
+                if name in sys.modules:
+                    self._shared.setdefault((name, digest), sys.modules[name])
+        finally:
+            sys.path.remove(str(path))
+            for name in local:
+                sys.modules.pop(name, None)
+            sys.modules.update(saved)
+        return module.handler
+
+    def handler_for(self, route: str):
+        handler = self._handlers.get(route)
+        if handler is None:
+            with self._lock:
+                handler = self._handlers.get(route)
+                if handler is None:
+                    handler = self._handlers[route] = self._load(route)
+        return handler
+
+    def preload(self):
+        for route in self.routes:
+            self.handler_for(route)
+
+    def modules(self) -> list:
+        """Загруженные общие модули: [(имя, sha1)] — для проверки, что копии совпали."""
+        return sorted(self._shared)
+
+    def dispatch(self, event: dict, context) -> dict:
+        """Вызов в формате функции: маршрут из event['path'], остаток пути передаётся дальше."""
+        path = (event.get('path') or '/').lstrip('/')
+        route, _, rest = path.partition('/')
+        if route not in self.routes:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': '{"error":"Функция не найдена"}',
+                'isBase64Encoded': False
+            }
+        return self.handler_for(route)({**event, 'path': '/' + rest}, context)
+
+
+dispatcher = Dispatcher()
+
+
+def handler(event: dict, context) -> dict:
+    """Все функции за одной точкой входа (деплой одной функцией)."""
+    return dispatcher.dispatch(event, context)
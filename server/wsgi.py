@@ -0,0 +1,88 @@
+"""
+WSGI-приложение поверх dispatcher: один долгоживущий процесс обслуживает
+все функции, пулы соединений, LISTEN-слушатель и кэши остаются тёплыми
+между запросами. Обработчики синхронные, поэтому WSGI, а не ASGI:
+
+    gunicorn -w 4 --threads 8 server.wsgi:application
+
+Пулы создаются лениво при первом запросе, поэтому --preload (импорт всех
+функций в мастере до fork) безопасен: воркеры получают готовые модули,
+но открывают свои соединения. Для разработки — python -m server.
+"""
+import base64
+import os
+import uuid
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+
+from .dispatcher import dispatcher
+
+# Всё, что пришло не в заголовках HTTP_*, но нужно функциям как заголовок
+_CONTENT_HEADERS = {'CONTENT_TYPE': 'Content-Type', 'CONTENT_LENGTH': 'Content-Length'}
+
+
+class Context:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.function_name = 'server'
+
+
+def to_event(environ: dict) -> dict:
+    """Запрос WSGI в event того же вида, что передаёт платформа функций."""
+    headers = {
+        key[5:].replace('_', '-').title(): value
+        for key, value in environ.items()
+        if key.startswith('HTTP_')
+    }
+    for key, name in _CONTENT_HEADERS.items():
+        if environ.get(key):
+            headers[name] = environ[key]
+
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    raw = environ['wsgi.input'].read(length) if length else b''
+    try:
+        body, encoded = raw.decode('utf-8'), False
+    except UnicodeDecodeError:
+        body, encoded = base64.b64encode(raw).decode('ascii'), True
+
+    query = dict(parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True))
+    return {
+        'httpMethod': environ.get('REQUEST_METHOD', 'GET'),
+        'path': environ.get('PATH_INFO') or '/',
+        'headers': headers,
+        'queryStringParameters': query or None,
+        'body': body,
+        'isBase64Encoded': encoded
+    }
+
+
+def from_response(response: dict) -> tuple:
+    """Ответ функции в (строка статуса, заголовки, тело в байтах)."""
+    status = int(response.get('statusCode', 200))
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+    headers = [(name, str(value)) for name, value in (response.get('headers') or {}).items()]
+    headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+    headers.append(('Content-Length', str(len(body))))
+    return f'{status} {reason}'.rstrip(), headers, body
+
+
+def application(environ: dict, start_response):
+    context = Context(environ.get('HTTP_X_REQUEST_ID') or uuid.uuid4().hex)
+    status, headers, body = from_response(dispatcher.dispatch(to_event(environ), context))
+    start_response(status, headers)
+    return [body]
+
+
+if os.environ.get('SERVER_PRELOAD') == '1':
+    dispatcher.preload()
@@ -1,18 +1,58 @@
+import func2url from '../../backend/func2url.json';
+
+// Адреса функций берутся из backend/func2url.json (его заполняет деплой,
+// вручную не правится); константы — запасной вариант для функций, которых
+// там ещё нет. Без адреса и без константы — пустая строка: функция не задеплоена.
+// VITE_API_URL — единый сервер (python -m server): функции по /<имя>
+const SERVER_URL = import.meta.env.VITE_API_URL?.replace(/\/$/, '');
+const urls: Record<string, string | undefined> = func2url;
+const functionUrl = (name: string, fallback = ''): string =>
+  SERVER_URL ? `${SERVER_URL}/${name}` : urls[name] || fallback;
+
 const API_BASE = {
-  auth: 'https://functions.poehali.dev/f62b9cac-b374-44fb-acfd-daf9c71b2387',
-  posts: 'https://functions.poehali.dev/ee9815f3-6c10-4e4e-aa6a-0cd89ba04dc3',
-  messages: 'https://functions.poehali.dev/6c51a9da-ef19-46b2-a11f-b910c6915503',
-  groups: 'https://functions.poehali.dev/2170d848-6253-4c95-9f4c-93f06a85eb84'
+  auth: functionUrl('auth', 'https://functions.poehali.dev/f62b9cac-b374-44fb-acfd-daf9c71b2387'),
+  posts: functionUrl('posts', 'https://functions.poehali.dev/ee9815f3-6c10-4e4e-aa6a-0cd89ba04dc3'),
+  messages: functionUrl('messages', 'https://functions.poehali.dev/6c51a9da-ef19-46b2-a11f-b910c6915503'),
+  groups: functionUrl('groups', 'https://functions.poehali.dev/2170d848-6253-4c95-9f4c-93f06a85eb84'),
+  dashboard: functionUrl('dashboard'),
+  notifications: functionUrl('notifications')
+};
+
+// Токен X-Session-LSN последней записи: чтения с ним не попадут на реплику,
+// которая ещё не догнала эту запись. Через SESSION_LSN_TTL_MS реплики
+// заведомо догоняют, и токен больше не отправляется
+const SESSION_LSN_TTL_MS = 30000;
+let session: { lsn: string; at: number } | null = null;
+
+const remember = (response: Response) => {
+  const lsn = response.headers.get('X-Session-LSN');
+  if (lsn) session = { lsn, at: Date.now() };
+  return response;
+};
+
+const read = (url: string) => {
+  if (session && Date.now() - session.at > SESSION_LSN_TTL_MS) session = null;
+  return fetch(url, session ? { headers: { 'X-Session-LSN': session.lsn } } : undefined);
 };
 
 export const api = {
+  dashboard: {
+    // null, если функция dashboard ещё не задеплоена: тогда экран
+    // загружается отдельными запросами
+    bootstrap: async (userId: number) => {
+      if (!API_BASE.dashboard) return null;
+      const response = await read(`${API_BASE.dashboard}?userId=${userId}`);
+      if (!response.ok) return null;
+      return response.json();
+    }
+  },
   auth: {
     register: async (data: { phone: string; fullName: string; position: string; password: string }) => {
-      const response = await fetch(API_BASE.auth, {
+      const response = remember(await fetch(API_BASE.auth, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ action: 'register', ...data })
-      });
+      }));
       return response.json();
     },
     login: async (data: { phone: string; password: string }) => {
@@ -24,55 +64,154 @@ export const api = {
       return response.json();
     },
     updateProfile: async (data: { userId: number; fullName?: string; position?: string; email?: string; birthDate?: string; bio?: string }) => {
-      const response = await fetch(API_BASE.auth, {
+      const response = remember(await fetch(API_BASE.auth, {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(data)
-      });
+      }));
       return response.json();
     }
   },
   posts: {
-    getAll: async () => {
-      const response = await fetch(API_BASE.posts);
+    getAll: async (params?: { before?: string; after?: string; limit?: number }) => {
+      const query = new URLSearchParams();
+      if (params?.before) query.set('before', params.before);
+      if (params?.after) query.set('after', params.after);
+      if (params?.limit) query.set('limit', String(params.limit));
+      const url = query.toString() ? `${API_BASE.posts}?${query}` : API_BASE.posts;
+      const response = await read(url);
+      return response.json();
+    },
+    poll: async (after: string | null) => {
+      const query = new URLSearchParams({ action: 'poll' });
+      if (after) query.set('after', after);
+      const response = await fetch(`${API_BASE.posts}?${query}`);
+      return response.json();
+    },
+    home: async (userId: number, before?: string) => {
+      const query = new URLSearchParams({ view: 'home', userId: String(userId) });
+      if (before) query.set('before', before);
+      const response = await read(`${API_BASE.posts}?${query}`);
+      return response.json();
+    },
+    search: async (q: string, cursor?: string) => {
+      const query = new URLSearchParams({ action: 'search', q });
+      if (cursor) query.set('cursor', cursor);
+      const response = await read(`${API_BASE.posts}?${query}`);
       return response.json();
     },
     create: async (data: { userId: number; content: string }) => {
-      const response = await fetch(API_BASE.posts, {
+      const response = remember(await fetch(API_BASE.posts, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(data)
-      });
+      }));
       return response.json();
     }
   },
   messages: {
     getAll: async (userId?: number) => {
       const url = userId ? `${API_BASE.messages}?userId=${userId}` : API_BASE.messages;
-      const response = await fetch(url);
+      const response = await read(url);
+      return response.json();
+    },
+    conversations: async (userId: number) => {
+      const response = await read(`${API_BASE.messages}?userId=${userId}&view=conversations`);
+      return response.json();
+    },
+    thread: async (userId: number, peerId: number, before?: string) => {
+      const query = new URLSearchParams({ userId: String(userId), peerId: String(peerId) });
+      if (before) query.set('before', before);
+      const response = await read(`${API_BASE.messages}?${query}`);
+      return response.json();
+    },
+    markRead: async (userId: number, peerId: number) => {
+      const response = remember(await fetch(API_BASE.messages, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action: 'read', userId, peerId })
+      }));
+      return response.json();
+    },
+    poll: async (userId: number, after: string | null) => {
+      const query = new URLSearchParams({ action: 'poll', userId: String(userId) });
+      if (after) query.set('after', after);
+      const response = await fetch(`${API_BASE.messages}?${query}`);
+      return response.json();
+    },
+    search: async (userId: number, q: string, cursor?: string) => {
+      const query = new URLSearchParams({ action: 'search', userId: String(userId), q });
+      if (cursor) query.set('cursor', cursor);
+      const response = await read(`${API_BASE.messages}?${query}`);
       return response.json();
     },
     send: async (data: { fromUserId: number; content: string; toUserId?: number }) => {
-      const response = await fetch(API_BASE.messages, {
+      const response = remember(await fetch(API_BASE.messages, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(data)
-      });
+      }));
+      return response.json();
+    }
+  },
+  notifications: {
+    // Пока функция notifications не задеплоена, список пуст
+    getAll: async (userId: number, before?: string) => {
+      if (!API_BASE.notifications) return { notifications: [], nextCursor: null, unreadCount: 0 };
+      const query = new URLSearchParams({ userId: String(userId) });
+      if (before) query.set('before', before);
+      const response = await read(`${API_BASE.notifications}?${query}`);
+      return response.json();
+    },
+    count: async (userId: number) => {
+      if (!API_BASE.notifications) return { unreadCount: 0 };
+      const response = await read(`${API_BASE.notifications}?userId=${userId}&view=count`);
+      return response.json();
+    },
+    markRead: async (userId: number, ids?: number[]) => {
+      if (!API_BASE.notifications) return { success: true, updated: 0 };
+      const response = remember(await fetch(API_BASE.notifications, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action: 'read', userId, ids })
+      }));
       return response.json();
     }
   },
   groups: {
     getAll: async (userId?: number) => {
       const url = userId ? `${API_BASE.groups}?userId=${userId}` : API_BASE.groups;
-      const response = await fetch(url);
+      const response = await read(url);
+      return response.json();
+    },
+    feed: async (groupId: number, userId: number, before?: string) => {
+      const query = new URLSearchParams({ groupId: String(groupId), userId: String(userId) });
+      if (before) query.set('before', before);
+      const response = await read(`${API_BASE.groups}?${query}`);
+      return response.json();
+    },
+    join: async (groupId: number, userId: number) => {
+      const response = remember(await fetch(API_BASE.groups, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action: 'join', groupId, userId })
+      }));
+      return response.json();
+    },
+    post: async (data: { groupId: number; userId: number; content: string }) => {
+      const response = remember(await fetch(API_BASE.groups, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action: 'post', ...data })
+      }));
       return response.json();
     },
     create: async (data: { userId: number; name: string; description?: string }) => {
-      const response = await fetch(API_BASE.groups, {
+      const response = remember(await fetch(API_BASE.groups, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(data)
-      });
+      }));
       return response.json();
     }
   }
@@ -54,6 +54,24 @@ interface Group {
   memberCount: number;
 }
 
+interface NotificationItem {
+  id: number;
+  fromUserId: number | null;
+  type: string;
+  content: string;
+  isRead: boolean;
+  timestamp: string;
+}
+
+const POLL_RETRY_DELAY = 5000;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const mergeNewest = <T extends { id: number }>(incoming: T[], current: T[]): T[] => {
+  const known = new Set(current.map((item) => item.id));
+  return [...incoming.filter((item) => !known.has(item.id)), ...current];
+};
+
 export default function Dashboard() {
   const navigate = useNavigate();
   const [currentUser, setCurrentUser] = useState<User | null>(null);
@@ -63,6 +81,8 @@ export default function Dashboard() {
   const [messages, setMessages] = useState<Message[]>([]);
   const [newMessage, setNewMessage] = useState('');
   const [groups, setGroups] = useState<Group[]>([]);
+  const [notifications, setNotifications] = useState<NotificationItem[]>([]);
+  const [unreadNotifications, setUnreadNotifications] = useState(0);
   const [newGroupName, setNewGroupName] = useState('');
   const [isMobileMenuOpen, setIsMobileMenuOpen] = useState(false);
   const [editProfile, setEditProfile] = useState({
@@ -88,30 +108,102 @@ export default function Dashboard() {
       position: user.position
     });
 
-    loadPosts();
-    loadMessages(user.id);
-    loadGroups(user.id);
+    let active = true;
+    const isActive = () => active;
+
+    bootstrap(user.id).then((cursors) => {
+      if (cursors) {
+        watchPosts(cursors.posts, isActive);
+        watchMessages(user.id, cursors.messages, isActive);
+        return;
+      }
+      loadPosts().then((cursor) => watchPosts(cursor, isActive));
+      loadMessages(user.id).then((cursor) => watchMessages(user.id, cursor, isActive));
+      loadGroups(user.id);
+      loadUnreadNotifications(user.id);
+    });
+
+    return () => {
+      active = false;
+    };
   }, [navigate]);
 
-  const loadPosts = async () => {
+  // Первый экран одним запросом; null — загрузить разделы по отдельности
+  const bootstrap = async (userId: number): Promise<{ posts: string | null; messages: string | null } | null> => {
+    try {
+      const response = await api.dashboard.bootstrap(userId);
+      if (!response?.user) return null;
+      setPosts(response.feed.posts);
+      setMessages(response.messages.messages);
+      setGroups(response.groups);
+      setUnreadNotifications(response.unread?.notifications ?? 0);
+      return {
+        posts: response.feed.prevCursor ?? null,
+        messages: response.messages.prevCursor ?? null
+      };
+    } catch (error) {
+      console.error('Ошибка загрузки первого экрана:', error);
+      return null;
+    }
+  };
+
+  const loadPosts = async (): Promise<string | null> => {
     try {
       const response = await api.posts.getAll();
       if (response.posts) {
         setPosts(response.posts);
       }
+      return response.prevCursor ?? null;
     } catch (error) {
       console.error('Ошибка загрузки постов:', error);
+      return null;
     }
   };
 
-  const loadMessages = async (userId: number) => {
+  const loadMessages = async (userId: number): Promise<string | null> => {
     try {
       const response = await api.messages.getAll(userId);
       if (response.messages) {
         setMessages(response.messages);
       }
+      return response.prevCursor ?? null;
     } catch (error) {
       console.error('Ошибка загрузки сообщений:', error);
+      return null;
+    }
+  };
+
+  const watchPosts = async (cursor: string | null, isActive: () => boolean) => {
+    while (isActive()) {
+      try {
+        const response = await api.posts.poll(cursor);
+        if (response.posts?.length && isActive()) {
+          setPosts((current) => mergeNewest(response.posts, current));
+        }
+        if (response.error) {
+          await sleep(POLL_RETRY_DELAY);
+        }
+        cursor = response.prevCursor ?? cursor;
+      } catch (error) {
+        await sleep(POLL_RETRY_DELAY);
+      }
+    }
+  };
+
+  const watchMessages = async (userId: number, cursor: string | null, isActive: () => boolean) => {
+    while (isActive()) {
+      try {
+        const response = await api.messages.poll(userId, cursor);
+        if (response.messages?.length && isActive()) {
+          setMessages((current) => mergeNewest(response.messages, current));
+        }
+        if (response.error) {
+          await sleep(POLL_RETRY_DELAY);
+        }
+        cursor = response.prevCursor ?? cursor;
+      } catch (error) {
+        await sleep(POLL_RETRY_DELAY);
+      }
     }
   };
 
@@ -126,6 +218,34 @@ export default function Dashboard() {
     }
   };
 
+  const loadUnreadNotifications = async (userId: number) => {
+    try {
+      const response = await api.notifications.count(userId);
+      setUnreadNotifications(response.unreadCount ?? 0);
+    } catch (error) {
+      console.error('Ошибка загрузки уведомлений:', error);
+    }
+  };
+
+  // Открытие панели: список уведомлений, затем отметка всех прочитанными
+  const openNotifications = async () => {
+    setActivePanel('notifications');
+    setIsMobileMenuOpen(false);
+    if (!currentUser) return;
+    try {
+      const response = await api.notifications.getAll(currentUser.id);
+      if (response.notifications) {
+        setNotifications(response.notifications);
+      }
+      if (response.unreadCount) {
+        await api.notifications.markRead(currentUser.id);
+        setUnreadNotifications(0);
+      }
+    } catch (error) {
+      console.error('Ошибка загрузки уведомлений:', error);
+    }
+  };
+
   const handleCreatePost = async () => {
     if (!newPost.trim() || !currentUser) return;
 
@@ -292,11 +412,14 @@ export default function Dashboard() {
           </button>
 
           <button
-            onClick={() => { setActivePanel('notifications'); setIsMobileMenuOpen(false); }}
+            onClick={openNotifications}
             className="w-full flex items-center gap-3 px-3 md:px-4 py-2.5 md:py-3 rounded-lg hover:bg-sidebar-accent transition-colors relative text-sm md:text-base"
           >
             <Icon name="Bell" size={20} />
             <span className="font-medium">Уведомления</span>
+            {unreadNotifications > 0 && (
+              <Badge className="ml-auto gradient-primary text-white border-0 text-xs">{unreadNotifications}</Badge>
+            )}
           </button>
         </nav>
 
@@ -580,10 +703,24 @@ export default function Dashboard() {
             <SheetTitle>Уведомления</SheetTitle>
           </SheetHeader>
           <div className="py-6">
-            <div className="text-center py-12">
-              <Icon name="Bell" size={40} className="mx-auto mb-4 text-muted-foreground" />
-              <p className="text-sm md:text-base text-muted-foreground">Нет новых уведомлений</p>
-            </div>
+            {notifications.length === 0 ? (
+              <div className="text-center py-12">
+                <Icon name="Bell" size={40} className="mx-auto mb-4 text-muted-foreground" />
+                <p className="text-sm md:text-base text-muted-foreground">Нет новых уведомлений</p>
+              </div>
+            ) : (
+              <div className="space-y-3">
+                {notifications.map((notification) => (
+                  <div
+                    key={notification.id}
+                    className={`p-3 rounded-lg border ${notification.isRead ? '' : 'bg-purple-50 border-purple-200'}`}
+                  >
+                    <p className="text-sm">{notification.content}</p>
+                    <p className="text-xs text-muted-foreground mt-1">{formatDate(notification.timestamp)}</p>
+                  </div>
+                ))}
+              </div>
+            )}
           </div>
         </SheetContent>
       </Sheet>